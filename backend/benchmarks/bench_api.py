@@ -0,0 +1,235 @@
+"""
+API benchmark - latency percentiles, throughput and memory per endpoint against synthetic data.
+
+Run from backend/:
+    python benchmarks/bench_api.py --accounts 20 --posts 200 --requests 200 --concurrency 10 --output bench.json
+    python benchmarks/bench_api.py --mongo-url mongodb://localhost:27017   # real mongod instead of mongomock
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Must be set before the app modules read them at import time
+os.environ["IMAGE_CACHE_DIR"] = tempfile.mkdtemp(prefix="instadash-bench-")
+os.environ.setdefault("META_PAGE_ID", "bench-page")
+os.environ.setdefault("META_ACCESS_TOKEN", "bench-token")
+# Measure the refresh itself, not the Meta call budget (set these to benchmark the throttled path)
+os.environ.setdefault("META_RATE_LIMIT", "100000")
+os.environ.setdefault("META_BURST", "100000")
+
+import httpx  # noqa: E402
+from benchmarks import datagen, fakes, mongo  # noqa: E402
+
+# --- Measurement ---
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), falling back to the peak"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+async def run_scenario(name: str, call: Callable[[int], Awaitable[int]], requests: int, concurrency: int,
+                       before: Optional[Callable[[int], Awaitable[None]]] = None) -> Dict[str, Any]:
+    """
+    Fire `requests` calls with `concurrency` workers. `call(i)` returns the status code;
+    `before(i)` runs untimed first (e.g. to invalidate a cache for cold-path scenarios).
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    counter = iter(range(requests))
+    rss_before = rss_mb()
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            if before:
+                await before(i)
+            start = time.perf_counter()
+            try:
+                status = await call(i)
+            except Exception as e:
+                errors += 1
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": statuses,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "rps": round(requests / wall, 2) if wall > 0 else 0.0,
+        "rss_mb": round(rss_mb(), 1),
+        "rss_delta_mb": round(rss_mb() - rss_before, 1),
+    }
+    print(f"  {name:<28} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+          f"p99 {result['p99_ms']:>9.2f} ms  {result['rps']:>9.1f} req/s  rss {result['rss_mb']:>7.1f} MB")
+    return result
+
+# --- Scenarios ---
+
+async def benchmark(args) -> Dict[str, Any]:
+    backend = await mongo.connect(args.mongo_url)
+    upstream = fakes.FakeUpstream(media_count=args.posts, latency=args.upstream_latency)
+
+    # Ingestion is refused without a configured token
+    os.environ.setdefault("INGEST_TOKEN", "bench")
+    import http_client
+    import instrumentation
+    import ingestion
+    import snapshot
+    import thumbnails
+    from main import app
+
+    http_client._client = httpx.AsyncClient(transport=upstream.transport(), event_hooks=instrumentation.HTTPX_EVENT_HOOKS)
+
+    print(f"Seeding {args.accounts} accounts x {args.posts} posts ({backend})...")
+    seed_start = time.perf_counter()
+    profiles = await datagen.seed(args.accounts, args.posts, args.seed)
+    await ingestion.sync_pending_competitors()
+    seed_seconds = time.perf_counter() - seed_start
+
+    ingest_headers = {"X-Ingest-Token": os.getenv("INGEST_TOKEN", "")}
+    ingest_body = "\n".join(json.dumps(p) for p in profiles[:1]).encode()
+    usernames = [p["username"] for p in profiles] or ["missing"]
+    results: Dict[str, Any] = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def get(path: str, headers: Optional[Dict[str, str]] = None) -> int:
+            response = await client.get(path, headers=headers)
+            return response.status_code
+
+        etag = {"value": ""}
+
+        async def invalidate(_):
+            await snapshot.invalidate()
+
+        async def current_etag():
+            etag["value"] = (await client.get("/api/insights/generate")).headers.get("etag", "")
+
+        # (name, call, untimed per-request hook, concurrency override, untimed setup)
+        scenarios = [
+            ("insights_generate_cold", lambda i: get("/api/insights/generate"), invalidate, 1, None),
+            ("insights_generate_warm", lambda i: get("/api/insights/generate"), None, None, current_etag),
+            ("insights_generate_304", lambda i: get("/api/insights/generate", {"If-None-Match": etag["value"]}), None, None, current_etag),
+            ("insights_list", lambda i: get("/api/insights/"), None, None, None),
+            ("competitors_list", lambda i: get("/api/competitors/?limit=50"), None, None, None),
+            ("competitor_detail", lambda i: get(f"/api/competitors/{usernames[i % len(usernames)]}"), None, None, None),
+            ("analytics", lambda i: get("/api/analytics/"), None, None, None),
+            ("insights_heatmap", lambda i: get("/api/insights/heatmap"), None, None, None),
+            ("hashtags_top", lambda i: get("/api/hashtags/top?limit=20"), None, None, None),
+            ("posts_search", lambda i: get(f"/api/posts/search?q={datagen.HASHTAGS[i % len(datagen.HASHTAGS)]}"), None, None, None),
+            ("export_posts_csv", lambda i: get("/api/export/posts?format=csv"), None, 2, None),
+            ("export_posts_parquet", lambda i: get("/api/export/posts?format=parquet"), None, 2, None),
+            ("proxy_image_miss", lambda i: get(f"/api/competitors/proxy-image?url={datagen.image_url('miss', i)}"), None, None, None),
+            ("proxy_image_hit", lambda i: get(f"/api/competitors/proxy-image?url={datagen.image_url('hit', 0)}"), None, None, None),
+            ("proxy_thumbnail", lambda i: get(f"/api/proxy/?url={datagen.image_url('thumb', i % 10)}&w=160&format=webp"), None, None, None),
+            ("ingest_apify", lambda i: _status(client.post("/api/ingest/apify", content=ingest_body, headers=ingest_headers)), None, None, None),
+        ]
+        for name, call, before, concurrency, setup in scenarios:
+            if args.only and name not in args.only:
+                continue
+            if setup:
+                await setup()
+            results[name] = await run_scenario(name, call, args.requests, concurrency or args.concurrency, before)
+
+    if not args.only or "meta_refresh" in args.only:
+        import refresher
+        results["meta_refresh"] = await run_scenario(
+            "meta_refresh",
+            lambda i: _ok(refresher.refresh_my_analytics(datagen.BENCH_PAGE_ID, "bench-token")),
+            max(1, args.requests // 20), 1
+        )
+
+    await http_client.close()
+    thumbnails.shutdown()
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": backend,
+            "accounts": args.accounts,
+            "posts": args.posts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "upstream_latency_ms": args.upstream_latency * 1000,
+            "seed_seconds": round(seed_seconds, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "upstream_calls": upstream.calls,
+        },
+        "results": results,
+    }
+
+async def _status(request: Awaitable[httpx.Response]) -> int:
+    return (await request).status_code
+
+async def _ok(work: Awaitable[Any]) -> int:
+    await work
+    return 200
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard API against synthetic data")
+    parser.add_argument("--accounts", type=int, default=20, help="competitor accounts to generate")
+    parser.add_argument("--posts", type=int, default=200, help="posts per account")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="seconds added to fake Meta/CDN responses")
+    parser.add_argument("--mongo-url", default=None, help="use a real mongod (a scratch database is dropped first)")
+    parser.add_argument("--only", nargs="*", help="scenario names to run")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.output}")
+
+if __name__ == "__main__":
+    main()
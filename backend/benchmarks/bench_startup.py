@@ -0,0 +1,203 @@
+"""
+Startup benchmark - import time of the app and time to first byte of a cold server.
+
+Run from backend/:
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --mongo-url mongodb://localhost:27017   # real mongod instead of mongomock
+    python benchmarks/bench_startup.py --max-import-ms 800 --max-ready-ms 5000  # exit 1 past these (for CI)
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+# Heavy dependencies worth tracking individually (0 = not imported at startup)
+TRACKED_MODULES = ("fastapi", "pydantic", "motor", "beanie", "pymongo", "httpx", "orjson", "pyarrow", "numpy", "PIL")
+POLL_INTERVAL = 0.01
+
+# --- Import time ---
+
+def import_profile() -> Dict[str, int]:
+    """Cumulative import time (us) of `main` and each top-level module, from one fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            name = match.group(4)
+            cumulative[name] = max(cumulative.get(name, 0), int(match.group(2)))
+    return cumulative
+
+def _package_time(profile: Dict[str, int], package: str) -> int:
+    """A package's cost is its slowest entry point (the package itself or the submodule imported first)"""
+    return max((us for name, us in profile.items() if name == package or name.startswith(package + ".")), default=0)
+
+def bench_imports(runs: int) -> Dict[str, Any]:
+    profiles = [import_profile() for _ in range(runs)]
+    totals = sorted(p.get("main", 0) / 1000 for p in profiles)
+    modules = {
+        name: round(statistics.median(_package_time(p, name) for p in profiles) / 1000, 1)
+        for name in TRACKED_MODULES
+    }
+    result = {
+        "runs": runs,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(totals[0], 1),
+        "max_ms": round(totals[-1], 1),
+        "modules_ms": modules,
+    }
+    print(f"  import main                  median {result['median_ms']:>8.1f} ms  min {result['min_ms']:>8.1f} ms")
+    for name, ms in modules.items():
+        print(f"    {name:<26} {ms:>8.1f} ms")
+    return result
+
+# --- Time to first byte ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _first_byte(client: httpx.Client, path: str) -> Optional[int]:
+    """Status of the first response byte for `path`, or None if the server isn't accepting yet"""
+    try:
+        with client.stream("GET", path) as response:
+            return response.status_code
+    except httpx.TransportError:
+        return None
+
+def bench_cold_start(args) -> Dict[str, Any]:
+    """
+    Launch benchmarks/serve.py and time, from the moment it starts importing the app:
+    first /health byte (serving), first dashboard byte (a user arriving right away) and /ready 200 (warmed up).
+    """
+    serve = [sys.executable, os.path.join("benchmarks", "serve.py"),
+             "--accounts", str(args.accounts), "--posts", str(args.posts)]
+    if args.mongo_url:
+        serve += ["--mongo-url", args.mongo_url]
+        subprocess.run(serve + ["--seed-only"], cwd=BACKEND_DIR, check=True)
+
+    port = _free_port()
+    spawned = time.time()
+    process = subprocess.Popen(serve + ["--port", str(port)], cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True)
+    try:
+        line = process.stdout.readline()
+        if not line.startswith("SERVING "):
+            raise RuntimeError(f"serve.py didn't start: {line!r}")
+        started = float(line.split()[1])
+
+        timings: Dict[str, float] = {}
+        deadline = time.time() + args.timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+            while "health_ms" not in timings:
+                if time.time() > deadline or process.poll() is not None:
+                    raise RuntimeError("server never answered /health")
+                if _first_byte(client, "/health") == 200:
+                    timings["health_ms"] = (time.time() - started) * 1000
+                else:
+                    time.sleep(POLL_INTERVAL)
+
+            status = _first_byte(client, "/api/insights/generate")
+            timings["first_dashboard_ms"] = (time.time() - started) * 1000
+
+            while "ready_ms" not in timings:
+                if time.time() > deadline:
+                    raise RuntimeError("server never became ready")
+                if _first_byte(client, "/ready") == 200:
+                    timings["ready_ms"] = (time.time() - started) * 1000
+                else:
+                    time.sleep(POLL_INTERVAL)
+
+            request = time.time()
+            _first_byte(client, "/api/insights/generate")
+            timings["warm_dashboard_request_ms"] = (time.time() - request) * 1000
+            readiness = client.get("/ready").json()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    result = {key: round(value, 1) for key, value in timings.items()}
+    result["first_dashboard_status"] = status
+    if not args.mongo_url:
+        result["seed_ms"] = round((started - spawned) * 1000, 1)
+    result["warmup"] = readiness.get("warmup")
+    for key in ("health_ms", "first_dashboard_ms", "ready_ms", "warm_dashboard_request_ms"):
+        print(f"  {key:<28} {result[key]:>8.1f} ms")
+    return result
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import time and cold-start time to first byte")
+    parser.add_argument("--import-runs", type=int, default=5, help="fresh interpreters to time `import main` in")
+    parser.add_argument("--starts", type=int, default=3, help="cold server starts to time")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--mongo-url", default=None, help="use a real mongod (a scratch database is dropped first)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a server to become ready")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="fail if the median import is slower")
+    parser.add_argument("--max-ready-ms", type=float, default=None, help="fail if the median /ready time is slower")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    args = parser.parse_args()
+
+    print("Import time:")
+    imports = bench_imports(args.import_runs)
+    starts: List[Dict[str, Any]] = []
+    for i in range(args.starts):
+        print(f"Cold start {i + 1}/{args.starts}:")
+        starts.append(bench_cold_start(args))
+    median = {
+        key: round(statistics.median(s[key] for s in starts), 1)
+        for key in ("health_ms", "first_dashboard_ms", "ready_ms", "warm_dashboard_request_ms")
+    } if starts else {}
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": "mongod" if args.mongo_url else "mongomock-motor",
+            "accounts": args.accounts,
+            "posts": args.posts,
+        },
+        "imports": imports,
+        "cold_start": {"median": median, "runs": starts},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.output}")
+
+    failures = []
+    if args.max_import_ms is not None and imports["median_ms"] > args.max_import_ms:
+        failures.append(f"import main {imports['median_ms']} ms > {args.max_import_ms} ms")
+    if args.max_ready_ms is not None and median.get("ready_ms", 0) > args.max_ready_ms:
+        failures.append(f"/ready {median['ready_ms']} ms > {args.max_ready_ms} ms")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compare two bench_api.py JSON reports; exits 1 if any endpoint's p95 regressed past the threshold.
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.25]
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "rps")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative p95 slowdown")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'scenario':<28}" + "".join(f"{m:>22}" for m in METRICS))
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            print(f"{name:<28}  (new)")
+            continue
+        cells = []
+        for metric in METRICS:
+            old, new = before.get(metric, 0), now.get(metric, 0)
+            change = (new - old) / old if old else 0.0
+            cells.append(f"{old:>9.2f} -> {new:>9.2f}")
+            if metric == "p95_ms" and change > args.threshold:
+                regressions.append((name, old, new, change))
+        print(f"{name:<28}" + "".join(f"{c:>22}" for c in cells))
+
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: p95 {old:.2f} ms -> {new:.2f} ms (+{change:.0%})")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
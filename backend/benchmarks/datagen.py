@@ -0,0 +1,107 @@
+"""
+Synthetic data generator - UserAnalytics/Competitor documents at configurable scale (accounts x posts)
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from models import Competitor, Post, UserAnalytics
+
+CDN_HOST = "https://scontent.cdninstagram.com"
+TYPES = ["Image", "Video", "Sidecar"]
+HASHTAGS = ["marketing", "growth", "sale", "launch", "behindthescenes", "tips", "reels", "brand"]
+BENCH_PAGE_ID = "bench-page"
+
+def image_url(owner: str, index: int) -> str:
+    return f"{CDN_HOST}/v/bench/{owner}/{index}.jpg"
+
+def apify_post(rng: random.Random, owner: str, index: int, now: datetime) -> Dict[str, Any]:
+    """One raw post in the shape the Apify Instagram scraper emits"""
+    likes = int(rng.lognormvariate(6, 1.2))
+    tags = rng.sample(HASHTAGS, rng.randint(0, 3))
+    return {
+        "id": f"{owner}-{index}",
+        "shortCode": f"B{index:06d}",
+        "ownerUsername": owner,
+        "caption": f"Post {index} " + " ".join(f"#{t}" for t in tags),
+        "hashtags": tags,
+        "likesCount": likes,
+        "commentsCount": int(likes * rng.uniform(0.01, 0.08)),
+        "videoViewCount": likes * rng.randint(10, 40) if index % 3 == 1 else 0,
+        "timestamp": (now - timedelta(hours=index * rng.uniform(6, 30))).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "type": TYPES[index % len(TYPES)],
+        "displayUrl": image_url(owner, index),
+        "url": f"https://www.instagram.com/p/B{index:06d}/",
+    }
+
+def apify_profile(rng: random.Random, index: int, posts: int, now: datetime) -> Dict[str, Any]:
+    username = f"competitor{index}"
+    return {
+        "username": username,
+        "fullName": f"Competitor {index}",
+        "followersCount": rng.randint(5_000, 2_000_000),
+        "followsCount": rng.randint(50, 2_000),
+        "postsCount": posts + rng.randint(0, 500),
+        "profilePicUrl": image_url(username, -1),
+        "biography": "Synthetic benchmark account",
+        "verified": index % 5 == 0,
+        "latestPosts": [apify_post(rng, username, i, now) for i in range(posts)],
+    }
+
+def competitor_from_profile(profile: Dict[str, Any], scraped_at: datetime) -> Competitor:
+    """The document n8n writes for one scraped profile"""
+    return Competitor(
+        username=profile["username"],
+        full_name=profile["fullName"],
+        followers_count=profile["followersCount"],
+        following_count=profile["followsCount"],
+        posts_count=profile["postsCount"],
+        profile_pic_url=profile["profilePicUrl"],
+        biography=profile["biography"],
+        is_verified=profile["verified"],
+        recent_posts=profile["latestPosts"],
+        scraped_at=scraped_at,
+    )
+
+def my_analytics(rng: random.Random, posts: int, now: datetime) -> UserAnalytics:
+    recent = [
+        Post(
+            id=f"me-{i}",
+            caption=f"My post {i}",
+            content_type=["IMAGE", "VIDEO", "CAROUSEL_ALBUM"][i % 3],
+            likes=int(rng.lognormvariate(5, 1)),
+            comments=rng.randint(0, 40),
+            shares=rng.randint(0, 20),
+            views=rng.randint(0, 20_000),
+            timestamp=now - timedelta(hours=i * 20),
+            url=f"https://www.instagram.com/p/me{i}/",
+            media_url=image_url("me", i),
+        )
+        for i in range(posts)
+    ]
+    return UserAnalytics(
+        page_id=BENCH_PAGE_ID,
+        username="bench_me",
+        followers_count=25_000,
+        following_count=300,
+        posts_count=posts,
+        engagement_rate=3.1,
+        avg_likes=sum(p.likes for p in recent) // max(posts, 1),
+        recent_posts=recent,
+        last_updated=datetime.now(),
+    )
+
+def generate(accounts: int, posts: int, seed: int = 7) -> Tuple[UserAnalytics, List[Competitor], List[Dict[str, Any]]]:
+    """(your analytics, competitor documents, raw Apify profiles) - deterministic for a given seed"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    profiles = [apify_profile(rng, i, posts, now) for i in range(accounts)]
+    competitors = [competitor_from_profile(p, now) for p in profiles]
+    return my_analytics(rng, posts, now), competitors, profiles
+
+async def seed(accounts: int, posts: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Insert a generated dataset into the initialised Beanie database; returns the raw profiles"""
+    me, competitors, profiles = generate(accounts, posts, seed)
+    await me.insert()
+    if competitors:
+        await Competitor.insert_many(competitors)
+    return profiles
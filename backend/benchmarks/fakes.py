@@ -0,0 +1,103 @@
+"""
+Fake upstreams - Meta Graph API and Instagram CDN served from an httpx.MockTransport
+"""
+import asyncio
+import hashlib
+import io
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+import httpx
+from PIL import Image
+
+GRAPH_HOST = "graph.facebook.com"
+
+def _jpeg(size: int) -> bytes:
+    image = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+class FakeUpstream:
+    """
+    Routes Graph API calls (profile, paged media, per-media insights) and CDN image
+    downloads. `latency` (seconds) is added to every response to mimic the network.
+    """
+
+    def __init__(self, media_count: int = 200, image_size: int = 1080, latency: float = 0.0):
+        self.media_count = media_count
+        self.latency = latency
+        self.image = _jpeg(image_size)
+        self.image_etag = f'"{hashlib.sha1(self.image).hexdigest()}"'
+        self.calls: Dict[str, int] = {}
+        self.now = datetime.utcnow()
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.url.host == GRAPH_HOST:
+            return self._graph(request)
+        return self._cdn(request)
+
+    def _count(self, kind: str):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def _graph(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.rstrip("/").split("/")[2:]  # drop "" and the version
+        params = {k: v[0] for k, v in parse_qs(urlparse(str(request.url)).query).items()}
+        if len(path) == 2 and path[1] == "media":
+            self._count("media")
+            return httpx.Response(200, json=self._media_page(request, path[0], params))
+        if len(path) == 2 and path[1] == "insights":
+            self._count("insights")
+            return httpx.Response(200, json={"data": [
+                {"name": name, "values": [{"value": value}]}
+                for name, value in (("reach", 1200), ("saved", 30), ("shares", 12), ("plays", 5000))
+            ]})
+        self._count("profile")
+        return httpx.Response(200, json={
+            "id": path[0] if path else "",
+            "name": "Bench Account",
+            "username": "bench_me",
+            "followers_count": 25_000,
+            "follows_count": 300,
+            "media_count": self.media_count,
+            "profile_picture_url": "https://scontent.cdninstagram.com/v/bench/me/-1.jpg",
+        })
+
+    def _media_page(self, request: httpx.Request, page_id: str, params: Dict[str, str]) -> Dict:
+        limit = int(params.get("limit", 25))
+        offset = int(params.get("after", 0))
+        end = min(offset + limit, self.media_count)
+        data = [
+            {
+                "id": f"{page_id}-media-{i}",
+                "caption": f"Post {i}",
+                "media_type": "VIDEO" if i % 3 == 1 else "IMAGE",
+                "media_product_type": "REELS" if i % 3 == 1 else "FEED",
+                "timestamp": (self.now - timedelta(hours=i * 20)).strftime("%Y-%m-%dT%H:%M:%S+0000"),
+                "like_count": 100 + (i * 37) % 900,
+                "comments_count": (i * 7) % 60,
+                "permalink": f"https://www.instagram.com/p/m{i}/",
+                "media_url": f"https://scontent.cdninstagram.com/v/bench/me/{i}.jpg",
+            }
+            for i in range(offset, end)
+        ]
+        page = {"data": data}
+        if end < self.media_count:
+            next_params = {**params, "after": str(end)}
+            page["paging"] = {"next": str(request.url.copy_with(params=next_params))}
+        return page
+
+    def _cdn(self, request: httpx.Request) -> httpx.Response:
+        self._count("cdn")
+        if request.headers.get("if-none-match") == self.image_etag:
+            return httpx.Response(304, headers={"ETag": self.image_etag})
+        return httpx.Response(200, content=self.image, headers={
+            "Content-Type": "image/jpeg",
+            "Cache-Control": "max-age=86400",
+            "ETag": self.image_etag,
+        })
@@ -0,0 +1,89 @@
+"""
+Benchmark database - in-memory mongomock-motor by default, or a real (local) mongod via --mongo-url
+"""
+from typing import Optional
+from beanie import init_beanie
+import database
+from models import AccountStats
+
+BENCH_DB = "social_dashboard_bench"
+
+def _patch_mongomock():
+    """
+    mongomock lags the driver API in a few places the app relies on; bridge them for benchmark runs only.
+    Time-series collections aren't supported either, so account_stats becomes a plain collection.
+    """
+    import mongomock
+    import mongomock.aggregate
+    import mongomock.collection
+    import mongomock.database
+    from mongomock.filtering import BsonComparable
+
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    if getattr(add_update, "_bench_patched", False):
+        return
+
+    def _add_update(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+    _add_update._bench_patched = True
+    mongomock.collection.BulkOperationBuilder.add_update = _add_update
+
+    list_collection_names = mongomock.database.Database.list_collection_names
+    mongomock.database.Database.list_collection_names = (
+        lambda self, filter=None, session=None, **kwargs: list_collection_names(self, filter=filter, session=session)
+    )
+    AccountStats.Settings.timeseries = None
+    # mongomock reports 5.0; with $topN bridged below it covers what init_db's version check guards
+    mongomock.SERVER_VERSION = "%d.%d.0" % database.MIN_SERVER_VERSION
+
+    # $topN group accumulator (MongoDB 5.2+)
+    accumulate_group = mongomock.aggregate._accumulate_group
+
+    def _accumulate_group(output_fields, group_list):
+        top_n = {field: value["$topN"] for field, value in output_fields.items() if field != "_id" and "$topN" in value}
+        out = accumulate_group({f: v for f, v in output_fields.items() if f not in top_n}, group_list)
+        for field, spec in top_n.items():
+            docs = list(group_list)
+            for key, direction in reversed(list(spec["sortBy"].items())):
+                docs.sort(key=lambda doc: BsonComparable(doc.get(key)), reverse=direction < 0)
+            out[field] = [_project(spec["output"], doc) for doc in docs[:spec["n"]]]
+        return out
+
+    def _project(output, doc):
+        projected = {}
+        for name, expression in output.items():
+            try:
+                projected[name] = mongomock.aggregate._parse_expression(expression, doc)
+            except KeyError:  # Missing fields are left out, as on the server
+                pass
+        return projected
+    mongomock.aggregate._accumulate_group = _accumulate_group
+
+    # A missing field in a $expr filter (ingestion.PENDING on scrapes n8n wrote) is "missing" on the server,
+    # not an error; mongomock also checks filters against {} when a collection is empty
+    parse_basic_expression = mongomock.aggregate._Parser._parse_basic_expression
+
+    def _parse_basic_expression(self, expression):
+        try:
+            return parse_basic_expression(self, expression)
+        except KeyError:
+            if self._ignore_missing_keys:
+                return None
+            raise
+    mongomock.aggregate._Parser._parse_basic_expression = _parse_basic_expression
+
+async def connect(mongo_url: Optional[str] = None) -> str:
+    """Initialise Beanie on a fresh benchmark database; returns a label for the report"""
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_url)
+        await client.drop_database(BENCH_DB)
+        label = "mongod"
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        _patch_mongomock()
+        client = AsyncMongoMockClient()
+        label = "mongomock-motor"
+    database.client = client
+    await init_beanie(database=client[BENCH_DB], document_models=database.DOCUMENT_MODELS)
+    return label
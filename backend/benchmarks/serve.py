@@ -0,0 +1,61 @@
+"""
+Benchmark server - the real app (lifespan, warm-up, middleware) under uvicorn on synthetic data.
+Started by bench_startup.py; prints "SERVING <epoch seconds>" right before the app is imported.
+
+    python benchmarks/serve.py --port 8765                                          # mongomock, seeded in-process
+    python benchmarks/serve.py --mongo-url mongodb://localhost:27017 --seed-only    # seed a real mongod ...
+    python benchmarks/serve.py --mongo-url mongodb://localhost:27017 --port 8765    # ... then serve it cold
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ["IMAGE_CACHE_DIR"] = tempfile.mkdtemp(prefix="instadash-bench-")
+# No Meta credentials: the refresher stays idle instead of calling the real Graph API
+os.environ["META_PAGE_ID"] = ""
+os.environ["META_ACCESS_TOKEN"] = ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app on synthetic data for startup benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongo-url", default=None, help="real mongod (seed it first with --seed-only)")
+    parser.add_argument("--seed-only", action="store_true", help="seed the --mongo-url database and exit")
+    args = parser.parse_args()
+
+    import database
+    from benchmarks.mongo import BENCH_DB
+    database.DATABASE_NAME = BENCH_DB
+    if args.mongo_url:
+        os.environ["MONGODB_URL"] = args.mongo_url
+        if args.seed_only:
+            asyncio.run(_seed(args))
+            return
+    else:
+        # mongomock lives in this process, so seed it here and hand the same client to init_db()
+        asyncio.run(_seed(args))
+        seeded = database.client
+        database.AsyncIOMotorClient = lambda *a, **kw: seeded
+
+    print(f"SERVING {time.time():.6f}", flush=True)
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+async def _seed(args):
+    from benchmarks import datagen, mongo
+    import ingestion
+    await mongo.connect(args.mongo_url)
+    await datagen.seed(args.accounts, args.posts, args.seed)
+    await ingestion.sync_pending_competitors()
+
+if __name__ == "__main__":
+    main()
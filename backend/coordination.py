@@ -0,0 +1,255 @@
+"""
+Coordination - lets several uvicorn/gunicorn workers share refreshes, rebuilds and caches
+instead of each one calling Meta and rewriting the same documents
+
+Leases are `leases` documents (one per key, taken with an atomic conditional upsert and renewed while
+held); elect() runs a job on the worker that gets the lease while the others wait for its stored result.
+Broadcasts are `broadcasts` documents every worker polls, used for LocalCache invalidations and live
+events. The local backend keeps all of it in-process; it is the default unless WEB_CONCURRENCY > 1
+(set COORDINATION_BACKEND=mongo for several single-worker instances sharing a database).
+"""
+import asyncio
+import itertools
+import os
+import socket
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+from pymongo.errors import DuplicateKeyError
+from models import Broadcast, Lease
+
+BACKEND = os.getenv("COORDINATION_BACKEND") or ("mongo" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "local")  # mongo, local
+# A lease held by a worker that stopped renewing it (crashed, hung) is free again after this many seconds
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+# Longest a worker waits for another one's result
+ELECTION_TIMEOUT = float(os.getenv("ELECTION_TIMEOUT", "120"))
+LEASE_POLL = 0.25
+# Seconds between polls for other workers' broadcasts (how stale a LocalCache entry can get)
+BROADCAST_INTERVAL = float(os.getenv("BROADCAST_INTERVAL", "1"))
+# Broadcasts are re-read this far back, to tolerate clock skew between hosts and slow inserts
+BROADCAST_OVERLAP = 5.0
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+_claim_ids = itertools.count(1)
+_local_leases: Dict[str, Tuple[str, float]] = {}  # key -> (holder, monotonic expiry), local backend
+_handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+# Keep references to fire-and-forget inserts so they aren't garbage-collected mid-run
+_background_tasks = set()
+
+class LeaseTimeout(Exception):
+    """Waited ELECTION_TIMEOUT for another worker to finish a job"""
+
+def _now() -> datetime:
+    """Naive UTC, as Mongo returns dates"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# --- Leases ---
+
+async def _acquire(key: str, holder: str, ttl: float) -> bool:
+    """Take or renew `key` for `holder` unless someone else holds an unexpired lease"""
+    if BACKEND == "local":
+        current = _local_leases.get(key)
+        if current and current[0] != holder and current[1] > time.monotonic():
+            return False
+        _local_leases[key] = (holder, time.monotonic() + ttl)
+        return True
+    now = _now()
+    try:
+        # Held by someone else: the filter misses, so the upsert inserts a duplicate _id and fails
+        await Lease.get_motor_collection().update_one(
+            {"_id": key, "$or": [{"holder": holder}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"holder": holder, "worker": WORKER_ID, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def _release(key: str, holder: str):
+    if BACKEND == "local":
+        if _local_leases.get(key, ("",))[0] == holder:
+            del _local_leases[key]
+        return
+    await Lease.get_motor_collection().delete_one({"_id": key, "holder": holder})
+
+async def _taken(key: str) -> bool:
+    if BACKEND == "local":
+        current = _local_leases.get(key)
+        return current is not None and current[1] > time.monotonic()
+    return await Lease.get_motor_collection().count_documents({"_id": key, "expires_at": {"$gt": _now()}}) > 0
+
+class Claim:
+    """One attempt at a lease; `held` is whether this worker has it (and still does, while renewals succeed)"""
+
+    def __init__(self, key: str, ttl: float):
+        self.key = key
+        self.ttl = ttl
+        # Per attempt, so a lease also excludes other tasks in the same worker and is never re-entered
+        self.holder = f"{WORKER_ID}:{next(_claim_ids)}"
+        self.held = False
+
+    async def renew_forever(self):
+        while self.held:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                self.held = await _acquire(self.key, self.holder, self.ttl)
+            except Exception as e:
+                print(f"Lease renewal failed for '{self.key}': {e}")
+        print(f"Lease '{self.key}' lost")
+
+@asynccontextmanager
+async def lease(key: str, ttl: float = LEASE_TTL):
+    """
+    Try (once) to take `key`; yields a Claim. A held lease is renewed in the background
+    and released on exit, so it only expires if this worker stops.
+    """
+    claim = Claim(key, ttl)
+    claim.held = await _acquire(key, claim.holder, ttl)
+    renewal = asyncio.create_task(claim.renew_forever()) if claim.held else None
+    try:
+        yield claim
+    finally:
+        if renewal:
+            renewal.cancel()
+            claim.held = False
+            try:
+                await _release(key, claim.holder)
+            except Exception as e:
+                print(f"Lease release failed for '{key}' (expires in {ttl:.0f}s): {e}")
+
+async def elect(key: str, work: Callable[[], Awaitable[Any]],
+                shared: Optional[Callable[[], Awaitable[Any]]] = None,
+                ttl: float = LEASE_TTL, timeout: float = ELECTION_TIMEOUT) -> Any:
+    """
+    Run `work()` on one worker at a time. Whoever gets the lease runs it; the others wait for
+    the lease to be released and return `shared()` - what the winner stored. If that is None
+    (or there's no `shared`, making this a plain lock) they contend again.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        async with lease(key, ttl) as claim:
+            if claim.held:
+                return await work()
+        while await _taken(key):
+            if time.monotonic() > deadline:
+                raise LeaseTimeout(f"Timed out waiting for another worker's '{key}'")
+            await asyncio.sleep(LEASE_POLL)
+        if shared is not None:
+            result = await shared()
+            if result is not None:
+                return result
+
+async def run_as_leader(key: str, job: Callable[[Claim], Awaitable[bool]]):
+    """
+    Long-running role (scheduler, watcher) that only one worker plays: the others stand by and take
+    over within LEASE_TTL if it stops. `job(claim)` runs while the lease is held and should return
+    when `claim.held` turns False; returning False means the role can't run here, so stop trying.
+    """
+    while True:
+        async with lease(key) as claim:
+            if claim.held:
+                print(f"{WORKER_ID} is the '{key}' leader")
+                if await job(claim) is False:
+                    return
+        await asyncio.sleep(LEASE_TTL)
+
+# --- Broadcasts ---
+
+def subscribe(channel: str, handler: Callable[[Dict[str, Any]], None]):
+    """Call `handler(payload)` for every broadcast other workers send on `channel`"""
+    _handlers.setdefault(channel, []).append(handler)
+
+def broadcast(channel: str, payload: Dict[str, Any]):
+    """Send to the other workers (the caller applies it locally itself); fire-and-forget"""
+    if BACKEND == "local":
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(_insert(channel, payload))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _insert(channel: str, payload: Dict[str, Any]):
+    try:
+        await Broadcast.get_motor_collection().insert_one(
+            {"channel": channel, "payload": payload, "origin": WORKER_ID, "at": _now()}
+        )
+    except Exception as e:
+        print(f"Broadcast on '{channel}' failed: {e}")
+
+def _dispatch(doc: Dict[str, Any]):
+    for handler in _handlers.get(doc.get("channel"), []):
+        try:
+            handler(doc.get("payload") or {})
+        except Exception as e:
+            print(f"Broadcast handler for '{doc.get('channel')}' failed: {e}")
+
+async def run_listener():
+    """Long-running task started from the app lifespan: delivers other workers' broadcasts"""
+    if BACKEND == "local":
+        return
+    collection = Broadcast.get_motor_collection()
+    since = _now()
+    seen: Dict[Any, datetime] = {}  # Broadcasts inside the overlap window that were already delivered
+    while True:
+        await asyncio.sleep(BROADCAST_INTERVAL)
+        polled_at = _now()
+        try:
+            query = {"at": {"$gte": since - timedelta(seconds=BROADCAST_OVERLAP)}, "origin": {"$ne": WORKER_ID}}
+            async for doc in collection.find(query).sort("at", 1):
+                if doc["_id"] not in seen:
+                    seen[doc["_id"]] = doc["at"]
+                    _dispatch(doc)
+            since = polled_at
+            horizon = since - timedelta(seconds=2 * BROADCAST_OVERLAP)
+            seen = {key: at for key, at in seen.items() if at >= horizon}
+        except Exception as e:
+            print(f"Broadcast poll failed: {e}")
+
+# --- Worker-local cache ---
+
+class LocalCache:
+    """
+    Worker-local LRU in front of Mongo reads. invalidate() drops a key here and on every other
+    worker (via broadcast); `ttl` bounds staleness for writes no worker saw.
+    """
+
+    def __init__(self, name: str, size: int = 256, ttl: float = 60.0):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        subscribe(f"cache:{name}", lambda payload: self._drop(payload.get("key")))
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _drop(self, key: Optional[str]):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one key (or, None, everything) on all workers"""
+        self._drop(key)
+        broadcast(f"cache:{self.name}", {"key": key})
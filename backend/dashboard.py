@@ -0,0 +1,540 @@
+"""
+Dashboard Builder - V5 DASHBOARD payload assembled from per-account contributions
+
+Each account (you + every competitor) contributes a small, self-contained state dict
+(stats, best/top posts, per-day history, growth). The payload is assembled from those,
+so a change to one account only recomputes that account's contribution.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from beanie import PydanticObjectId
+from beanie.operators import In, Set
+from models import DEFAULT_TENANT, Insight, InsightGeneration, Competitor, CompetitorSummary, CompetitorPost, MyPost, Post, UserAnalytics, StatsRollup
+from datetime import datetime
+from uuid import uuid4
+import asyncio
+import hashlib
+import json
+import estimation
+import events
+import ingestion
+import stats
+import tenants
+
+INSIGHTS_KEY = "insights"
+TOP_POSTS = 5
+# CompetitorPost fields a top post needs for post_view
+TOP_POST_FIELDS = ("owner", "post_id", "timestamp", "caption", "likes", "comments", "shares", "views", "url", "post_url", "type", "estimated")
+COLORS = ["#10b981", "#f59e0b", "#06b6d4"]
+
+# Keep references to fire-and-forget cleanup tasks so they aren't garbage-collected mid-run
+_background_tasks = set()
+
+# --- Insight generations ---
+
+async def active_generation_id(tenant_id: str = DEFAULT_TENANT) -> Optional[str]:
+    pointer = await InsightGeneration.find_one(InsightGeneration.key == tenants.scoped_key(tenant_id, INSIGHTS_KEY))
+    return pointer.generation_id if pointer else None
+
+async def _collect_old_generations(tenant_id: str, active_id: str):
+    """Delete the tenant's insight batches older than its active generation"""
+    try:
+        await Insight.find(Insight.tenant_id == tenant_id, Insight.generation_id < active_id).delete()
+    except Exception as e:
+        print(f"Insight GC failed: {e}")
+
+async def publish_insights(insights: List[Dict[str, Any]], tenant_id: str = DEFAULT_TENANT) -> List[Insight]:
+    """
+    Write a new insight batch in one insert_many, flip the active-generation pointer
+    to it, then garbage-collect older batches in the background.
+    Unchanged insights keep the active batch (same ids), so identical inputs give identical payloads.
+    """
+    key = tenants.scoped_key(tenant_id, INSIGHTS_KEY)
+    fingerprint = hashlib.sha256(json.dumps(insights, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    pointer = await InsightGeneration.find_one(InsightGeneration.key == key)
+    if pointer and pointer.fingerprint == fingerprint:
+        active = await Insight.find(
+            Insight.tenant_id == tenant_id, Insight.generation_id == pointer.generation_id
+        ).sort(+Insight.id).to_list()
+        if len(active) == len(insights):
+            return active
+
+    # Time-ordered ids so GC can safely drop everything older than the active batch
+    now = datetime.now()
+    generation_id = f"{now.strftime('%Y%m%d%H%M%S%f')}-{uuid4().hex[:8]}"
+    created_at = now.replace(microsecond=now.microsecond // 1000 * 1000)  # As stored (BSON dates are in ms)
+    created_insights = [
+        Insight(
+            id=PydanticObjectId(),
+            insight_type=i["type"],
+            title=i["title"],
+            description=i["description"],
+            priority=i["priority"],
+            category=i.get("category", "General"),
+            tenant_id=tenant_id,
+            generation_id=generation_id,
+            created_at=created_at
+        )
+        for i in insights
+    ]
+    if created_insights:
+        await Insight.insert_many(created_insights)
+
+    await InsightGeneration.find_one(InsightGeneration.key == key).upsert(
+        Set({
+            InsightGeneration.generation_id: generation_id,
+            InsightGeneration.fingerprint: fingerprint,
+            InsightGeneration.activated_at: created_at
+        }),
+        on_insert=InsightGeneration(
+            key=key, tenant_id=tenant_id, generation_id=generation_id, fingerprint=fingerprint, activated_at=created_at
+        )
+    )
+
+    events.publish("insights", {"generation_id": generation_id, "count": len(created_insights)}, tenant_id=tenant_id)
+
+    task = asyncio.create_task(_collect_old_generations(tenant_id, generation_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return created_insights
+
+# --- Server-side aggregations (only the small result sets come back over the wire) ---
+
+def _day(field: str) -> Dict[str, Any]:
+    # The payload keys history by "YYYY-MM-DD" (UTC); $dateToString groups on that key directly, where
+    # $dateTrunc would group on a date that then has to be formatted in Python
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": field}}
+
+async def _competitor_post_facets(owners: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Per-owner totals, top posts and per-day max likes in one $facet pass"""
+    rows = await CompetitorPost.find(In(CompetitorPost.owner, owners)).aggregate([
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": "$owner",
+                    "likes": {"$sum": "$likes"},
+                    "count": {"$sum": 1},
+                    # Keeps only TOP_POSTS per owner while grouping (MongoDB 5.2+), with just the fields post_view reads
+                    "top": {"$topN": {
+                        "n": TOP_POSTS,
+                        "sortBy": {"likes": -1, "post_id": 1},
+                        "output": {field: f"${field}" for field in TOP_POST_FIELDS}
+                    }}
+                }}
+            ],
+            "history": [
+                {"$match": {"timestamp": {"$type": "date"}}},
+                {"$group": {"_id": {"owner": "$owner", "day": _day("$timestamp")}, "likes": {"$max": "$likes"}}}
+            ]
+        }}
+    ], allowDiskUse=True).to_list()
+    facets = rows[0] if rows else {"totals": [], "history": []}
+
+    per_owner = {owner: {"likes": 0, "count": 0, "top": [], "history": []} for owner in owners}
+    for row in facets["totals"]:
+        per_owner[row["_id"]].update(likes=row["likes"], count=row["count"], top=row["top"])
+    for row in facets["history"]:
+        per_owner[row["_id"]["owner"]]["history"].append([row["_id"]["day"], row["likes"]])
+    return per_owner
+
+async def _my_post_facets(me: Optional[UserAnalytics]) -> Dict[str, List[Dict[str, Any]]]:
+    """Totals, top posts, per-day max likes and content type counts over my stored posts (my_posts)"""
+    if not me:
+        return {"totals": [], "top": [], "history": [], "types": []}
+    rows = await MyPost.find(MyPost.tenant_id == me.tenant_id, MyPost.page_id == me.page_id).aggregate([
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "likes": {"$sum": "$likes"}, "count": {"$sum": 1}}}
+            ],
+            "top": [
+                {"$sort": {"likes": -1, "post_id": 1}},
+                {"$limit": TOP_POSTS},
+                {"$project": {"_id": 0, "tenant_id": 0, "page_id": 0}}
+            ],
+            "history": [
+                {"$match": {"timestamp": {"$type": "date"}}},
+                {"$group": {"_id": _day("$timestamp"), "likes": {"$max": "$likes"}}}
+            ],
+            "types": [
+                {"$group": {"_id": {"$ifNull": ["$content_type", "Image"]}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}}
+            ]
+        }}
+    ]).to_list()
+    return rows[0] if rows else {"totals": [], "top": [], "history": [], "types": []}
+
+# --- Per-account contributions ---
+
+def get_stat(obj, attr, default=0):
+    val = getattr(obj, attr, default)
+    return val if val is not None else default
+
+def _growth(rollups: List[StatsRollup], account: Optional[str]) -> Dict[str, Any]:
+    """Growth rate and daily follower series for one account"""
+    mine = [r for r in rollups if r.account == account]
+    return {
+        "growth": stats.growth_rates(mine).get(account) if mine else None,
+        "follower_series": [[r.start.strftime("%Y-%m-%d"), r.followers_close] for r in mine]
+    }
+
+def post_view(p: CompetitorPost, owner_name):
+    """Dashboard dict for a normalized competitor post"""
+    metrics, estimated = estimation.displayed(p)
+    return {
+        "id": p.post_id,
+        "caption": p.caption,
+        "likes": p.likes,
+        "comments": p.comments,
+        "shares": metrics["shares"],
+        "views": metrics["views"],
+        "estimated": estimated,
+        "url": p.url,
+        "post_url": p.post_url,
+        "owner": owner_name,
+        "timestamp": p.timestamp,
+        "type": p.type
+    }
+
+def parse_my_post(p, owner_name="You"):
+    """Parse post data from Pydantic model (user) format with robust fallbacks"""
+    likes = get_stat(p, 'likes', 0)
+
+    # Comments - try multiple attributes
+    comments = get_stat(p, 'comments', 0)
+    if comments == 0:
+        comments = get_stat(p, 'commentsCount', 0)
+
+    # Views / shares - try multiple attributes; the refresher stores estimates for missing ones
+    views = get_stat(p, 'views', 0)
+    if views == 0:
+        views = get_stat(p, 'videoViewCount', 0)
+    if views == 0:
+        views = get_stat(p, 'viewCount', 0)
+    content_type = get_stat(p, 'content_type', 'Image')
+    estimated = bool(get_stat(p, 'estimated', []))
+    if views == 0 and likes > 0 and estimation.is_video(content_type):
+        views, estimated = estimation.fallback('views', likes), True
+
+    shares = get_stat(p, 'shares', 0)
+    if shares == 0:
+        shares = get_stat(p, 'shareCount', 0)
+    if shares == 0 and likes > 0:
+        shares, estimated = estimation.fallback('shares', likes), True
+
+    # URL
+    url = get_stat(p, 'url', '')
+    if not url:
+        url = get_stat(p, 'displayUrl', '')
+
+    caption = get_stat(p, 'caption', '')
+    timestamp = get_stat(p, 'timestamp', None)
+    return {
+        "id": get_stat(p, 'id', '') or ingestion.stable_post_id(owner_name, {"timestamp": timestamp, "caption": caption, "url": url}),
+        "caption": caption,
+        "likes": likes,
+        "comments": comments,
+        "shares": shares,
+        "views": views,
+        "estimated": estimated,
+        "url": url,
+        "post_url": get_stat(p, 'permalink', url),
+        "owner": owner_name,
+        "timestamp": timestamp,
+        "type": content_type
+    }
+
+async def my_contribution(me: Optional[UserAnalytics], rollups: List[StatsRollup]) -> Dict[str, Any]:
+    """Your stats, posts chart, best/top posts and history"""
+    my_stats = {
+        "username": getattr(me, 'username', 'You'),
+        "followers": get_stat(me, 'followers_count'),
+        "engagement": get_stat(me, 'engagement_rate'),
+        "posts": get_stat(me, 'posts_count'),
+        "avg_likes": get_stat(me, 'avg_likes', 0),
+        "posts_per_week": get_stat(me, 'posts_per_week', 3),
+        "recent_posts": getattr(me, 'recent_posts', []),
+        "profile_pic": getattr(me, 'profile_pic_url', '')
+    }
+
+    my_posts_for_chart = []
+    if me and me.recent_posts:
+        # Newest posts only (UserAnalytics keeps a fixed window), one bar each
+        for idx, p in enumerate(me.recent_posts):
+            # Use robust parser
+            post_data = parse_my_post(p)
+            my_posts_for_chart.append({
+                "name": f"Post {idx+1}",
+                "likes": post_data['likes'],
+                "comments": post_data['comments'],
+                "type": post_data['type']
+            })
+
+    facets = await _my_post_facets(me)
+    top_posts = [parse_my_post(Post.model_validate({**p, "id": p["post_id"]})) for p in facets["top"]]
+    totals = facets["totals"][0] if facets["totals"] else {"likes": 0, "count": 0}
+    return {
+        "page_id": getattr(me, 'page_id', None),
+        "stats": my_stats,
+        "best_post": top_posts[0] if top_posts else None,
+        "top_posts": top_posts,
+        "total_likes": totals["likes"],
+        "post_count": totals["count"],
+        "posts_chart": my_posts_for_chart,
+        "history": [[row["_id"], row["likes"]] for row in facets["history"]],
+        "content_types": [{"type": row["_id"], "count": row["count"]} for row in facets["types"]],
+        **_growth(rollups, getattr(me, 'page_id', None))
+    }
+
+def competitor_contribution(c: CompetitorSummary, posts: Dict[str, Any], rollups: List[StatsRollup]) -> Dict[str, Any]:
+    """One competitor's stats, best/top posts and history"""
+    username = getattr(c, 'username', 'Competitor')
+    posts_count = get_stat(c, 'posts_count', 0)
+    top = [post_view(CompetitorPost.model_validate(p), f"@{username}") for p in posts["top"]]
+
+    estimated_total = get_stat(c, 'avg_likes', 0) * posts_count
+    return {
+        "id": str(c.id),
+        "username": username,
+        "followers": get_stat(c, 'followers_count'),
+        "engagement": get_stat(c, 'engagement_rate'),
+        "posts_per_week": get_stat(c, 'posts_per_week', 5),
+        "posts_count": posts_count,
+        "profile_pic": getattr(c, 'profile_pic_url', ''),
+        "total_likes": max(posts["likes"], estimated_total),
+        "post_count": posts["count"],
+        "best_post": top[0] if top else None,
+        "top_posts": top,
+        "history": posts["history"],
+        **_growth(rollups, username)
+    }
+
+async def competitor_contributions(competitors: List[CompetitorSummary], rollups: List[StatsRollup]) -> List[Dict[str, Any]]:
+    posts = await _competitor_post_facets([c.username for c in competitors])
+    return [competitor_contribution(c, posts[c.username], rollups) for c in competitors]
+
+# --- Assembly ---
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0
+
+async def assemble_dashboard(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the payload (and publish its insights) from per-account contributions"""
+    me = state["me"]
+    comps = state["competitors"]
+    my_stats = me["stats"]
+    insights = []
+
+    if not comps:
+        return {"message": "No competitors found", "insights": []}
+
+    graph_keys = {c["username"]: f"c{i+1}" for i, c in enumerate(comps)}
+    comp_usernames = [c["username"] for c in comps]
+
+    deep_dive = [{
+        "username": my_stats['username'],
+        "is_me": True,
+        "profile_pic": my_stats['profile_pic'],
+        "followers": my_stats['followers'],
+        "engagement": my_stats['engagement'],
+        "total_posts": my_stats['posts'],
+        "best_post": me["best_post"]
+    }]
+    for c in comps:
+        best = {**c["best_post"], "graph_key": graph_keys[c["username"]]} if c["best_post"] else None
+        deep_dive.append({
+            "username": f"@{c['username']}",
+            "is_me": False,
+            "profile_pic": c["profile_pic"],
+            "followers": c["followers"],
+            "engagement": c["engagement"],
+            "total_posts": c["posts_count"],
+            "best_post": best
+        })
+
+    avg_engagement = _mean([c['engagement'] for c in comps])
+    avg_posts_week = _mean([c['posts_per_week'] for c in comps])
+    avg_followers = _mean([c['followers'] for c in comps])
+    avg_total_posts = _mean([c['posts_count'] for c in comps])
+
+    # --- Growth Insights (follower change over the daily rollups) ---
+    my_growth_rate = round(me["growth"] or 0.0, 2)
+    comp_growth = [c["growth"] for c in comps if c["growth"] is not None]
+    market_growth_rate = round(sum(comp_growth) / len(comp_growth), 2) if comp_growth else 0.0
+    velocity_multiplier = my_growth_rate / market_growth_rate if market_growth_rate > 0 else 1.0
+
+    insights.append({
+        "type": "opportunity" if velocity_multiplier > 1 else "risk",
+        "title": "🚀 Growth Velocity",
+        "description": f"You are growing {velocity_multiplier:.1f}x faster than the market average.",
+        "priority": "high",
+        "category": "Growth"
+    })
+
+    if my_stats['engagement'] > avg_engagement:
+         insights.append({
+            "type": "opportunity",
+            "title": "💎 Quality Audience",
+            "description": f"Your engagement ({my_stats['engagement']:.2f}%) beats market avg ({avg_engagement:.2f}%).",
+            "priority": "high",
+            "category": "Growth"
+        })
+
+    # --- Competitor Watch: merge each account's own top posts ---
+    candidates = [{**p, "graph_key": "you"} for p in me["top_posts"]]
+    for c in comps:
+        candidates += [{**p, "graph_key": graph_keys[c["username"]]} for p in c["top_posts"]]
+    top_posts = sorted(candidates, key=lambda x: x['likes'], reverse=True)[:TOP_POSTS]
+
+    competitor_watch = {
+         "my_best": deep_dive[0]['best_post'] if len(deep_dive) > 0 else {},
+         "their_best": deep_dive[1]['best_post'] if len(deep_dive) > 1 else {}
+    }
+
+    # --- Real History (for Market Trajectory): per-day max likes per account ---
+    history_rows = [(d_key, 'you', likes) for d_key, likes in me["history"]]
+    for c in comps:
+        history_rows += [(d_key, graph_keys[c["username"]], likes) for d_key, likes in c["history"]]
+
+    date_map = {}
+    for d_key, k, likes in history_rows:
+        if d_key not in date_map:
+            date_map[d_key] = {"date": d_key}
+
+        date_map[d_key][k] = max(date_map[d_key].get(k, 0), likes)
+
+        if k == 'c1' and len(comp_usernames) > 0: date_map[d_key]['c1_name'] = comp_usernames[0]
+        if k == 'c2' and len(comp_usernames) > 1: date_map[d_key]['c2_name'] = comp_usernames[1]
+
+    real_history = sorted(list(date_map.values()), key=lambda x: x['date'])
+
+    # Followers per day, straight from the pre-aggregated buckets
+    follower_map = {}
+    series = [('you', me["follower_series"])] + [(graph_keys[c["username"]], c["follower_series"]) for c in comps]
+    for k, points in series:
+        for d_key, followers in points:
+            follower_map.setdefault(d_key, {"date": d_key})[k] = followers
+    follower_history = [follower_map[d] for d in sorted(follower_map)]
+
+    # --- Engagement Share ---
+    total_market_likes = sum(c['total_likes'] for c in comps)
+    final_my_total = max(me["total_likes"], my_stats['avg_likes'] * my_stats['posts'])
+    grand_total_likes = total_market_likes + final_my_total
+
+    engagement_share = []
+    if grand_total_likes > 0:
+        engagement_share.append({
+            "name": "You",
+            "value": round((final_my_total / grand_total_likes) * 100, 1) if final_my_total > 0 else 0.1,
+            "color": "#8b5cf6"
+        })
+        for i, c in enumerate(comps):
+            share = round((c['total_likes'] / grand_total_likes) * 100, 1) if c['total_likes'] > 0 else 0
+            engagement_share.append({
+                "name": f"@{c['username']}",
+                "value": share,
+                "color": COLORS[i % 3]
+            })
+
+    # --- SECTION 4: 100% ACCURATE METRICS ---
+
+    # B. Content Type Distribution
+    content_distribution = me["content_types"] or [{"type": "N/A", "count": 0}]
+
+    # C. Follower Comparison
+    follower_comparison = [
+        {"name": "You", "followers": my_stats['followers'], "color": "#8b5cf6"}
+    ]
+    for i, c in enumerate(comps):
+        follower_comparison.append({
+            "name": f"@{c['username'][:10]}",
+            "followers": c['followers'],
+            "color": COLORS[i % 3]
+        })
+
+    # --- Executive Summary ---
+    my_best_post = me["best_post"]
+    executive_summary = [
+        f"Growth is {velocity_multiplier:.1f}x market speed.",
+        f"Latest Post: {my_best_post['caption'][:20]}... ({my_best_post['likes']} likes)" if my_best_post else "No recent posts.",
+        f"You have {me['post_count']} posts analyzed.",
+        f"Comparisons based on {me['post_count'] + sum(c['post_count'] for c in comps)} total posts."
+    ]
+
+    # Save to DB as a new generation; readers keep seeing the previous one until the flip
+    created_insights = await publish_insights(insights, state.get("tenant_id", DEFAULT_TENANT))
+
+    return {
+        "message": "Generated insights",
+        "insights": created_insights,
+        "comparative_data": {
+            "you": {**my_stats, "growth_rate": my_growth_rate},
+            "market_avg": {
+                "engagement": avg_engagement,
+                "posts_week": avg_posts_week,
+                "growth_rate": market_growth_rate,
+                "followers": avg_followers,
+                "total_posts": avg_total_posts
+            },
+            "velocity": velocity_multiplier,
+            "top_posts": top_posts,
+            "executive_summary": executive_summary,
+
+            "real_history": real_history,
+            "follower_history": follower_history,
+            "comp_names": comp_usernames,
+            "engagement_share": engagement_share,
+
+            "my_posts_chart": me["posts_chart"],
+            "content_distribution": content_distribution,
+            "follower_comparison": follower_comparison,
+
+            "competitor_watch": competitor_watch,
+            "deep_dive": deep_dive,
+        }
+    }
+
+# --- Full and incremental builds ---
+
+async def _load_me(tenant_id: str) -> Optional[UserAnalytics]:
+    return await UserAnalytics.find_one(UserAnalytics.tenant_id == tenant_id)
+
+async def build_dashboard(tenant_id: str = DEFAULT_TENANT) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Full build of one tenant: every account's contribution, then the payload. Returns (payload, state)"""
+    # Normalize the tenant's newly scraped posts into competitor_posts first
+    await ingestion.sync_pending_competitors(tenant_id)
+
+    me = await _load_me(tenant_id)
+    # Oldest first, the order incremental updates append in, so graph keys are the same on every build
+    competitors = await Competitor.find(Competitor.tenant_id == tenant_id).sort(+Competitor.id).project(CompetitorSummary).to_list()
+    accounts = [c.username for c in competitors] + ([me.page_id] if me else [])
+    rollups = await stats.daily_rollups(accounts=accounts)
+
+    state = {
+        "tenant_id": tenant_id,
+        "me": await my_contribution(me, rollups),
+        "competitors": await competitor_contributions(competitors, rollups) if competitors else []
+    }
+    return await assemble_dashboard(state), state
+
+async def update_my_contribution(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Incremental: recompute only your contribution"""
+    me = await _load_me(state.get("tenant_id", DEFAULT_TENANT))
+    rollups = await stats.daily_rollups(account=me.page_id) if me else []
+    return {**state, "me": await my_contribution(me, rollups)}
+
+async def update_competitor_contribution(state: Dict[str, Any], competitor_id: str) -> Dict[str, Any]:
+    """Incremental: recompute (or drop, if deleted) a single competitor's contribution"""
+    comps = [c for c in state["competitors"] if c["id"] != competitor_id]
+    competitor = await Competitor.find_one(
+        Competitor.id == PydanticObjectId(competitor_id),
+        Competitor.tenant_id == state.get("tenant_id", DEFAULT_TENANT)
+    )
+    if competitor:
+        if competitor.posts_synced_at != competitor.scraped_at:
+            await ingestion.sync_competitor_posts(competitor)
+        summary = CompetitorSummary.model_validate(competitor.model_dump(by_alias=True))
+        rollups = await stats.daily_rollups(account=competitor.username)
+        contribution = (await competitor_contributions([summary], rollups))[0]
+        # Keep the competitor's position so graph keys (c1, c2...) stay stable
+        positions = [i for i, c in enumerate(state["competitors"]) if c["id"] == competitor_id]
+        comps.insert(positions[0] if positions else len(comps), contribution)
+    return {**state, "competitors": comps}
@@ -1,27 +1,95 @@
 """
 MongoDB Atlas Database Connection
 """
+import asyncio
+import os
+from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-import os
+from beanie.odm.utils.pydantic import get_model_fields
+from beanie.odm.utils.typing import get_index_attributes
+from pymongo import IndexModel
 from dotenv import load_dotenv
-from models import UserAnalytics, Competitor, Insight
+import instrumentation
+from models import Tenant, UserAnalytics, MyPost, Competitor, CompetitorPost, ReportedSums, TermStat, EngagementHeatmap, Insight, InsightGeneration, DashboardSnapshot, SourceVersion, AccountStats, StatsRollup, ResumeToken, Lease, Broadcast
 
 load_dotenv()
 
 client = None
+# Unique index builds that failed in init_db(), by collection (see warmup.state["index_failures"])
+index_failures = {}
+
+DATABASE_NAME = os.getenv("MONGODB_DB", "social_dashboard")
+# Seconds /ready waits for a ping before reporting the database unreachable
+PING_TIMEOUT = float(os.getenv("MONGODB_PING_TIMEOUT", "2"))
+# Oldest server the aggregation pipelines run on ($topN in the dashboard facets)
+MIN_SERVER_VERSION = (5, 2)
+
+DOCUMENT_MODELS = [Tenant, UserAnalytics, MyPost, Competitor, CompetitorPost, ReportedSums, TermStat, EngagementHeatmap, Insight, InsightGeneration, DashboardSnapshot, SourceVersion, AccountStats, StatsRollup, ResumeToken, Lease, Broadcast]
 
 async def init_db():
-    global client
+    global client, index_failures
     mongo_url = os.getenv("MONGODB_URL")
     print(f"Connecting to MongoDB Atlas...")
     
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[instrumentation.mongo_listener])
+    server = await client.server_info()
+    if tuple(server.get("versionArray", ())[:2]) < MIN_SERVER_VERSION:
+        raise RuntimeError(
+            f"MongoDB {server.get('version')} is too old, "
+            f"the backend needs {'.'.join(map(str, MIN_SERVER_VERSION))} or newer"
+        )
+    # Index builds are round trips per model; only the unique ones run before serving, since idempotent
+    # upserts rely on them, and ensure_indexes(unique=False) builds the rest after startup
     await init_beanie(
-        database=client.social_dashboard,
-        document_models=[UserAnalytics, Competitor, Insight]
+        database=client[DATABASE_NAME],
+        document_models=DOCUMENT_MODELS,
+        skip_indexes=True
     )
+    index_failures = await ensure_indexes(unique=True)
     print("✅ Connected to MongoDB Atlas")
 
+def _declared_indexes(model):
+    """Indexes declared with Indexed() fields and Settings.indexes, as Beanie would create them"""
+    indexes = []
+    for name, field in get_model_fields(model).items():
+        attributes = get_index_attributes(field)
+        if attributes:
+            index_type, options = attributes
+            indexes.append(IndexModel([(field.alias or name, index_type)], **options))
+    indexes.extend(index.index for index in model.get_settings().indexes)
+    return indexes
+
+async def ensure_indexes(unique: Optional[bool] = None):
+    """
+    Create any missing indexes for every model (existing ones are left alone), or only the unique
+    (unique=True) or non-unique (unique=False) ones; returns the failures
+    """
+    async def ensure(model):
+        indexes = [
+            index for index in _declared_indexes(model)
+            if unique is None or bool(index.document.get("unique")) == unique
+        ]
+        if indexes:
+            await model.get_motor_collection().create_indexes(indexes)
+
+    results = await asyncio.gather(*(ensure(m) for m in DOCUMENT_MODELS), return_exceptions=True)
+    failures = {}
+    for model, result in zip(DOCUMENT_MODELS, results):
+        if isinstance(result, Exception):
+            print(f"Index build failed for {model.Settings.name}: {result}")
+            failures[model.Settings.name] = str(result)
+    return failures
+
+async def ping() -> bool:
+    """True if the database answers within PING_TIMEOUT"""
+    if client is None:
+        return False
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), PING_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
 def get_database():
-    return client.social_dashboard
+    return client[DATABASE_NAME]
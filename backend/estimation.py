@@ -0,0 +1,222 @@
+"""
+Estimation - deterministic fill-ins for metrics Instagram doesn't always report (video views, shares)
+
+A missing value is predicted as likes x ratio, where the ratio is fitted from the same account's posts that
+do report the metric (sum of metric / sum of likes, once MIN_SAMPLES such posts exist), else from the whole
+market's, else DEFAULT_RATIOS. Estimates are computed when posts are stored, written into the metric
+itself and listed in the post's `estimated` field; fitting only ever uses reported values.
+
+For competitors those sums are kept in reported_sums (one document per account plus the market's) and
+adjusted by $inc as posts are upserted, so a fit is one small read instead of a pass over every post.
+"""
+import asyncio
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from models import CompetitorPost, MyPost, ReportedSums
+
+METRICS = ("views", "shares")
+# Per like, used until enough reported values exist (roughly what the dashboard used to guess)
+DEFAULT_RATIOS = {"views": 20.0, "shares": 0.05}
+MIN_SAMPLES = 5
+VIDEO_TYPES = {"video", "reel", "reels", "clips"}
+# reported_sums owner holding the whole market's sums (no username is "*")
+MARKET = "*"
+
+Ratios = Dict[str, float]
+
+def is_video(post_type: Optional[str]) -> bool:
+    return (post_type or "").lower() in VIDEO_TYPES
+
+def _post_type(post: Any) -> Optional[str]:
+    return getattr(post, "type", None) or getattr(post, "content_type", None)
+
+def applies(post: Any, metric: str) -> bool:
+    """Only videos have views; anything with likes can have shares"""
+    return metric != "views" or is_video(_post_type(post))
+
+def needs_estimate(post: Any, metric: str) -> bool:
+    """Missing (or previously estimated) and predictable from likes"""
+    if not applies(post, metric) or getattr(post, "likes", 0) <= 0:
+        return False
+    return metric in getattr(post, "estimated", []) or not getattr(post, metric, 0)
+
+def predict(likes: int, ratio: float) -> int:
+    return int(likes * ratio + 0.5)
+
+def fallback(metric: str, likes: int) -> int:
+    """Estimate for documents stored before estimation existed"""
+    return predict(likes, DEFAULT_RATIOS[metric])
+
+def displayed(post: Any) -> Tuple[Dict[str, int], bool]:
+    """
+    Metric values to show and whether any is an estimate. Posts stored before estimation existed get a
+    DEFAULT_RATIOS estimate until the next ingest / refresh fits a proper one.
+    """
+    values, estimated = {}, bool(getattr(post, "estimated", []))
+    for metric in METRICS:
+        values[metric] = getattr(post, metric, 0)
+        if metric not in getattr(post, "estimated", []) and needs_estimate(post, metric):
+            values[metric], estimated = fallback(metric, post.likes), True
+    return values, estimated
+
+def _ratio(total: float, likes: float, samples: int) -> Optional[float]:
+    return total / likes if samples >= MIN_SAMPLES and likes > 0 else None
+
+def _reported(metric: str, type_field: str = "type") -> Dict[str, Any]:
+    """$cond: this post reports `metric` itself"""
+    conditions = [{"$gt": [f"${metric}", 0]}, {"$eq": [{"$in": [metric, {"$ifNull": ["$estimated", []]}]}, False]}]
+    if metric == "views":
+        conditions.append({"$in": [{"$toLower": {"$ifNull": [f"${type_field}", ""]}}, sorted(VIDEO_TYPES)]})
+    return {"$and": conditions}
+
+def _sums(type_field: str = "type") -> Dict[str, Any]:
+    """$group accumulators: per metric, the reported total, the likes of the posts reporting it and their count"""
+    group = {}
+    for metric in METRICS:
+        reported = _reported(metric, type_field)
+        group[f"{metric}_total"] = {"$sum": {"$cond": [reported, f"${metric}", 0]}}
+        group[f"{metric}_likes"] = {"$sum": {"$cond": [reported, "$likes", 0]}}
+        group[f"{metric}_samples"] = {"$sum": {"$cond": [reported, 1, 0]}}
+    return group
+
+async def fit_page(tenant_id: str, page_id: str) -> Ratios:
+    """Ratios from your stored posts (my_posts); only metrics with enough samples are included"""
+    rows = await MyPost.get_motor_collection().aggregate([
+        {"$match": {"tenant_id": tenant_id, "page_id": page_id, "likes": {"$gt": 0}}},
+        {"$group": {"_id": None, **_sums("content_type")}},
+    ]).to_list(None)
+    if not rows:
+        return {}
+    ratios = {metric: _ratio(rows[0][f"{metric}_total"], rows[0][f"{metric}_likes"], rows[0][f"{metric}_samples"])
+              for metric in METRICS}
+    return {metric: ratio for metric, ratio in ratios.items() if ratio is not None}
+
+def _ratios(row: Dict[str, Any]) -> Ratios:
+    ratios = {}
+    for metric in METRICS:
+        ratio = _ratio(row.get(f"{metric}_total", 0), row.get(f"{metric}_likes", 0), row.get(f"{metric}_samples", 0))
+        if ratio is not None:
+            ratios[metric] = ratio
+    return ratios
+
+async def fit_competitors(owners: List[str]) -> Dict[Optional[str], Ratios]:
+    """Ratios per competitor from reported_sums, plus the market's under the None key (one indexed read)"""
+    cursor = ReportedSums.get_motor_collection().find({"owner": {"$in": [*owners, MARKET]}}, {"_id": 0})
+    rows = {row["owner"]: row async for row in cursor}
+    fitted: Dict[Optional[str], Ratios] = {owner: _ratios(rows[owner]) for owner in owners if owner in rows}
+    fitted[None] = _ratios(rows.get(MARKET, {}))
+    return fitted
+
+def _get(post: Any, field: str, default: Any = None) -> Any:
+    return post.get(field, default) if isinstance(post, dict) else getattr(post, field, default)
+
+def contribution(post: Any) -> Counter:
+    """What a post (model or stored document) adds to its account's reported sums - the same posts _sums counts"""
+    sums: Counter = Counter()
+    likes = _get(post, "likes", 0) or 0
+    if likes <= 0:
+        return sums
+    estimated = _get(post, "estimated") or []
+    for metric in METRICS:
+        value = _get(post, metric, 0) or 0
+        if value > 0 and metric not in estimated and (metric != "views" or is_video(_get(post, "type"))):
+            sums[f"{metric}_total"] += value
+            sums[f"{metric}_likes"] += likes
+            sums[f"{metric}_samples"] += 1
+    return sums
+
+async def _inc_sums(incs: Dict[str, Counter]):
+    """Apply per-account deltas to reported_sums, and their total to the market's"""
+    market: Counter = Counter()
+    ops = []
+    for owner, inc in incs.items():
+        changes = {field: n for field, n in inc.items() if n}
+        if changes:
+            market.update(changes)
+            ops.append(UpdateOne({"owner": owner}, {"$inc": changes}, upsert=True))
+    changes = {field: n for field, n in market.items() if n}
+    if changes:
+        ops.append(UpdateOne({"owner": MARKET}, {"$inc": changes}, upsert=True))
+    if ops:
+        await ReportedSums.get_motor_collection().bulk_write(ops, ordered=False)
+
+async def record_sums(posts: Iterable[CompetitorPost], stored: Dict[Tuple[str, str], Dict[str, Any]]):
+    """
+    Apply just-upserted posts to reported_sums: the version each write replaced (if it was counted,
+    i.e. has `summed`) is taken out and the new version added.
+    """
+    incs: Dict[str, Counter] = defaultdict(Counter)
+    for post in posts:
+        old = stored.get((post.owner, post.post_id))
+        if old is not None and "summed" in old:
+            incs[post.owner].subtract(contribution(old))
+        incs[post.owner].update(contribution(post))
+    await _inc_sums(incs)
+
+def estimate(post: Any, own: Ratios, market: Ratios) -> List[str]:
+    """Fill in the post's missing metrics in place; returns (and records) which ones are estimates"""
+    estimated = []
+    for metric in METRICS:
+        if needs_estimate(post, metric):
+            ratio = own.get(metric, market.get(metric, DEFAULT_RATIOS[metric]))
+            setattr(post, metric, predict(post.likes, ratio))
+            estimated.append(metric)
+    post.estimated = estimated
+    return estimated
+
+async def estimate_competitor_posts(posts: List[CompetitorPost]) -> int:
+    """
+    Store estimates for just-upserted posts (which hold reported values only), fitted with them included.
+    Returns how many posts got an estimate.
+    """
+    pending = [p for p in posts if any(needs_estimate(p, m) for m in METRICS)]
+    if not pending:
+        return 0
+    fitted = await fit_competitors(sorted({p.owner for p in pending}))
+    ops = []
+    for post in pending:
+        estimated = estimate(post, fitted.get(post.owner, {}), fitted[None])
+        fields = {metric: getattr(post, metric) for metric in estimated}
+        ops.append(UpdateOne({"owner": post.owner, "post_id": post.post_id}, {"$set": {**fields, "estimated": estimated}}))
+    await CompetitorPost.get_motor_collection().bulk_write(ops, ordered=False)
+    return len(ops)
+
+async def backfill_sums(batch_size: int = 500) -> int:
+    """Count posts stored before reported_sums existed (no `summed` field); returns how many were added"""
+    collection = CompetitorPost.get_motor_collection()
+    projection = {"owner": 1, "likes": 1, "views": 1, "shares": 1, "type": 1, "estimated": 1}
+    counted = 0
+    while True:
+        docs = await collection.find({"summed": {"$exists": False}}, projection).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return counted
+
+        async def claim(doc) -> bool:
+            # An upsert that replaced the post in the meantime has counted it already
+            result = await collection.update_one({"_id": doc["_id"], "summed": {"$exists": False}}, {"$set": {"summed": True}})
+            return result.modified_count == 1
+
+        claimed = await asyncio.gather(*(claim(doc) for doc in docs))
+        incs: Dict[str, Counter] = defaultdict(Counter)
+        for doc, won in zip(docs, claimed):
+            if won:
+                incs[doc["owner"]].update(contribution(doc))
+        await _inc_sums(incs)
+        counted += sum(claimed)
+
+async def backfill(batch_size: int = 500) -> int:
+    """Estimate for posts stored before estimation existed (no `estimated` field); returns how many were checked"""
+    collection = CompetitorPost.get_motor_collection()
+    checked = 0
+    while True:
+        docs = await collection.find({"estimated": {"$exists": False}}).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return checked
+        posts = [CompetitorPost.model_validate(d) for d in docs]
+        await estimate_competitor_posts(posts)
+        await collection.update_many(
+            {"_id": {"$in": [d["_id"] for d in docs]}, "estimated": {"$exists": False}},
+            {"$set": {"estimated": []}}
+        )
+        checked += len(docs)
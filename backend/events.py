@@ -0,0 +1,102 @@
+"""
+Live Events - one in-process fan-out feeding compact update events to every connected dashboard
+
+Events are also broadcast to the other workers, whose clients get them too (see coordination).
+Event ids are per worker; a client reconnecting with a Last-Event-ID this worker still has in its
+replay buffer gets the events it missed, any other id gets a "resync".
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+from models import DEFAULT_TENANT
+import coordination
+
+# Per-client buffer; a client that falls this far behind gets a single "resync" instead
+QUEUE_SIZE = 100
+# Comment line sent when idle so proxies don't close the connection
+HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT", "15"))
+RETRY_MS = 5000
+# Recent events (all tenants) kept for clients that reconnect with a Last-Event-ID
+REPLAY_SIZE = int(os.getenv("STREAM_REPLAY_SIZE", "500"))
+
+# queue -> tenant it is subscribed to
+_subscribers: Dict[asyncio.Queue, str] = {}
+_last_id = 0
+# Prefix of this worker's event ids, so an id from another worker (or before a restart) is never mistaken for ours
+_epoch = uuid4().hex[:8]
+# (sequence number, tenant, message)
+_recent: Deque[Tuple[int, str, str]] = deque(maxlen=REPLAY_SIZE)
+
+def _format(event_id: int, event: str, data: Dict[str, Any]) -> str:
+    body = json.dumps(data, default=str, separators=(",", ":"))
+    return f"id: {_epoch}-{event_id}\nevent: {event}\ndata: {body}\n\n"
+
+def publish(event: str, data: Dict[str, Any], tenant_id: str = DEFAULT_TENANT):
+    """Queue an event for every subscriber of the tenant, on every worker; never blocks the caller"""
+    _deliver(event, data, tenant_id)
+    coordination.broadcast("events", {"event": event, "data": data, "tenant_id": tenant_id})
+
+def _deliver(event: str, data: Dict[str, Any], tenant_id: str):
+    """Queue an event for this worker's subscribers of the tenant; serialized once"""
+    global _last_id
+    _last_id += 1
+    message = _format(_last_id, event, data)
+    _recent.append((_last_id, tenant_id, message))
+    for queue, subscribed in list(_subscribers.items()):
+        if subscribed != tenant_id:
+            continue
+        if queue.full():
+            # Slow client - drop its backlog and tell it to refetch everything
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_format(_last_id, "resync", {}))
+            continue
+        queue.put_nowait(message)
+
+coordination.subscribe("events", lambda payload: _deliver(payload["event"], payload["data"], payload["tenant_id"]))
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+def _missed(last_event_id: str, tenant_id: str) -> Optional[List[str]]:
+    """The tenant's events after `last_event_id`, or None if it isn't one of this worker's buffered ids"""
+    epoch, _, seq = last_event_id.partition("-")
+    if epoch != _epoch or not seq.isdigit():
+        return None
+    seq = int(seq)
+    oldest = _recent[0][0] if _recent else _last_id + 1
+    # Also unknown if events after it have already fallen out of the buffer
+    if seq > _last_id or seq < oldest - 1:
+        return None
+    return [message for event_id, tenant, message in _recent if event_id > seq and tenant == tenant_id]
+
+async def stream(is_disconnected, hello: Dict[str, Any], tenant_id: str = DEFAULT_TENANT, last_event_id: Optional[str] = None):
+    """
+    SSE body for one client: a hello event, then the tenant's published events and heartbeats.
+    A reconnecting client first gets the events it missed, or a "resync" if they can't be replayed.
+    """
+    queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+    _subscribers[queue] = tenant_id
+    # Taken with the subscription (no await in between), so nothing is missed or sent twice
+    missed = _missed(last_event_id, tenant_id) if last_event_id else []
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        yield _format(_last_id, "hello", hello)
+        if missed is None:
+            yield _format(_last_id, "resync", {})
+        else:
+            for message in missed:
+                yield message
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                message = ": ping\n\n"
+            yield message
+    finally:
+        _subscribers.pop(queue, None)
@@ -0,0 +1,227 @@
+"""
+Export - streams posts, stats history and competitors as CSV, NDJSON or Parquet straight off a Motor cursor
+
+Documents are pulled BATCH_SIZE at a time and encoded chunk by chunk, so memory stays flat however large the
+export is. Parquet (needs pyarrow, imported on the first Parquet export) is written one row group of ROW_GROUP_SIZE
+rows at a time.
+"""
+import asyncio
+import csv
+import importlib.util
+import io
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from models import AccountStats, Competitor, CompetitorPost, MyPost, UserAnalytics
+import responses
+import tenants
+
+# Documents per cursor batch and per CSV / NDJSON chunk
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "10000"))
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (column, type); "json" columns hold lists/dicts, written as JSON text in CSV and Parquet
+Column = Tuple[str, str]
+COLUMNS: Dict[str, List[Column]] = {
+    "posts": [
+        ("owner", "str"), ("post_id", "str"), ("timestamp", "datetime"), ("type", "str"), ("caption", "str"),
+        ("likes", "int"), ("comments", "int"), ("shares", "int"), ("views", "int"), ("saves", "int"),
+        ("reach", "int"), ("estimated", "json"), ("url", "str"),
+    ],
+    "stats": [
+        ("ts", "datetime"), ("account", "str"), ("kind", "str"), ("followers", "int"), ("following", "int"),
+        ("posts_count", "int"), ("engagement_rate", "float"), ("avg_likes", "int"),
+    ],
+    "competitors": [
+        ("username", "str"), ("full_name", "str"), ("followers_count", "int"), ("following_count", "int"),
+        ("posts_count", "int"), ("is_verified", "bool"), ("engagement_rate", "float"), ("avg_likes", "int"),
+        ("posts_per_week", "int"), ("content_mix", "json"), ("top_hashtags", "json"), ("scraped_at", "datetime"),
+    ],
+}
+
+def parquet_available() -> bool:
+    """Without pyarrow, CSV / NDJSON only (checked without importing it, it adds ~0.1 s to startup)"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+# --- Rows ---
+
+def _range(since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    """[since, until) filter; empty if neither is given"""
+    bounds = {}
+    if since:
+        bounds["$gte"] = since
+    if until:
+        bounds["$lt"] = until
+    return bounds
+
+async def _scope(tenant_id: str, account: Optional[str]) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+    """
+    (competitor usernames, your UserAnalytics page_id/username) to export: everything the tenant has,
+    or just `account` - your own page id / username or one of its competitors (404 otherwise)
+    """
+    me = await UserAnalytics.get_motor_collection().find_one({"tenant_id": tenant_id}, {"tenant_id": 1, "page_id": 1, "username": 1})
+    if account and me and account.lstrip("@") in (me.get("page_id"), me.get("username")):
+        return [], me
+    return await tenants.competitor_usernames(tenant_id, account or None), None if account else me
+
+async def _post_rows(competitors: List[str], me: Optional[Dict[str, Any]], when: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    if me:
+        query: Dict[str, Any] = {"tenant_id": me["tenant_id"], "page_id": me["page_id"]}
+        if when:
+            query["timestamp"] = when
+        cursor = MyPost.get_motor_collection().find(query, {"_id": 0})
+        async for p in cursor.sort("timestamp", -1).batch_size(BATCH_SIZE):
+            yield {**p, "owner": me["page_id"], "type": p.get("content_type")}
+    if competitors:
+        query = {"owner": {"$in": competitors}}
+        if when:
+            query["timestamp"] = when
+        cursor = CompetitorPost.get_motor_collection().find(query, {"_id": 0, "terms": 0, "slot": 0, "summed": 0})
+        async for p in cursor.sort([("owner", 1), ("timestamp", -1)]).batch_size(BATCH_SIZE):
+            yield {**p, "url": p.get("post_url") or p.get("url")}
+
+async def _stats_rows(accounts: List[str], when: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    query: Dict[str, Any] = {"meta.account": {"$in": accounts}}
+    if when:
+        query["ts"] = when
+    cursor = AccountStats.get_motor_collection().find(query, {"_id": 0})
+    async for s in cursor.sort("ts", 1).batch_size(BATCH_SIZE):
+        yield {**s, "account": s["meta"]["account"], "kind": s["meta"]["kind"]}
+
+async def _competitor_rows(tenant_id: str, usernames: List[str], when: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    query: Dict[str, Any] = {"tenant_id": tenant_id, "username": {"$in": usernames}}
+    if when:
+        query["scraped_at"] = when
+    cursor = Competitor.get_motor_collection().find(query, {"_id": 0, "recent_posts": 0})
+    async for c in cursor.sort("username", 1).batch_size(BATCH_SIZE):
+        yield c
+
+async def rows(dataset: str, tenant_id: str, account: Optional[str] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Row source for a dataset. The account is resolved here (so an unknown one is a 404 before
+    any bytes are sent); the documents are only read as the returned iterator is consumed.
+    """
+    competitors, me = await _scope(tenant_id, account)
+    when = _range(since, until)
+    if dataset == "posts":
+        return _post_rows(competitors, me, when)
+    if dataset == "stats":
+        return _stats_rows(competitors + ([me["page_id"]] if me else []), when)
+    return _competitor_rows(tenant_id, competitors, when)
+
+# --- Encoders ---
+
+def _text(value: Any, kind: str) -> Any:
+    """Cell value for CSV / Parquet"""
+    if value is None:
+        return None
+    if kind == "json":
+        return responses.dumps(value).decode("utf-8")
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    if kind == "bool":
+        return bool(value)
+    if kind == "str":
+        return str(value)
+    return value
+
+async def _csv(source: AsyncIterator[Dict[str, Any]], columns: List[Column]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    pending = 0
+    async for row in source:
+        cells = [_text(row.get(name), kind) for name, kind in columns]
+        writer.writerow([c.isoformat() if isinstance(c, datetime) else c for c in cells])
+        pending += 1
+        if pending >= BATCH_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+async def _ndjson(source: AsyncIterator[Dict[str, Any]], columns: List[Column]) -> AsyncIterator[bytes]:
+    lines = []
+    async for row in source:
+        lines.append(responses.dumps({name: row.get(name) for name, _ in columns}))
+        if len(lines) >= BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+class _Sink:
+    """Write-only file for ParquetWriter that hands over what was written since the last take()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet footers record absolute offsets, so this counts everything ever written
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+_ARROW_TYPES = {
+    "str": lambda pa: pa.string(), "json": lambda pa: pa.string(), "int": lambda pa: pa.int64(),
+    "float": lambda pa: pa.float64(), "bool": lambda pa: pa.bool_(), "datetime": lambda pa: pa.timestamp("ms"),
+}
+
+async def _parquet(source: AsyncIterator[Dict[str, Any]], columns: List[Column]) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, _ARROW_TYPES[kind](pa)) for name, kind in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def group(values: Dict[str, List[Any]]):
+        # Encoding a row group is CPU-bound, keep it off the event loop
+        return asyncio.to_thread(writer.write_table, pa.Table.from_pydict(values, schema=schema))
+
+    values: Dict[str, List[Any]] = {name: [] for name, _ in columns}
+    count = 0
+    async for row in source:
+        for name, kind in columns:
+            values[name].append(_text(row.get(name), kind))
+        count += 1
+        if count >= ROW_GROUP_SIZE:
+            await group(values)
+            values, count = {name: [] for name, _ in columns}, 0
+            yield sink.take()
+    if count:
+        await group(values)
+    writer.close()
+    yield sink.take()
+
+async def encode(source: AsyncIterator[Dict[str, Any]], dataset: str, fmt: str) -> AsyncIterator[bytes]:
+    """Encoded chunks of a dataset's rows"""
+    encoder = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}[fmt]
+    async for chunk in encoder(source, COLUMNS[dataset]):
+        if chunk:
+            yield chunk
@@ -0,0 +1,165 @@
+"""
+Heatmap - per-account weekday x hour engagement matrices, maintained incrementally as posts are upserted
+
+Each account has one engagement_heatmaps document. Every cell ("weekday-hour", UTC, Monday = 0) keeps
+post/like/comment counts and a log-bucketed quantile sketch of likes and comments: bucket counts are
+plain integers, so adding or removing a post is one $inc per field and merging accounts is a sum.
+Estimated quantiles are within SKETCH_ACCURACY (relative) of the true value.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from models import CompetitorPost, EngagementHeatmap
+
+SKETCH_ACCURACY = 0.05
+GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+WEEK_HOURS = 7 * 24
+SKETCHED = ("likes", "comments")
+# Cells with fewer posts than this aren't recommended as best times
+BEST_MIN_POSTS = 3
+BEST_SLOTS = 5
+
+# --- Sketch ---
+
+def bucket(value: int) -> str:
+    """Sketch bucket of a non-negative count: "0" for zero, else 1 + ceil(log_gamma(value))"""
+    if value <= 0:
+        return "0"
+    return str(1 + math.ceil(math.log(value) / _LOG_GAMMA))
+
+def bucket_value(key: str) -> float:
+    """Representative value of a bucket (its midpoint in relative terms)"""
+    index = int(key)
+    if index <= 0:
+        return 0.0
+    return 2 * GAMMA ** (index - 1) / (GAMMA + 1)
+
+def quantile(sketch: Dict[str, int], q: float) -> Optional[float]:
+    """Estimated q-quantile (0..1) of the values counted in a sketch"""
+    buckets = sorted((int(k), n) for k, n in sketch.items() if n > 0)
+    total = sum(n for _, n in buckets)
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for index, n in buckets:
+        seen += n
+        if seen > rank:
+            return round(bucket_value(str(index)), 1)
+    return round(bucket_value(str(buckets[-1][0])), 1)
+
+# --- Maintenance ---
+
+def slot_of(timestamp: Optional[datetime]) -> Optional[str]:
+    """Heatmap cell of a (naive UTC) post time"""
+    return f"{timestamp.weekday()}-{timestamp.hour}" if timestamp else None
+
+def _add(inc: Dict[str, int], slot: Optional[str], likes: int, comments: int, sign: int):
+    if slot is None:
+        return
+    cell = f"cells.{slot}"
+    inc["posts"] += sign
+    inc[f"{cell}.posts"] += sign
+    inc[f"{cell}.likes"] += sign * likes
+    inc[f"{cell}.comments"] += sign * comments
+    inc[f"{cell}.likes_sketch.{bucket(likes)}"] += sign
+    inc[f"{cell}.comments_sketch.{bucket(comments)}"] += sign
+
+async def record_posts(posts: Iterable[CompetitorPost], stored: Dict[Tuple[str, str], Dict[str, Any]]):
+    """
+    Apply just-upserted posts: the version each write replaced (if it was counted, i.e. has a `slot`)
+    is taken out of its cell and the new version added - O(1) per post, one update per account.
+    """
+    incs: Dict[str, Counter] = defaultdict(Counter)
+    for post in posts:
+        inc = incs[post.owner]
+        old = stored.get((post.owner, post.post_id))
+        if old is not None and "slot" in old:
+            _add(inc, old["slot"], old.get("likes", 0), old.get("comments", 0), -1)
+        _add(inc, post.slot, post.likes, post.comments, +1)
+
+    now = datetime.now()
+    ops = []
+    for owner, inc in incs.items():
+        changes = {path: n for path, n in inc.items() if n}
+        if changes:
+            ops.append(UpdateOne({"owner": owner}, {"$inc": changes, "$set": {"updated_at": now}}, upsert=True))
+    if ops:
+        await EngagementHeatmap.get_motor_collection().bulk_write(ops, ordered=False)
+
+async def backfill(batch_size: int = 500) -> int:
+    """Count posts stored before heatmaps existed (no `slot` field); returns how many were added"""
+    collection = CompetitorPost.get_motor_collection()
+    projection = {"owner": 1, "post_id": 1, "likes": 1, "comments": 1, "timestamp": 1}
+    counted = 0
+    while True:
+        docs = await collection.find({"slot": {"$exists": False}}, projection).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return counted
+        posts = [
+            CompetitorPost(
+                owner=d["owner"], post_id=d["post_id"], likes=d.get("likes", 0), comments=d.get("comments", 0),
+                timestamp=d.get("timestamp"), slot=slot_of(d.get("timestamp"))
+            )
+            for d in docs
+        ]
+        await record_posts(posts, {})
+        await collection.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$set": {"slot": p.slot}}) for d, p in zip(docs, posts)],
+            ordered=False
+        )
+        counted += len(docs)
+
+# --- Queries ---
+
+def merge(cell_maps: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Sum per-account cell maps into one (the market-wide heatmap)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for cells in cell_maps:
+        for slot, cell in cells.items():
+            into = merged.setdefault(slot, {"posts": 0, "likes": 0, "comments": 0, **{f"{m}_sketch": Counter() for m in SKETCHED}})
+            into["posts"] += cell.get("posts", 0)
+            into["likes"] += cell.get("likes", 0)
+            into["comments"] += cell.get("comments", 0)
+            for metric in SKETCHED:
+                into[f"{metric}_sketch"].update(cell.get(f"{metric}_sketch", {}))
+    return merged
+
+def _shift(slot: str, utc_offset: int) -> Tuple[int, int]:
+    weekday, hour = map(int, slot.split("-"))
+    shifted = (weekday * 24 + hour + utc_offset) % WEEK_HOURS
+    return shifted // 24, shifted % 24
+
+def render(cells: Dict[str, Dict[str, Any]], utc_offset: int = 0) -> Dict[str, Any]:
+    """Non-empty cells with averages and estimated quantiles, in the viewer's (whole-hour) UTC offset"""
+    rows = []
+    for slot, cell in cells.items():
+        posts = cell.get("posts", 0)
+        if posts <= 0:
+            continue
+        weekday, hour = _shift(slot, utc_offset)
+        row = {"weekday": weekday, "hour": hour, "posts": posts}
+        for metric in SKETCHED:
+            sketch = cell.get(f"{metric}_sketch", {})
+            row[f"avg_{metric}"] = round(cell.get(metric, 0) / posts, 1)
+            row[f"median_{metric}"] = quantile(sketch, 0.5)
+            row[f"p90_{metric}"] = quantile(sketch, 0.9)
+        rows.append(row)
+    rows.sort(key=lambda r: (r["weekday"], r["hour"]))
+    candidates = [r for r in rows if r["posts"] >= BEST_MIN_POSTS]
+    best = sorted(candidates, key=lambda r: (r["median_likes"] or 0, r["avg_likes"]), reverse=True)[:BEST_SLOTS]
+    return {
+        "posts": sum(r["posts"] for r in rows),
+        "cells": rows,
+        "best": [{"weekday": r["weekday"], "hour": r["hour"]} for r in best],
+    }
+
+async def heatmap(owners: List[str], utc_offset: int = 0) -> Dict[str, Any]:
+    """Merged heatmap of the given accounts (one document read per account)"""
+    if not owners:
+        return render({}, utc_offset)
+    cursor = EngagementHeatmap.get_motor_collection().find({"owner": {"$in": owners}}, {"_id": 0, "cells": 1})
+    return render(merge([doc.get("cells", {}) async for doc in cursor]), utc_offset)
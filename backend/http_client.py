@@ -0,0 +1,35 @@
+"""
+Shared HTTP Client - one pooled httpx.AsyncClient for the whole app, owned by the lifespan
+"""
+from typing import Optional
+import os
+import httpx
+import instrumentation
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, connect=10.0),
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+        event_hooks=instrumentation.HTTPX_EVENT_HOOKS,
+    )
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client; created on first use when running outside the app lifespan"""
+    global _client
+    if _client is None:
+        _client = _new_client()
+    return _client
+
+async def start():
+    get_client()
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,361 @@
+"""
+Image Cache - streaming CDN image proxy backed by a bounded, content-addressed on-disk LRU cache
+
+The cache directory is shared by every worker: the size is recounted from disk and eviction runs
+under a file lock, in least-recently-touched order.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from fastapi import Response
+from fastapi.responses import FileResponse, StreamingResponse
+import http_client
+import thumbnails
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each worker sweeps on its own
+    fcntl = None
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache"))
+MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTL = int(os.getenv("IMAGE_CACHE_TTL", "86400"))  # Upper bound, upstream max-age can shorten it
+CHUNK_SIZE = 64 * 1024
+# How long a request waits on another request already fetching the same URL
+COALESCE_TIMEOUT = 30.0
+# Entries used this recently are never evicted: serving one touches its mtime (in any worker), so a
+# response that hasn't opened its file yet or a thumbnail job reading the original keeps it.
+# The cache can exceed MAX_BYTES by what is written within this window, until the next sweep.
+EVICT_GRACE = float(os.getenv("IMAGE_CACHE_EVICT_GRACE", "10"))
+# Seconds between sweeps while this worker's own writes stay under the cap (other workers write too),
+# and at least between sweeps while over it
+SWEEP_INTERVAL = 30.0
+MIN_SWEEP_INTERVAL = 1.0
+
+# User-Agent to mimick browser
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Cache size on disk as of the last sweep, plus what this worker has written since
+_total_bytes = 0
+_last_sweep = 0.0
+_sweeping = False
+# key -> thumbnail jobs in this worker reading the file
+_pins: Counter = Counter()
+# key -> future resolved (True if cached) when the in-flight download finishes
+_inflight: Dict[str, asyncio.Future] = {}
+# variant key -> lock, so a thumbnail is only rendered once
+_variant_locks: Dict[str, asyncio.Lock] = {}
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+def _paths(key: str):
+    folder = os.path.join(CACHE_DIR, key[:2])
+    return os.path.join(folder, key), os.path.join(folder, f"{key}.json")
+
+def _scan() -> List[Tuple[float, str, int]]:
+    """(mtime, key, size) of every cached body on disk - originals and variants, all workers' writes"""
+    entries = []
+    if os.path.isdir(CACHE_DIR):
+        for folder in os.scandir(CACHE_DIR):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".json") or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:  # Evicted by another worker meanwhile
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+    return entries
+
+@contextmanager
+def _cache_lock():
+    """Exclusive across the workers sharing CACHE_DIR"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, ".lock"), "w") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _read_meta(key: str) -> Optional[Dict[str, Any]]:
+    body_path, meta_path = _paths(key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if os.path.exists(body_path) else None
+
+def _write_meta(key: str, meta: Dict[str, Any]):
+    _, meta_path = _paths(key)
+    tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+def _touch(key: str):
+    """Mark an entry as used (LRU order and eviction grace are both read from its mtime)"""
+    try:
+        os.utime(_paths(key)[0])
+    except OSError:
+        pass
+
+@contextmanager
+def _pinned(key: str):
+    """Keep `key` from being evicted while this worker reads it"""
+    _touch(key)
+    _pins[key] += 1
+    try:
+        yield
+    finally:
+        _pins[key] -= 1
+        if not _pins[key]:
+            del _pins[key]
+
+def _remove(key: str):
+    for path in _paths(key):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _sweep() -> int:
+    """
+    Recount the cache from disk and evict least recently used entries until it is under MAX_BYTES,
+    skipping entries in use. Runs under the cache lock, so workers don't evict (or count) concurrently.
+    Returns the size left.
+    """
+    with _cache_lock():
+        entries = sorted(_scan())
+        total = sum(size for _, _, size in entries)
+        in_use_since = time.time() - EVICT_GRACE
+        for mtime, key, size in entries:
+            if total <= MAX_BYTES:
+                break
+            if mtime >= in_use_since or _pins.get(key) or key in _inflight:
+                continue
+            _remove(key)
+            total -= size
+        return total
+
+async def _store(size: int):
+    """Account for a newly written file; sweep (off the event loop) when the cache may be over the cap"""
+    global _total_bytes, _last_sweep, _sweeping
+    _total_bytes += size
+    since = time.monotonic() - _last_sweep
+    if _sweeping or since < MIN_SWEEP_INTERVAL or (_total_bytes <= MAX_BYTES and since < SWEEP_INTERVAL):
+        return
+    _sweeping = True
+    try:
+        _total_bytes = await asyncio.to_thread(_sweep)
+    finally:
+        _last_sweep = time.monotonic()
+        _sweeping = False
+
+def _max_age(cache_control: str) -> Optional[int]:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else None
+
+def _expiry(cache_control: str) -> float:
+    max_age = _max_age(cache_control)
+    return time.time() + (min(max_age, TTL) if max_age is not None else TTL)
+
+def _client_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+    remaining = max(0, int(meta.get("expires_at", 0) - time.time()))
+    headers = {"Cache-Control": f"public, max-age={remaining}"}
+    if meta.get("etag"):
+        headers["ETag"] = meta["etag"]
+    return headers
+
+def _serve_cached(key: str, meta: Dict[str, Any], if_none_match: Optional[str]) -> Response:
+    _touch(key)
+    headers = _client_headers(meta)
+    if if_none_match and meta.get("etag") and meta["etag"] in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(_paths(key)[0], media_type=meta.get("content_type", "image/jpeg"), headers=headers)
+
+def _finish(key: str, future: Optional[asyncio.Future], cached: bool):
+    if future is None:
+        return
+    if _inflight.get(key) is future:
+        del _inflight[key]
+    if not future.done():
+        future.set_result(cached)
+
+async def _open_upstream(url: str, upstream_etag: Optional[str] = None) -> httpx.Response:
+    headers = {"User-Agent": USER_AGENT}
+    if upstream_etag:
+        headers["If-None-Match"] = upstream_etag
+    client = http_client.get_client()
+    request = client.build_request("GET", url, headers=headers, timeout=10.0)
+    return await client.send(request, stream=True, follow_redirects=True)
+
+async def _tee(upstream: httpx.Response, key: str, meta: Dict[str, Any], future: Optional[asyncio.Future]):
+    """Yield the upstream body chunk by chunk, writing it to the cache as it goes"""
+    body_path, _ = _paths(key)
+    tmp = f"{body_path}.{os.getpid()}.{id(upstream)}.tmp"
+    f = None
+    cached = False
+    try:
+        if future is not None:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            f = open(tmp, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+            if f:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            yield chunk
+        if f:
+            f.close()
+            os.replace(tmp, body_path)
+            meta["size"] = size
+            meta["etag"] = meta.get("etag") or f'"{digest.hexdigest()[:32]}"'
+            _write_meta(key, meta)
+            cached = True
+            await _store(size)
+    finally:
+        if f and not f.closed:
+            f.close()
+        if not cached and os.path.exists(tmp):
+            os.remove(tmp)
+        await upstream.aclose()
+        _finish(key, future, cached)
+
+async def _fetch(url: str, key: str, stale: Optional[Dict[str, Any]], future: Optional[asyncio.Future],
+                 if_none_match: Optional[str]) -> Response:
+    try:
+        upstream = await _open_upstream(url, stale.get("upstream_etag") if stale else None)
+    except Exception:
+        _finish(key, future, False)
+        raise
+
+    # Stale copy is still valid upstream - just extend its lifetime
+    if upstream.status_code == 304 and stale:
+        await upstream.aclose()
+        stale["expires_at"] = _expiry(upstream.headers.get("cache-control", ""))
+        _write_meta(key, stale)
+        _finish(key, future, True)
+        return _serve_cached(key, stale, if_none_match)
+
+    if upstream.status_code != 200:
+        await upstream.aclose()
+        _finish(key, future, False)
+        upstream.raise_for_status()
+        raise httpx.HTTPStatusError(f"Unexpected status {upstream.status_code}", request=upstream.request, response=upstream)
+
+    cache_control = upstream.headers.get("cache-control", "")
+    if "no-store" in cache_control:
+        _finish(key, future, False)
+        future = None
+
+    meta = {
+        "url": url,
+        "content_type": upstream.headers.get("content-type", "image/jpeg"),
+        "upstream_etag": upstream.headers.get("etag"),
+        "etag": upstream.headers.get("etag"),
+        "expires_at": _expiry(cache_control),
+    }
+    return StreamingResponse(
+        _tee(upstream, key, meta, future),
+        media_type=meta["content_type"],
+        headers=_client_headers(meta)
+    )
+
+def _variant_etag(original: Dict[str, Any], variant_key: str) -> str:
+    digest = hashlib.sha256(f"{original.get('etag')}|{variant_key}".encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+async def _ensure_original(url: str, key: str) -> Optional[Dict[str, Any]]:
+    """Make sure a fresh copy of `url` is on disk and return its metadata (None if uncacheable)"""
+    meta = _read_meta(key)
+    if meta and meta.get("expires_at", 0) > time.time():
+        return meta
+    response = await _proxy_original(url, key, None)
+    if isinstance(response, StreamingResponse):
+        # Drain the tee so the body lands in the cache
+        async for _ in response.body_iterator:
+            pass
+    return _read_meta(key)
+
+async def _proxy_variant(url: str, key: str, width: Optional[int], height: Optional[int], fmt: str,
+                         if_none_match: Optional[str]) -> Response:
+    """Serve a resized/re-encoded variant of `url`, cached next to the original"""
+    original = await _ensure_original(url, key)
+    if original is None:
+        # Upstream forbids caching - serve the original as-is
+        return await _proxy_original(url, key, if_none_match)
+
+    variant_key = f"{key}.{width or 0}x{height or 0}.{fmt}"
+    lock = _variant_locks.setdefault(variant_key, asyncio.Lock())
+    async with lock:
+        meta = _read_meta(variant_key)
+        if not meta or meta.get("source_etag") != original.get("etag"):
+            body_path, _ = _paths(variant_key)
+            with _pinned(key):
+                await thumbnails.resize(_paths(key)[0], body_path, width, height, fmt)
+            meta = {
+                "url": url,
+                "content_type": thumbnails.FORMATS[fmt],
+                "source_etag": original.get("etag"),
+                "etag": _variant_etag(original, variant_key),
+                "expires_at": original.get("expires_at", 0),
+            }
+            _write_meta(variant_key, meta)
+            await _store(os.path.getsize(body_path))
+    if not lock.locked():
+        _variant_locks.pop(variant_key, None)
+    meta["expires_at"] = original.get("expires_at", 0)
+    return _serve_cached(variant_key, meta, if_none_match)
+
+async def proxy(url: str, if_none_match: Optional[str] = None, width: Optional[int] = None,
+                height: Optional[int] = None, fmt: Optional[str] = None) -> Response:
+    """
+    Serve `url` from the disk cache, revalidating or fetching it upstream when needed.
+    Concurrent requests for the same URL share a single upstream fetch.
+    With width/height/fmt, a resized WebP/JPEG thumbnail is served instead.
+    Raises httpx.HTTPError if upstream fails.
+    """
+    key = cache_key(url)
+    if width or height or fmt:
+        return await _proxy_variant(url, key, width, height, fmt or "webp", if_none_match)
+    return await _proxy_original(url, key, if_none_match)
+
+async def _proxy_original(url: str, key: str, if_none_match: Optional[str]) -> Response:
+    meta = _read_meta(key)
+    if meta and meta.get("expires_at", 0) > time.time():
+        return _serve_cached(key, meta, if_none_match)
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        try:
+            cached = await asyncio.wait_for(asyncio.shield(inflight), COALESCE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Leader never finished (e.g. its client went away before streaming started)
+            if _inflight.get(key) is inflight:
+                del _inflight[key]
+            cached = False
+        meta = _read_meta(key)
+        if cached and meta:
+            return _serve_cached(key, meta, if_none_match)
+        # Leader couldn't cache it; stream straight through
+        return await _fetch(url, key, None, None, if_none_match)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    return await _fetch(url, key, meta, future, if_none_match)
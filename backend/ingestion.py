@@ -0,0 +1,394 @@
+"""
+Competitor Post Ingestion - normalizes raw Apify posts once into the indexed competitor_posts collection
+"""
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+from beanie.operators import In, Set
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from models import DEFAULT_TENANT, Competitor, CompetitorFollowers, CompetitorPost
+from meta_graph import parse_timestamp
+import estimation
+import heatmap
+import snapshot
+import stats
+import text_index
+
+def _int(value: Any) -> int:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return 0
+
+def _first(p: Dict[str, Any], *keys: str, default: Any = None) -> Any:
+    """First present, non-empty value among Apify's alternative key names"""
+    for key in keys:
+        value = p.get(key)
+        if value not in (None, ""):
+            return value
+    return default
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    return None
+
+def stable_post_id(owner: str, p: Dict[str, Any]) -> str:
+    """Fallback id for posts without one, derived from content so re-scrapes map to the same post"""
+    raw = f"{owner}|{p.get('timestamp', '')}|{_first(p, 'caption', 'text', default='')}|{_first(p, 'url', 'permalink', default='')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def normalize_post(p: Dict[str, Any], owner: str) -> CompetitorPost:
+    """Parse one raw Apify post dict (with all its key fallbacks) into a CompetitorPost"""
+    img_url = _first(p, 'displayUrl', 'thumbnailUrl', 'url', 'permalink', default='')
+    if not img_url and p.get('images'):
+        img_url = p['images'][0] if isinstance(p['images'], list) else p['images']
+    caption = _first(p, 'caption', 'text', default='') or ''
+    hashtags, mentions = p.get('hashtags'), p.get('mentions')
+    timestamp = _timestamp(p.get('timestamp'))
+    return CompetitorPost(
+        owner=owner,
+        post_id=str(_first(p, 'id', 'shortCode', default='') or stable_post_id(owner, p)),
+        timestamp=timestamp,
+        caption=caption,
+        likes=_int(_first(p, 'likesCount', 'likeCount', 'likes', default=0)),
+        comments=_int(_first(p, 'commentsCount', 'commentCount', 'comments', default=0)),
+        shares=_int(_first(p, 'shareCount', 'resharesCount', 'repostsCount', default=0)),
+        views=_int(_first(p, 'videoViewCount', 'viewCount', 'playCount', default=0)),
+        url=img_url,
+        post_url=_first(p, 'url', 'permalink', default=''),
+        type=_first(p, 'type', default='Image'),
+        terms=text_index.tokenize(
+            caption,
+            hashtags if isinstance(hashtags, list) else (),
+            mentions if isinstance(mentions, list) else ()
+        ),
+        slot=heatmap.slot_of(timestamp)
+    )
+
+# What index_posts, record_posts and record_sums need of the version a write replaced
+PRE_IMAGE = {
+    "_id": 0, "likes": 1, "comments": 1, "terms": 1, "slot": 1,
+    "views": 1, "shares": 1, "type": 1, "estimated": 1, "summed": 1
+}
+
+# Server error code for a unique index violation
+DUPLICATE_KEY = 11000
+
+async def _pre_images(collection, posts: List[CompetitorPost]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """The stored versions of `posts` (by (owner, post_id)), in one query"""
+    cursor = collection.find(
+        {"$or": [{"owner": p.owner, "post_id": p.post_id} for p in posts]},
+        {**PRE_IMAGE, "owner": 1, "post_id": 1}
+    )
+    return {(doc.pop("owner"), doc.pop("post_id")): doc async for doc in cursor}
+
+def _write(post: CompetitorPost, old: Optional[Dict[str, Any]]) -> Union[InsertOne, UpdateOne]:
+    """
+    Write one post, but only over the version it was read as: a new post is inserted, and a stored one is only
+    updated if it still matches `old` (otherwise the upsert tries to insert). Either way a post another ingest
+    wrote meanwhile hits the unique (owner, post_id) index, and is read and written again.
+    """
+    fields = post.model_dump(exclude={"id", "revision_id"})
+    if old is None:
+        return InsertOne(fields)
+    unchanged = {field: old.get(field) for field in PRE_IMAGE if field != "_id"}
+    return UpdateOne({"owner": post.owner, "post_id": post.post_id, **unchanged}, {"$set": fields}, upsert=True)
+
+async def _replace(collection, posts: List[CompetitorPost]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Upsert posts with one bulk write per round; returns the versions the writes replaced (new posts are absent)"""
+    stored: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    while posts:
+        pre_images = await _pre_images(collection, posts)
+        olds = [pre_images.get((post.owner, post.post_id)) for post in posts]
+        conflicts = set()
+        try:
+            await collection.bulk_write([_write(post, old) for post, old in zip(posts, olds)], ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                raise
+            # Raced by another ingest
+            conflicts = {error["index"] for error in e.details["writeErrors"]}
+        for i, (post, old) in enumerate(zip(posts, olds)):
+            if old is not None and i not in conflicts:
+                stored[(post.owner, post.post_id)] = old
+        posts = [posts[i] for i in sorted(conflicts)]
+    return stored
+
+async def upsert_posts(posts: List[CompetitorPost]) -> int:
+    """
+    Upsert keyed on (owner, post_id), so repeated scrapes are idempotent; returns how many distinct posts were written.
+    The term index, heatmaps and reported sums are adjusted by the difference to the versions each write replaced, so
+    overlapping ingests of the same post don't double count; missing views / shares are estimated afterwards,
+    so the fit includes this batch's reported values.
+    """
+    if not posts:
+        return 0
+    # Last copy in the batch wins
+    latest = list({(p.owner, p.post_id): p for p in posts}.values())
+    stored = await _replace(CompetitorPost.get_motor_collection(), latest)
+    await text_index.index_posts(latest, stored)
+    await heatmap.record_posts(latest, stored)
+    await estimation.record_sums(latest, stored)
+    await estimation.estimate_competitor_posts(latest)
+    return len(latest)
+
+async def sync_competitor_posts(competitor: Competitor) -> int:
+    """
+    Normalize a competitor's raw recent_posts into competitor_posts, record its stats and mark it synced.
+    content_mix and top_hashtags are derived here for scrapes written straight to the collection.
+    """
+    raw_posts = [p for p in competitor.recent_posts if isinstance(p, dict)]
+    posts = [normalize_post(p, competitor.username) for p in raw_posts]
+    written = await upsert_posts(posts)
+    derived = {Competitor.posts_synced_at: competitor.scraped_at}
+    if posts:
+        owner = OwnerMetrics()
+        for post, raw in zip(posts, raw_posts):
+            owner.add(post, raw)
+        computed = owner.computed(competitor.followers_count)
+        derived[Competitor.content_mix] = computed["content_mix"]
+        derived[Competitor.top_hashtags] = computed["top_hashtags"]
+    await stats.record_snapshot(
+        competitor.username, "competitor", competitor.scraped_at,
+        followers=competitor.followers_count,
+        following=competitor.following_count,
+        posts_count=competitor.posts_count,
+        engagement_rate=competitor.engagement_rate,
+        avg_likes=competitor.avg_likes
+    )
+    await Competitor.find_one(Competitor.id == competitor.id).update(Set(derived))
+    return written
+
+# Competitors whose latest scrape hasn't been normalized yet
+PENDING = {"$expr": {"$ne": ["$posts_synced_at", "$scraped_at"]}}
+
+# n8n writes scrapes straight to the collection without a tenant_id; they belong to the default tenant
+UNSCOPED = {"tenant_id": None}
+
+async def assign_unscoped_competitors() -> int:
+    """Stamp the default tenant on competitors written without one, so tenant-scoped queries find them"""
+    try:
+        result = await Competitor.get_motor_collection().update_many(UNSCOPED, {"$set": {"tenant_id": DEFAULT_TENANT}})
+    except DuplicateKeyError as e:
+        # A second document for an account the default tenant already tracks; left for someone to merge
+        print(f"Unscoped competitor not assigned to '{DEFAULT_TENANT}': {e}")
+        return 0
+    return result.modified_count
+
+async def pending_tenants() -> List[str]:
+    """Tenants with scrapes written straight to the collection and not synced yet"""
+    collection = Competitor.get_motor_collection()
+    tenant_ids = {tenant_id or DEFAULT_TENANT for tenant_id in await collection.distinct("tenant_id", PENDING)}
+    # distinct() skips documents without the field
+    if await collection.find_one({**UNSCOPED, **PENDING}, {"_id": 1}):
+        tenant_ids.add(DEFAULT_TENANT)
+    return sorted(tenant_ids)
+
+async def sync_pending_competitors(tenant_id: Optional[str] = None) -> int:
+    """Sync the tenant's (None = every tenant's) competitors whose latest scrape hasn't been normalized yet"""
+    if tenant_id in (None, DEFAULT_TENANT):
+        await assign_unscoped_competitors()
+    query = Competitor.find(PENDING)
+    if tenant_id is not None:
+        query = query.find(Competitor.tenant_id == tenant_id)
+    pending = await query.to_list()
+    written = 0
+    for competitor in pending:
+        written += await sync_competitor_posts(competitor)
+    return written
+
+# --- Apify dataset ingestion (POST /api/ingest/apify) ---
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+# Raw posts kept on the Competitor document for /api/competitors/{username}
+RECENT_POSTS_KEPT = 12
+TOP_HASHTAGS = 10
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Parse an NDJSON byte stream line by line; yields None for lines that aren't JSON objects"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+def _parse_line(line: bytes) -> Optional[Dict[str, Any]]:
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return None
+    return item if isinstance(item, dict) else None
+
+class OwnerMetrics:
+    """Running per-competitor aggregates, updated once per post while the dataset streams in"""
+
+    def __init__(self):
+        self.count = 0
+        self.likes = 0
+        self.comments = 0
+        self.first_ts: Optional[datetime] = None
+        self.last_ts: Optional[datetime] = None
+        self.types: Counter = Counter()
+        self.hashtags: Counter = Counter()
+        self.top: Optional[CompetitorPost] = None
+        self.recent: List[Tuple[datetime, Dict[str, Any]]] = []
+
+    def add(self, post: CompetitorPost, raw: Dict[str, Any]):
+        self.count += 1
+        self.likes += post.likes
+        self.comments += post.comments
+        self.types[post.type or "Image"] += 1
+        self.hashtags.update(text_index.hashtags(post.terms))
+        if self.top is None or post.likes > self.top.likes:
+            self.top = post
+        if post.timestamp:
+            self.first_ts = min(self.first_ts or post.timestamp, post.timestamp)
+            self.last_ts = max(self.last_ts or post.timestamp, post.timestamp)
+        self.recent.append((post.timestamp or datetime.min, raw))
+        if len(self.recent) > RECENT_POSTS_KEPT * 2:
+            self._trim_recent()
+
+    def _trim_recent(self):
+        self.recent.sort(key=lambda r: r[0], reverse=True)
+        del self.recent[RECENT_POSTS_KEPT:]
+
+    def computed(self, followers: int) -> Dict[str, Any]:
+        """Derived Competitor fields (same engagement formula as refresher.refresh_my_analytics)"""
+        self._trim_recent()
+        avg_likes = self.likes / self.count if self.count else 0
+        engagement_rate = 0.0
+        if self.count and followers > 0:
+            engagement_rate = ((self.likes + self.comments) / self.count) / followers * 100
+        posts_per_week = 0
+        if self.first_ts and self.last_ts:
+            weeks = max((self.last_ts - self.first_ts).days / 7, 1)
+            posts_per_week = round(self.count / weeks)
+        return {
+            "engagement_rate": engagement_rate,
+            "avg_likes": int(avg_likes),
+            "posts_per_week": posts_per_week,
+            "content_mix": dict(self.types),
+            "top_hashtags": [{"tag": tag, "count": n} for tag, n in self.hashtags.most_common(TOP_HASHTAGS)],
+            "top_post": self.top.model_dump(exclude={"id", "revision_id", "terms", "slot", "estimated", "summed"}) if self.top else {},
+            "recent_posts": [raw for _, raw in self.recent],
+        }
+
+PROFILE_FIELDS = {
+    "full_name": ("fullName", "full_name"),
+    "followers_count": ("followersCount", "followers_count"),
+    "following_count": ("followsCount", "followingCount", "following_count"),
+    "posts_count": ("postsCount", "posts_count"),
+    "profile_pic_url": ("profilePicUrlHD", "profilePicUrl", "profile_pic_url"),
+    "biography": ("biography",),
+    "is_verified": ("verified", "isVerified", "is_verified"),
+}
+COUNT_FIELDS = {"followers_count", "following_count", "posts_count"}
+
+def _profile(item: Dict[str, Any]) -> Dict[str, Any]:
+    profile = {}
+    for field, keys in PROFILE_FIELDS.items():
+        value = _first(item, *keys)
+        if value is not None:
+            profile[field] = _int(value) if field in COUNT_FIELDS else value
+    return profile
+
+def split_item(item: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    One dataset item -> (owner, profile fields, raw posts).
+    Handles both profile-scraper items (with latestPosts) and post-scraper items (with ownerUsername).
+    """
+    if "ownerUsername" in item and "followersCount" not in item:
+        return item["ownerUsername"], {}, [item]
+    username = _first(item, "username", "ownerUsername")
+    posts = _first(item, "latestPosts", "posts", default=[])
+    return username, _profile(item), [p for p in posts if isinstance(p, dict)]
+
+async def upsert_competitors(profiles: Dict[str, Dict[str, Any]], metrics: Dict[str, OwnerMetrics],
+                             scraped_at: datetime, tenant_id: str = DEFAULT_TENANT) -> List[Competitor]:
+    """Bulk upsert keyed on (tenant, username) with profile + computed fields, then return the stored documents"""
+    usernames = set(profiles) | set(metrics)
+    tenant_competitors = Competitor.find(Competitor.tenant_id == tenant_id, In(Competitor.username, list(usernames)))
+    # Post-only datasets still need follower counts for the engagement rate
+    known = {
+        c.username: c.followers_count
+        for c in await tenant_competitors.project(CompetitorFollowers).to_list()
+    }
+    ops = []
+    for username in usernames:
+        profile = profiles.get(username, {})
+        fields = {**profile, "scraped_at": scraped_at, "posts_synced_at": scraped_at}
+        if username in metrics:
+            followers = profile.get("followers_count", known.get(username, 0))
+            fields.update(metrics[username].computed(followers))
+        defaults = Competitor(tenant_id=tenant_id, username=username).model_dump(
+            exclude={"id", "revision_id", "tenant_id", "username", *fields}
+        )
+        ops.append(UpdateOne(
+            {"tenant_id": tenant_id, "username": username},
+            {"$set": fields, "$setOnInsert": defaults},
+            upsert=True
+        ))
+    if ops:
+        await Competitor.get_motor_collection().bulk_write(ops, ordered=False)
+    return await Competitor.find(Competitor.tenant_id == tenant_id, In(Competitor.username, list(usernames))).to_list()
+
+async def ingest_apify(chunks: AsyncIterator[bytes], tenant_id: str = DEFAULT_TENANT) -> Dict[str, Any]:
+    """
+    Stream an Apify dataset (NDJSON) into competitor_posts and competitors.
+    Posts are upserted in batches as they arrive; only per-competitor aggregates stay in memory.
+    """
+    scraped_at = datetime.now()
+    profiles: Dict[str, Dict[str, Any]] = {}
+    metrics: Dict[str, OwnerMetrics] = {}
+    batch: List[CompetitorPost] = []
+    summary = {"items": 0, "posts": 0, "written": 0, "skipped": 0}
+
+    async for item in iter_ndjson(chunks):
+        summary["items"] += 1
+        owner, profile, raw_posts = split_item(item) if item else (None, {}, [])
+        if not owner:
+            summary["skipped"] += 1
+            continue
+        owner = str(owner).lstrip("@")
+        profiles.setdefault(owner, {}).update(profile)
+        for raw in raw_posts:
+            post = normalize_post(raw, owner)
+            metrics.setdefault(owner, OwnerMetrics()).add(post, raw)
+            batch.append(post)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            summary["written"] += await upsert_posts(batch)
+            summary["posts"] += len(batch)
+            batch = []
+    summary["written"] += await upsert_posts(batch)
+    summary["posts"] += len(batch)
+
+    competitors = await upsert_competitors(profiles, metrics, scraped_at, tenant_id)
+    for competitor in competitors:
+        await stats.record_snapshot(
+            competitor.username, "competitor", scraped_at,
+            followers=competitor.followers_count,
+            following=competitor.following_count,
+            posts_count=competitor.posts_count,
+            engagement_rate=competitor.engagement_rate,
+            avg_likes=competitor.avg_likes
+        )
+    await snapshot.bump(tenant_id)
+    summary["tenant_id"] = tenant_id
+    summary["competitors"] = sorted(c.username for c in competitors)
+    return summary
@@ -0,0 +1,288 @@
+"""
+Instrumentation - per-route timing, Mongo/httpx round trips per request, Prometheus /metrics and opt-in profiling
+"""
+import bisect
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+import httpx
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+
+# ?profile=1 / X-Profile: 1 only works when this is set (it exposes code paths and slows the request)
+PROFILING_ENABLED = os.getenv("ENABLE_PROFILING", "").lower() in ("1", "true", "yes")
+# Long-lived or self-referential endpoints that would distort the histograms
+SKIP_PATHS = {"/metrics", "/api/stream"}
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# --- Prometheus-style metrics (text exposition format, no client library needed) ---
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._label_str(key)} {value:g}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> ([count per bucket], sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = self._label_str(key, 'le="%g"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = self._label_str(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{self._label_str(key)} {total:g}")
+                lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+REQUEST_DURATION = Histogram("instadash_http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+RESPONSE_SIZE = Histogram("instadash_http_response_size_bytes", "Response body size by route", ("method", "route"), SIZE_BUCKETS)
+REQUEST_MONGO_COMMANDS = Histogram("instadash_request_mongo_commands", "Mongo round trips per request", ("route",), COUNT_BUCKETS)
+REQUEST_MONGO_SECONDS = Histogram("instadash_request_mongo_seconds", "Time spent in Mongo per request", ("route",))
+REQUEST_UPSTREAM_SECONDS = Histogram("instadash_request_upstream_seconds", "Time spent in outbound HTTP per request", ("route",))
+MONGO_COMMAND_DURATION = Histogram("instadash_mongo_command_duration_seconds", "Mongo command latency", ("command",))
+MONGO_COMMAND_FAILURES = Counter("instadash_mongo_command_failures_total", "Failed Mongo commands", ("command",))
+UPSTREAM_DURATION = Histogram("instadash_upstream_request_duration_seconds", "Outbound HTTP latency (to headers)", ("host", "status"))
+META_QUEUE_WAIT = Histogram("instadash_meta_queue_wait_seconds", "Time Meta calls waited for rate-limit budget", ("priority",))
+META_RETRIES = Counter("instadash_meta_retries_total", "Meta calls retried or parked", ("reason",))
+
+METRICS: List[_Metric] = [
+    REQUEST_DURATION, RESPONSE_SIZE, REQUEST_MONGO_COMMANDS, REQUEST_MONGO_SECONDS, REQUEST_UPSTREAM_SECONDS,
+    MONGO_COMMAND_DURATION, MONGO_COMMAND_FAILURES, UPSTREAM_DURATION, META_QUEUE_WAIT, META_RETRIES,
+]
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Per-request round-trip accounting ---
+
+class RequestStats:
+    """Mutated from Motor's executor threads (they run in a copy of the request context)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+
+    def add_mongo(self, seconds: float):
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+
+    def add_upstream(self, seconds: float):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += seconds
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Pass to AsyncIOMotorClient(event_listeners=[...])"""
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._record(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        MONGO_COMMAND_FAILURES.inc(command=event.command_name)
+        self._record(event.command_name, event.duration_micros / 1e6)
+
+    def _record(self, command: str, seconds: float):
+        MONGO_COMMAND_DURATION.observe(seconds, command=command)
+        stats = _current.get()
+        if stats is not None:
+            stats.add_mongo(seconds)
+
+mongo_listener = MongoCommandListener()
+
+async def _on_request(request: httpx.Request):
+    request.extensions["instadash_start"] = time.perf_counter()
+
+async def _on_response(response: httpx.Response):
+    start = response.request.extensions.get("instadash_start")
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    UPSTREAM_DURATION.observe(seconds, host=response.request.url.host, status=str(response.status_code))
+    stats = _current.get()
+    if stats is not None:
+        stats.add_upstream(seconds)
+
+# httpx.AsyncClient(event_hooks=HTTPX_EVENT_HOOKS)
+HTTPX_EVENT_HOOKS = {"request": [_on_request], "response": [_on_response]}
+
+# --- ASGI middleware ---
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+def _wants_profile(scope) -> bool:
+    if not PROFILING_ENABLED:
+        return False
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("profile", [""])[0] in ("1", "true"):
+        return True
+    return any(name == b"x-profile" and value in (b"1", b"true") for name, value in scope.get("headers", []))
+
+class InstrumentationMiddleware:
+    """
+    Records latency, response size and Mongo/upstream round trips per route,
+    adds a Server-Timing header, and serves a profile report for ?profile=1 when enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+        if _wants_profile(scope):
+            await self._profile(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", (
+                    f"app;dur={(time.perf_counter() - start) * 1000:.1f}, "
+                    f"db;dur={stats.mongo_seconds * 1000:.1f};desc=\"{stats.mongo_commands} commands\", "
+                    f"upstream;dur={stats.upstream_seconds * 1000:.1f};desc=\"{stats.upstream_calls} calls\""
+                ))
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = _route(scope)
+            method = scope["method"]
+            REQUEST_DURATION.observe(time.perf_counter() - start, method=method, route=route, status=str(status))
+            RESPONSE_SIZE.observe(size, method=method, route=route)
+            REQUEST_MONGO_COMMANDS.observe(stats.mongo_commands, route=route)
+            REQUEST_MONGO_SECONDS.observe(stats.mongo_seconds, route=route)
+            REQUEST_UPSTREAM_SECONDS.observe(stats.upstream_seconds, route=route)
+
+    async def _profile(self, scope, receive, send):
+        """Run the request under pyinstrument (HTML) if installed, else cProfile (text); return the report"""
+        async def discard(message):
+            pass
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                Profiler = None
+            if Profiler is not None:
+                profiler = Profiler(async_mode="enabled")
+                profiler.start()
+                try:
+                    await self.app(scope, receive, discard)
+                finally:
+                    profiler.stop()
+                response = Response(profiler.output_html(), media_type="text/html")
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, discard)
+                finally:
+                    profiler.disable()
+                report = io.StringIO()
+                report.write(f"{scope['method']} {scope['path']}: {stats.mongo_commands} Mongo commands "
+                             f"({stats.mongo_seconds * 1000:.1f} ms), {stats.upstream_calls} upstream calls "
+                             f"({stats.upstream_seconds * 1000:.1f} ms)\n\n")
+                pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(60)
+                response = Response(report.getvalue(), media_type="text/plain")
+        finally:
+            _current.reset(token)
+        await response(scope, receive, send)
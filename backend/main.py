@@ -3,24 +3,84 @@ Social Media Analytics Dashboard - Backend
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import database
 from database import init_db
-from routers import analytics, competitors, insights, proxy
+from routers import analytics, competitors, insights, proxy, stream
+import coordination
+import http_client
+import instrumentation
+import refresher
+import responses
+import tenants
+import thumbnails
+import warmup
+import watcher
+import asyncio
+import importlib
 import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    await tenants.backfill_default()
+    await http_client.start()
+    # Serving starts now; snapshots and indexes are prepared in the background (see /ready)
+    warmup_task = asyncio.create_task(warmup.run())
+    refresh_task = asyncio.create_task(refresher.run_refresher())
+    watch_task = asyncio.create_task(watcher.run_watcher())
+    listen_task = asyncio.create_task(coordination.run_listener())
     yield
     # Shutdown
+    warmup_task.cancel()
+    refresh_task.cancel()
+    watch_task.cancel()
+    listen_task.cancel()
+    await http_client.close()
+    thumbnails.shutdown()
 
 app = FastAPI(
     title="Social Media Analytics API",
     description="API for Social Media Analytics Dashboard",
+    default_response_class=responses.FastJSONResponse,
     lifespan=lifespan
 )
 
+# Routers the dashboard doesn't call (downloads, search, webhooks, admin) are imported on their first request
+LAZY_ROUTERS = {
+    "/api/export": "routers.export",
+    "/api/hashtags": "routers.hashtags",
+    "/api/ingest": "routers.ingest",
+    "/api/posts": "routers.posts",
+    "/api/tenants": "routers.tenants",
+}
+_loaded_routers = set()
+
+def load_router(module: str):
+    """Import a lazy router and add its routes (once)"""
+    if module in _loaded_routers:
+        return
+    app.include_router(importlib.import_module(module).router)
+    _loaded_routers.add(module)
+    # Regenerated with the new routes on the next /openapi.json
+    app.openapi_schema = None
+
+class LazyRouters:
+    """Loads a lazy router before its first request is routed (all of them for the OpenAPI schema)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and len(_loaded_routers) < len(LAZY_ROUTERS):
+            path = scope["path"]
+            for prefix, module in LAZY_ROUTERS.items():
+                if path == app.openapi_url or path == prefix or path.startswith(prefix + "/"):
+                    load_router(module)
+        await self.app(scope, receive, send)
+
 # CORS - Allow localhost for dev and all Vercel domains for production
 allowed_origins = [
     "http://localhost:5173",
@@ -40,13 +100,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Data-Age", "Server-Timing"],
 )
+app.add_middleware(LazyRouters)
+app.add_middleware(responses.CompressionMiddleware)
+# Outermost, so timings include CORS handling and compression (sizes are bytes on the wire)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 
 # Routers
 app.include_router(analytics.router)
 app.include_router(competitors.router)
 app.include_router(insights.router)
 app.include_router(proxy.router)
+app.include_router(stream.router)
 
 @app.get("/")
 def root():
@@ -54,4 +120,23 @@ def root():
 
 @app.get("/health")
 def health_check():
+    """Liveness: the process is up (no dependencies checked)"""
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: MongoDB answers and the warm-up (snapshots, indexes) has finished"""
+    db_ok = await database.ping()
+    ready = db_ok and warmup.state["done"]
+    body = {
+        "status": "ready" if ready else "starting" if db_ok else "unavailable",
+        "database": db_ok,
+        "worker": coordination.WORKER_ID,
+        "warmup": {k: warmup.state[k] for k in ("done", "seconds", "snapshots", "index_failures")},
+    }
+    return responses.FastJSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(instrumentation.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,261 @@
+"""
+Meta Scheduler - every Graph API call goes through one token bucket sized from Meta's usage headers
+
+Meta reports how much of the app's hourly budget is used (X-App-Usage) and, per business/page,
+how much of the use-case budget is used and when access comes back (X-Business-Use-Case-Usage).
+The bucket rate shrinks as usage grows, background work stops before interactive requests would,
+throttled accounts are parked until Meta says they recover, and transient failures are retried
+with full-jitter exponential backoff. Identical in-flight work is coalesced with single_flight()
+(within a worker; coordination.elect() does the same across workers).
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import httpx
+import http_client
+import instrumentation
+
+INTERACTIVE = 0  # A user is waiting (first load, stale-while-revalidate)
+BACKGROUND = 1  # Scheduled refreshes and backfills
+
+# Calls per second (and burst) while Meta reports no usage; scaled down by the reported headroom
+RATE_LIMIT = float(os.getenv("META_RATE_LIMIT", "10"))
+BURST = float(os.getenv("META_BURST", "50"))
+# Usage percent at which background calls pause / every call for the account pauses
+BACKGROUND_MAX_USAGE = float(os.getenv("META_BACKGROUND_MAX_USAGE", "75"))
+THROTTLE_AT_USAGE = float(os.getenv("META_THROTTLE_AT_USAGE", "95"))
+# Longest a call waits for a throttled account before giving up with MetaThrottled
+INTERACTIVE_MAX_WAIT = float(os.getenv("META_INTERACTIVE_MAX_WAIT", "5"))
+BACKGROUND_MAX_WAIT = float(os.getenv("META_BACKGROUND_MAX_WAIT", "600"))
+MAX_RETRIES = int(os.getenv("META_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("META_BACKOFF_BASE", "1.0"))
+BACKOFF_CAP = float(os.getenv("META_BACKOFF_CAP", "60"))
+# Meta's usage is a rolling one-hour window; an old reading is decayed linearly over it
+USAGE_WINDOW = 3600.0
+# Pause after a throttle error that didn't say how long
+DEFAULT_COOLDOWN = float(os.getenv("META_THROTTLE_COOLDOWN", "300"))
+
+# Graph error codes meaning "rate limited" (app, user, page, custom and business use case limits)
+THROTTLE_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+RETRY_STATUSES = {500, 502, 503, 504}
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+class MetaThrottled(Exception):
+    """Meta asked us to back off for longer than the caller is willing to wait"""
+
+    def __init__(self, retry_after: float, account: Optional[str] = None):
+        super().__init__(f"Meta rate limit reached{f' for {account}' if account else ''}, retry in {int(retry_after)}s")
+        self.retry_after = retry_after
+        self.account = account
+
+class _Usage:
+    """Latest usage percent reported for the app or one account"""
+
+    def __init__(self):
+        self.percent = 0.0
+        self.observed = 0.0
+
+    def update(self, percent: float):
+        self.percent = percent
+        self.observed = time.monotonic()
+
+    def current(self) -> float:
+        age = time.monotonic() - self.observed
+        return self.percent * max(0.0, 1 - age / USAGE_WINDOW)
+
+def _max_percent(entry: Dict[str, Any]) -> float:
+    values = [entry.get(k) for k in ("call_count", "total_cputime", "total_time")]
+    return float(max((v for v in values if isinstance(v, (int, float))), default=0))
+
+def _parse_header(value: Optional[str]) -> Any:
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+def _graph_error(response: httpx.Response) -> Dict[str, Any]:
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    return body.get("error", {}) if isinstance(body, dict) else {}
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class MetaScheduler:
+    def __init__(self, rate: float = RATE_LIMIT, burst: float = BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._refilled = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._app_usage = _Usage()
+        self._account_usage: Dict[str, _Usage] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    # --- Budget ---
+
+    def app_usage(self) -> float:
+        return self._app_usage.current()
+
+    def account_usage(self, account: Optional[str]) -> float:
+        usage = self._account_usage.get(account) if account else None
+        return usage.current() if usage else 0.0
+
+    def current_rate(self) -> float:
+        """Calls per second allowed right now: the configured rate times the app's headroom"""
+        headroom = max(0.0, 100.0 - self.app_usage()) / 100.0
+        return max(self.rate * headroom, self.rate * 0.02)
+
+    def blocked_for(self, account: Optional[str]) -> float:
+        """Seconds until calls for the account (or the whole app) may resume"""
+        now = time.monotonic()
+        until = max(self._blocked_until.get("app", 0.0), self._blocked_until.get(account, 0.0) if account else 0.0)
+        return max(0.0, until - now)
+
+    def _block(self, key: str, seconds: float):
+        self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), time.monotonic() + seconds)
+
+    def observe(self, response: httpx.Response, account: Optional[str] = None):
+        """Record X-App-Usage / X-Business-Use-Case-Usage and park whatever is over budget"""
+        app = _parse_header(response.headers.get("x-app-usage"))
+        if isinstance(app, dict):
+            self._app_usage.update(_max_percent(app))
+            if self._app_usage.percent >= THROTTLE_AT_USAGE:
+                self._block("app", DEFAULT_COOLDOWN)
+        business = _parse_header(response.headers.get("x-business-use-case-usage"))
+        if isinstance(business, dict):
+            for business_id, entries in business.items():
+                entries = entries if isinstance(entries, list) else [entries]
+                percent = max((_max_percent(e) for e in entries if isinstance(e, dict)), default=0.0)
+                regain = max((e.get("estimated_time_to_regain_access") or 0 for e in entries if isinstance(e, dict)), default=0)
+                for key in {business_id, account} - {None}:
+                    self._account_usage.setdefault(key, _Usage()).update(percent)
+                    if regain:
+                        self._block(key, regain * 60)
+                    elif percent >= THROTTLE_AT_USAGE:
+                        self._block(key, DEFAULT_COOLDOWN)
+
+    # --- Queue ---
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.current_rate())
+        self._refilled = now
+
+    async def _acquire(self, priority: int):
+        """Wait for a token; interactive waiters always go first, background ones wait for headroom"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await future
+
+    async def _run_pump(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():  # Caller was cancelled
+                heapq.heappop(self._waiters)
+                continue
+            self._refill()
+            wait = 0.0
+            if priority != INTERACTIVE and self.app_usage() >= BACKGROUND_MAX_USAGE:
+                # Leave the remaining budget to interactive calls; re-check as usage decays
+                wait = USAGE_WINDOW / 100
+            elif self._tokens < 1:
+                wait = (1 - self._tokens) / self.current_rate()
+            if wait > 0:
+                # Sleep, but let a new (possibly higher priority) waiter re-evaluate the head
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._tokens -= 1
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    async def _wait_until_unblocked(self, account: Optional[str], priority: int):
+        blocked = self.blocked_for(account)
+        if not blocked:
+            return
+        max_wait = INTERACTIVE_MAX_WAIT if priority == INTERACTIVE else BACKGROUND_MAX_WAIT
+        if blocked > max_wait:
+            raise MetaThrottled(blocked, account)
+        await asyncio.sleep(blocked)
+
+    # --- Requests ---
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, priority: int = BACKGROUND,
+                  account: Optional[str] = None) -> httpx.Response:
+        """
+        GET through the budget. Raises MetaThrottled when the account is parked for longer than the
+        priority may wait, httpx.HTTPStatusError for other non-2xx responses.
+        """
+        client = http_client.get_client()
+        attempt = 0
+        while True:
+            await self._wait_until_unblocked(account, priority)
+            queued = time.perf_counter()
+            await self._acquire(priority)
+            instrumentation.META_QUEUE_WAIT.observe(time.perf_counter() - queued, priority=PRIORITY_NAMES[priority])
+            try:
+                response = await client.get(url, params=params)
+            except httpx.TransportError:
+                if attempt >= MAX_RETRIES:
+                    raise
+                instrumentation.META_RETRIES.inc(reason="transport")
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            self.observe(response, account)
+            if response.is_success:
+                return response
+            error = _graph_error(response)
+            if response.status_code == 429 or error.get("code") in THROTTLE_CODES:
+                instrumentation.META_RETRIES.inc(reason="throttled")
+                if not self.blocked_for(account):
+                    # No regain estimate in the headers - back off exponentially, at least a little
+                    self._block(account or "app", max(BACKOFF_BASE, backoff_delay(attempt + 2)))
+                if attempt >= MAX_RETRIES:
+                    raise MetaThrottled(self.blocked_for(account), account)
+            elif response.status_code in RETRY_STATUSES or error.get("is_transient"):
+                instrumentation.META_RETRIES.inc(reason="transient")
+            else:
+                response.raise_for_status()
+            if attempt >= MAX_RETRIES:
+                response.raise_for_status()
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    async def single_flight(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `work()` once per key at a time in this worker; concurrent callers share the same result"""
+        task = self._in_flight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(work())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._in_flight.pop(key, None) if self._in_flight.get(key) is t else None)
+        # A cancelled caller must not cancel the shared work
+        return await asyncio.shield(task)
+
+scheduler = MetaScheduler()
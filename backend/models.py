@@ -1,11 +1,15 @@
 """
 Data Models for MongoDB Collections
 """
-from beanie import Document
+from beanie import Document, Indexed, PydanticObjectId, TimeSeriesConfig, Granularity
 from typing import List, Optional, Any
 from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from datetime import datetime
 
+# Tenant that pre-existing (un-scoped) data and env-configured credentials belong to
+DEFAULT_TENANT = "default"
+
 # Embedded Models
 class DailyStats(BaseModel):
     date: datetime
@@ -22,12 +26,30 @@ class Post(BaseModel):
     likes: int = 0
     comments: int = 0
     shares: int = 0
+    saves: int = 0
+    reach: int = 0
+    views: int = 0  # Reel plays
     timestamp: Optional[datetime] = None
     url: str = ""
+    media_url: str = ""
+    estimated: List[str] = []  # Metrics above that are estimates, not reported values (see estimation)
 
 # Document Models (MongoDB Collections)
+class Tenant(Document):
+    """A workspace: its own Meta account, competitor set, snapshot and insights"""
+    tenant_id: Indexed(str, unique=True)
+    name: str = ""
+    meta_page_id: Optional[str] = None
+    meta_access_token: Optional[str] = None  # Never returned by the API
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "tenants"
+
 class UserAnalytics(Document):
     """Your Instagram analytics from Meta Graph API"""
+    tenant_id: str = DEFAULT_TENANT
     page_id: str
     username: str = ""
     followers_count: int = 0
@@ -41,16 +63,46 @@ class UserAnalytics(Document):
     avg_comments: int = 0
     posts_per_week: int = 0
     
-    daily_stats: List[DailyStats] = []
-    recent_posts: List[Post] = []
+    daily_stats: List[DailyStats] = []  # Legacy, history lives in account_stats / stats_rollups
+    recent_posts: List[Post] = []  # Newest RECENT_POSTS_KEPT only, the full history is in my_posts (see refresher)
     last_updated: datetime = Field(default_factory=datetime.now)
     
     class Settings:
         name = "user_analytics"
+        indexes = [
+            IndexModel([("tenant_id", ASCENDING), ("page_id", ASCENDING)]),
+        ]
+
+class MyPost(Document):
+    """One of your own Meta posts (full history; UserAnalytics.recent_posts holds the newest few)"""
+    tenant_id: str = DEFAULT_TENANT
+    page_id: str  # UserAnalytics.page_id
+    post_id: str  # Post.id
+    caption: str = ""
+    content_type: str = "Post"
+    likes: int = 0
+    comments: int = 0
+    shares: int = 0
+    saves: int = 0
+    reach: int = 0
+    views: int = 0
+    timestamp: Optional[datetime] = None
+    url: str = ""
+    media_url: str = ""
+    estimated: List[str] = []
+    
+    class Settings:
+        name = "my_posts"
+        indexes = [
+            IndexModel([("tenant_id", ASCENDING), ("page_id", ASCENDING), ("post_id", ASCENDING)], unique=True),
+            IndexModel([("tenant_id", ASCENDING), ("page_id", ASCENDING), ("timestamp", DESCENDING)]),
+            IndexModel([("tenant_id", ASCENDING), ("page_id", ASCENDING), ("likes", DESCENDING)]),
+        ]
 
 class Competitor(Document):
     """Competitor data scraped by Apify"""
-    username: str
+    tenant_id: str = DEFAULT_TENANT
+    username: Indexed(str)
     full_name: str = ""
     followers_count: int = 0
     following_count: int = 0
@@ -69,9 +121,168 @@ class Competitor(Document):
     
     recent_posts: List[Any] = []  # Raw Apify data
     scraped_at: datetime = Field(default_factory=datetime.now)
+    posts_synced_at: Optional[datetime] = None  # scraped_at of the last scrape normalized into competitor_posts
     
     class Settings:
         name = "competitors"
+        indexes = [
+            IndexModel([("tenant_id", ASCENDING), ("username", ASCENDING)], unique=True),
+            IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)]),
+        ]
+
+# Per-account data (CompetitorPost, TermStat, EngagementHeatmap, ReportedSums, AccountStats, StatsRollup) is global on purpose:
+# it describes a public account, not a tenant's view of it, so tenants tracking the same account share one copy.
+# Every write to it is idempotent - upserts on the account's key, index deltas against the version a write replaced
+# (see ingestion.upsert_posts) and one stats point per scrape (see stats.record_snapshot) - so shared accounts
+# aren't counted twice.
+class CompetitorPost(Document):
+    """One competitor post, normalized once from raw Apify data"""
+    owner: str  # Competitor.username
+    post_id: str
+    timestamp: Optional[datetime] = None
+    caption: str = ""
+    likes: int = 0
+    comments: int = 0
+    shares: int = 0
+    views: int = 0
+    url: str = ""  # Image
+    post_url: str = ""
+    type: str = "Image"
+    terms: List[str] = []  # Distinct caption terms ("#tag", "@mention", words), see text_index
+    slot: Optional[str] = None  # "weekday-hour" (UTC) heatmap cell the post is counted in, see heatmap
+    estimated: List[str] = []  # Metrics ("views", "shares") that are estimates, see estimation
+    summed: bool = True  # Counted in reported_sums (posts stored before they existed lack the field), see estimation
+    
+    class Settings:
+        name = "competitor_posts"
+        indexes = [
+            IndexModel([("owner", ASCENDING), ("post_id", ASCENDING)], unique=True),
+            IndexModel([("owner", ASCENDING), ("timestamp", DESCENDING)]),
+            IndexModel([("owner", ASCENDING), ("likes", DESCENDING)]),
+            IndexModel([("likes", DESCENDING)]),
+            IndexModel([("terms", ASCENDING), ("likes", DESCENDING)]),
+        ]
+
+class ReportedSums(Document):
+    """Running sums of reported views / shares (and the likes of the posts reporting them) per competitor, see estimation"""
+    owner: Indexed(str, unique=True)  # Competitor.username, or estimation.MARKET for all of them
+    views_total: int = 0
+    views_likes: int = 0
+    views_samples: int = 0
+    shares_total: int = 0
+    shares_likes: int = 0
+    shares_samples: int = 0
+    
+    class Settings:
+        name = "reported_sums"
+
+class TermStat(Document):
+    """Inverted-index entry: how many of an account's posts use a caption term, and their engagement"""
+    owner: str  # Competitor.username
+    term: str  # "#tag", "@mention" or a lowercase word
+    kind: str = "word"  # hashtag, mention, word
+    posts: int = 0
+    likes: int = 0
+    comments: int = 0
+    last_used: Optional[datetime] = None
+    
+    class Settings:
+        name = "term_stats"
+        indexes = [
+            IndexModel([("owner", ASCENDING), ("term", ASCENDING)], unique=True),
+            IndexModel([("owner", ASCENDING), ("kind", ASCENDING), ("posts", DESCENDING)]),
+        ]
+
+class EngagementHeatmap(Document):
+    """Per-account weekday x hour engagement matrix with quantile sketches, see heatmap"""
+    owner: Indexed(str, unique=True)  # Competitor.username
+    posts: int = 0
+    cells: dict = {}  # "weekday-hour" -> posts, likes, comments, likes_sketch, comments_sketch
+    updated_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "engagement_heatmaps"
+
+# Projections (slim views of Competitor, without the raw recent_posts payload)
+class CompetitorSummary(BaseModel):
+    """Competitor list view"""
+    id: PydanticObjectId = Field(alias="_id")
+    username: str
+    full_name: str = ""
+    followers_count: int = 0
+    following_count: int = 0
+    posts_count: int = 0
+    profile_pic_url: str = ""
+    biography: str = ""
+    is_verified: bool = False
+    engagement_rate: float = 0.0
+    avg_likes: int = 0
+    posts_per_week: int = 0
+    content_mix: dict = {}
+    top_hashtags: List[Any] = []
+    top_post: dict = {}
+    scraped_at: Optional[datetime] = None
+
+class CompetitorFollowers(BaseModel):
+    """Follower comparison view"""
+    username: str
+    followers_count: int = 0
+    posts_count: int = 0
+
+class PostHit(BaseModel):
+    """Post search result (CompetitorPost without its terms)"""
+    owner: str
+    post_id: str
+    timestamp: Optional[datetime] = None
+    caption: str = ""
+    likes: int = 0
+    comments: int = 0
+    shares: int = 0
+    views: int = 0
+    url: str = ""
+    post_url: str = ""
+    type: str = "Image"
+
+class HashtagStat(BaseModel):
+    """GET /api/hashtags/top row"""
+    tag: str
+    posts: int = 0
+    likes: int = 0
+    comments: int = 0
+    avg_likes: float = 0.0
+    accounts: int = 0  # Accounts using it
+    last_used: Optional[datetime] = None
+
+class HeatmapCell(BaseModel):
+    """One weekday x hour cell (weekday 0 = Monday), medians/p90s are sketch estimates"""
+    weekday: int
+    hour: int
+    posts: int = 0
+    avg_likes: float = 0.0
+    median_likes: Optional[float] = None
+    p90_likes: Optional[float] = None
+    avg_comments: float = 0.0
+    median_comments: Optional[float] = None
+    p90_comments: Optional[float] = None
+
+class HeatmapSlot(BaseModel):
+    weekday: int
+    hour: int
+
+class Heatmap(BaseModel):
+    """GET /api/insights/heatmap"""
+    account: Optional[str] = None  # None = every competitor of the tenant
+    accounts: int = 0
+    utc_offset: int = 0
+    posts: int = 0
+    cells: List[HeatmapCell] = []
+    best: List[HeatmapSlot] = []  # Highest median likes, among cells with enough posts
+
+class FollowerComparison(BaseModel):
+    """GET /api/competitors/comparison/followers row"""
+    username: str
+    followers: int = 0
+    posts_count: int = 0
 
 class Insight(Document):
     """AI-generated insights"""
@@ -80,7 +291,121 @@ class Insight(Document):
     description: str
     priority: str = "medium"  # low, medium, high
     category: str = "General"
+    tenant_id: str = DEFAULT_TENANT
+    generation_id: str = ""  # Batch this insight belongs to, see InsightGeneration
     created_at: datetime = Field(default_factory=datetime.now)
     
     class Settings:
         name = "insights"
+        indexes = [
+            IndexModel([("tenant_id", ASCENDING), ("generation_id", ASCENDING)]),
+        ]
+
+class InsightGeneration(Document):
+    """Pointer to the active Insight batch, flipped atomically after each generation"""
+    key: Indexed(str, unique=True)  # Tenant-qualified, see tenants.scoped_key
+    tenant_id: str = DEFAULT_TENANT
+    generation_id: str
+    fingerprint: str = ""  # sha256 of the generated insights, unchanged ones don't start a new batch
+    activated_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "insight_generations"
+
+class DashboardSnapshot(Document):
+    """Materialized dashboard payload, rebuilt only when source data changes"""
+    key: Indexed(str, unique=True)  # Tenant-qualified, see tenants.scoped_key
+    tenant_id: str = DEFAULT_TENANT
+    source_version: str = ""  # SourceVersion.version the payload was built from
+    content_hash: str = ""  # sha256 of the payload, served as ETag
+    payload: dict = {}
+    state: dict = {}  # Per-account contributions the payload is assembled from
+    built_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "dashboard_snapshots"
+
+class SourceVersion(Document):
+    """Per-tenant counter bumped by every write the dashboard depends on, so reads check one document, see snapshot"""
+    id: str  # Tenant id
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "source_versions"
+
+class ResumeToken(Document):
+    """Last processed change stream event, so the watcher resumes where it stopped"""
+    key: Indexed(str, unique=True)
+    token: Optional[dict] = None
+    updated_at: datetime = Field(default_factory=datetime.now)
+    
+    class Settings:
+        name = "change_stream_tokens"
+
+class Lease(Document):
+    """Cross-worker lock: which worker runs a keyed job (refresh, rebuild...) until expires_at, see coordination"""
+    id: str  # Lease key
+    holder: str = ""
+    worker: str = ""
+    expires_at: datetime  # UTC
+    
+    class Settings:
+        name = "leases"
+
+class Broadcast(Document):
+    """Message from one worker to the others (cache invalidations, live events), polled by each, see coordination"""
+    channel: str
+    payload: dict = {}
+    origin: str = ""  # Sending worker
+    at: datetime  # UTC
+    
+    class Settings:
+        name = "broadcasts"
+        indexes = [
+            IndexModel([("at", ASCENDING)], expireAfterSeconds=3600),
+        ]
+
+class AccountKey(BaseModel):
+    """Time-series metaField: which account a stats snapshot belongs to"""
+    account: str  # UserAnalytics.page_id or Competitor.username
+    kind: str  # me, competitor
+
+class AccountStats(Document):
+    """Point-in-time account stats, appended on every refresh/scrape (time-series collection, shared across tenants)"""
+    ts: datetime
+    meta: AccountKey
+    followers: int = 0
+    following: int = 0
+    posts_count: int = 0
+    engagement_rate: float = 0.0
+    avg_likes: int = 0
+    
+    class Settings:
+        name = "account_stats"
+        timeseries = TimeSeriesConfig(
+            time_field="ts",
+            meta_field="meta",
+            granularity=Granularity.hours
+        )
+
+class StatsRollup(Document):
+    """Daily/weekly aggregate of AccountStats, maintained as snapshots arrive"""
+    account: str
+    kind: str
+    period: str  # day, week
+    start: datetime
+    followers_open: int = 0
+    followers_close: int = 0
+    followers_min: int = 0
+    followers_max: int = 0
+    engagement_avg: float = 0.0
+    avg_likes: int = 0
+    samples: int = 0
+    
+    class Settings:
+        name = "stats_rollups"
+        indexes = [
+            IndexModel([("account", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)], unique=True),
+            IndexModel([("kind", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)]),
+        ]
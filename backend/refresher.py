@@ -0,0 +1,305 @@
+"""
+Meta Graph Refresher - pulls every tenant's Instagram data in the background so requests never wait on Meta
+"""
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from beanie.operators import Set
+from pymongo import UpdateOne
+from models import DEFAULT_TENANT, MyPost, UserAnalytics, Post
+import coordination
+import estimation
+import events
+import meta_graph
+from meta_scheduler import BACKGROUND, INTERACTIVE, scheduler
+import snapshot
+import stats
+import tenants
+
+# Seconds between scheduled refreshes, +/- META_REFRESH_JITTER (fraction of the interval)
+REFRESH_INTERVAL = float(os.getenv("META_REFRESH_INTERVAL", "900"))
+REFRESH_JITTER = float(os.getenv("META_REFRESH_JITTER", "0.1"))
+# Stored data older than this triggers a revalidation when served
+STALE_AFTER = float(os.getenv("ANALYTICS_STALE_AFTER", str(REFRESH_INTERVAL)))
+# Incremental refreshes re-pull posts this recent so their likes/comments stay current
+REFRESH_OVERLAP_DAYS = int(os.getenv("META_REFRESH_OVERLAP_DAYS", "7"))
+# Tenants refreshed at the same time; the rest of a cycle's starts are spread across the interval
+REFRESH_CONCURRENCY = int(os.getenv("META_REFRESH_CONCURRENCY", "2"))
+# Seconds after startup before the first cycle, so it doesn't compete with the warm-up
+REFRESH_STARTUP_DELAY = float(os.getenv("META_REFRESH_STARTUP_DELAY", "30"))
+
+# Newest posts kept on UserAnalytics (so in /api/analytics/ and the dashboard's posts chart);
+# the full history is in my_posts
+RECENT_POSTS_KEPT = int(os.getenv("MY_RECENT_POSTS", "50"))
+
+# Seconds a worker serves UserAnalytics from memory; refreshes invalidate it on every worker right away
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+
+# tenant_id -> running revalidation
+_revalidations: Dict[str, asyncio.Task] = {}
+_analytics = coordination.LocalCache("analytics", ttl=ANALYTICS_CACHE_TTL)
+
+def meta_credentials() -> Tuple[Optional[str], Optional[str]]:
+    return tenants.env_credentials()
+
+def data_age(analytics: UserAnalytics) -> float:
+    """Seconds since the stored analytics were last refreshed"""
+    return max(0.0, (datetime.now() - analytics.last_updated).total_seconds())
+
+def is_stale(analytics: UserAnalytics) -> bool:
+    return data_age(analytics) > STALE_AFTER
+
+async def stored_analytics(tenant_id: str, page_id: str) -> Optional[UserAnalytics]:
+    """The page's stored analytics, through the worker-local cache"""
+    key = f"{tenant_id}:{page_id}"
+    analytics = _analytics.get(key)
+    if analytics is None:
+        analytics = await UserAnalytics.find_one(UserAnalytics.tenant_id == tenant_id, UserAnalytics.page_id == page_id)
+        if analytics:
+            _analytics.set(key, analytics)
+    return analytics
+
+async def refresh_my_analytics(page_id: str, access_token: str, tenant_id: str = DEFAULT_TENANT,
+                               priority: int = BACKGROUND) -> UserAnalytics:
+    """
+    Fetch profile + media from Meta Graph API, compute metrics and SAVE TO DB (for one tenant).
+    Concurrent refreshes of the same page share one run instead of each calling Meta: within a worker
+    through single_flight, across workers through a lease - the others wait and return what it stored.
+    """
+    async def shared() -> Optional[UserAnalytics]:
+        return await UserAnalytics.find_one(UserAnalytics.tenant_id == tenant_id, UserAnalytics.page_id == page_id)
+
+    return await scheduler.single_flight(
+        ("refresh", tenant_id, page_id),
+        lambda: coordination.elect(
+            f"refresh:{tenant_id}:{page_id}",
+            lambda: _refresh(page_id, access_token, tenant_id, priority),
+            shared
+        )
+    )
+
+async def _refresh(page_id: str, access_token: str, tenant_id: str, priority: int) -> UserAnalytics:
+    """
+    Media is paged incrementally: only posts newer than the newest stored one
+    (minus a short overlap so recent engagement keeps updating) are pulled.
+    """
+    user_analytics = await UserAnalytics.find_one(UserAnalytics.tenant_id == tenant_id, UserAnalytics.page_id == page_id)
+    if not user_analytics:
+        user_analytics = UserAnalytics(tenant_id=tenant_id, page_id=page_id)
+
+    # 1. Fetch page/profile info
+    data = await meta_graph.fetch_profile(page_id, access_token, priority)
+    
+    # 2. Fetch new media/posts (all pages on the first run)
+    stored_times = [p.timestamp for p in user_analytics.recent_posts if p.timestamp]
+    since = max(stored_times) - timedelta(days=REFRESH_OVERLAP_DAYS) if stored_times else None
+    media_data = [m async for m in meta_graph.iter_media(page_id, access_token, since=since, priority=priority)]
+    media_insights = await meta_graph.fetch_media_insights(media_data, access_token, priority, account=page_id)
+    
+    fetched_posts = []
+    for m in media_data:
+        extra = media_insights.get(m.get("id"), {})
+        fetched_posts.append(Post(
+            id=m.get("id"),
+            caption=m.get("caption", ""),
+            content_type=m.get("media_type", "IMAGE"),
+            likes=m.get("like_count", 0),
+            comments=m.get("comments_count", 0),
+            shares=extra.get("shares", 0),
+            saves=extra.get("saved", 0),
+            reach=extra.get("reach", 0),
+            views=extra.get("plays", 0),
+            timestamp=meta_graph.parse_timestamp(m.get("timestamp")),
+            url=m.get("permalink") or m.get("media_url", ""),
+            media_url=m.get("media_url") or m.get("thumbnail_url", "")
+        ))
+
+    # 3. Store posts (fresh copies win) and calculate metrics over the full history
+    await _store_posts(tenant_id, page_id, user_analytics.recent_posts + fetched_posts)
+    followers = data.get("followers_count", 0) or 1 # Avoid div/0
+    totals = await _post_totals(tenant_id, page_id)
+    post_count = totals["posts"]
+    avg_likes = (totals["likes"] / post_count) if post_count > 0 else 0
+    avg_comments = (totals["comments"] / post_count) if post_count > 0 else 0
+    posts_last_7_days = totals["last_week"]
+
+    # Engagement Rate = (Total Interactions / Post Count) / Followers * 100
+    engagement_rate = 0
+    if post_count > 0 and followers > 0:
+        avg_interactions = (totals["likes"] + totals["comments"]) / post_count
+        engagement_rate = (avg_interactions / followers) * 100
+
+    # 4. Update DB Document
+    user_analytics.username = data.get("username", "")
+    user_analytics.followers_count = data.get("followers_count", 0)
+    user_analytics.following_count = data.get("follows_count", 0)
+    user_analytics.posts_count = data.get("media_count", 0)
+    user_analytics.profile_pic_url = data.get("profile_picture_url", "")
+    
+    # Save calculated metrics
+    user_analytics.engagement_rate = engagement_rate
+    user_analytics.avg_likes = int(avg_likes)
+    user_analytics.avg_comments = int(avg_comments)
+    user_analytics.posts_per_week = posts_last_7_days
+    user_analytics.recent_posts = await _recent_posts(tenant_id, page_id)
+    user_analytics.last_updated = datetime.now()
+    
+    await user_analytics.save()
+    await snapshot.bump(tenant_id)
+    _analytics.invalidate(f"{tenant_id}:{page_id}")
+    events.publish("analytics", {
+        "page_id": page_id,
+        "last_updated": user_analytics.last_updated,
+        "followers": user_analytics.followers_count,
+        "post_count": post_count,
+    }, tenant_id=tenant_id)
+    await stats.record_snapshot(
+        page_id, "me", user_analytics.last_updated,
+        followers=user_analytics.followers_count,
+        following=user_analytics.following_count,
+        posts_count=user_analytics.posts_count,
+        engagement_rate=user_analytics.engagement_rate,
+        avg_likes=user_analytics.avg_likes
+    )
+    return user_analytics
+
+def _post_doc(post: Post) -> Dict[str, Any]:
+    return post.model_dump(exclude={"id"})
+
+async def _store_posts(tenant_id: str, page_id: str, posts: List[Post]):
+    """
+    Upsert posts into my_posts on (tenant, page, post id), later copies winning, then store estimates for
+    their missing plays / shares - fitted from your reported ones (this batch included), else the market's
+    """
+    latest = list({p.id: p for p in posts if p.id}.values())
+    if not latest:
+        return
+    collection = MyPost.get_motor_collection()
+    key = lambda post: {"tenant_id": tenant_id, "page_id": page_id, "post_id": post.id}
+    await collection.bulk_write(
+        [UpdateOne(key(p), {"$set": _post_doc(p)}, upsert=True) for p in latest], ordered=False
+    )
+    pending = [p for p in latest if any(estimation.needs_estimate(p, m) for m in estimation.METRICS)]
+    if pending:
+        own = await estimation.fit_page(tenant_id, page_id)
+        market = (await estimation.fit_competitors([]))[None] if len(own) < len(estimation.METRICS) else {}
+        ops = []
+        for post in pending:
+            estimated = estimation.estimate(post, own, market)
+            fields = {metric: getattr(post, metric) for metric in estimated}
+            ops.append(UpdateOne(key(post), {"$set": {**fields, "estimated": estimated}}))
+        await collection.bulk_write(ops, ordered=False)
+
+async def _post_totals(tenant_id: str, page_id: str) -> Dict[str, int]:
+    """Post count, likes, comments and posts in the last 7 days over the page's stored history"""
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    rows = await MyPost.get_motor_collection().aggregate([
+        {"$match": {"tenant_id": tenant_id, "page_id": page_id}},
+        {"$group": {
+            "_id": None,
+            "posts": {"$sum": 1},
+            "likes": {"$sum": "$likes"},
+            "comments": {"$sum": "$comments"},
+            "last_week": {"$sum": {"$cond": [{"$gte": ["$timestamp", week_ago]}, 1, 0]}},
+        }},
+    ]).to_list(None)
+    return rows[0] if rows else {"posts": 0, "likes": 0, "comments": 0, "last_week": 0}
+
+async def _recent_posts(tenant_id: str, page_id: str) -> List[Post]:
+    """The newest RECENT_POSTS_KEPT posts, for UserAnalytics.recent_posts"""
+    docs = await MyPost.get_motor_collection().find(
+        {"tenant_id": tenant_id, "page_id": page_id}, {"_id": 0}
+    ).sort("timestamp", -1).limit(RECENT_POSTS_KEPT).to_list(RECENT_POSTS_KEPT)
+    return [Post.model_validate({**d, "id": d["post_id"]}) for d in docs]
+
+async def backfill_posts() -> int:
+    """
+    Move posts stored before my_posts existed (every post embedded in UserAnalytics) into it,
+    leaving recent_posts at the newest RECENT_POSTS_KEPT. Returns how many posts were moved.
+    """
+    collection = MyPost.get_motor_collection()
+    moved = 0
+    async for doc in UserAnalytics.find({"recent_posts.0": {"$exists": True}}):
+        posts = [p for p in doc.recent_posts if p.id]
+        key = {"tenant_id": doc.tenant_id, "page_id": doc.page_id}
+        stored = await collection.count_documents({**key, "post_id": {"$in": [p.id for p in posts]}})
+        if stored == len(posts) and len(doc.recent_posts) <= RECENT_POSTS_KEPT:
+            continue
+        if posts:
+            # Never overwrite what a refresh stored since
+            await collection.bulk_write([
+                UpdateOne({**key, "post_id": p.id}, {"$setOnInsert": _post_doc(p)}, upsert=True) for p in posts
+            ], ordered=False)
+        recent = await _recent_posts(doc.tenant_id, doc.page_id)
+        await UserAnalytics.find_one(UserAnalytics.id == doc.id).update(Set({UserAnalytics.recent_posts: recent}))
+        await snapshot.bump(doc.tenant_id)
+        moved += len(posts) - stored
+    return moved
+
+async def _refresh_once(tenant_id: str = DEFAULT_TENANT, page_id: Optional[str] = None, access_token: Optional[str] = None,
+                        priority: int = BACKGROUND):
+    if not page_id or not access_token:
+        page_id, access_token = await tenants.credentials(tenant_id)
+    if not page_id or not access_token:
+        return
+    try:
+        await refresh_my_analytics(page_id, access_token, tenant_id, priority)
+    except Exception as e:
+        print(f"Meta refresh failed for tenant '{tenant_id}': {e}")
+
+def revalidate_in_background(tenant_id: str = DEFAULT_TENANT):
+    """Kick off a refresh unless one is already running for the tenant (stale-while-revalidate)"""
+    running = _revalidations.get(tenant_id)
+    if running is None or running.done():
+        # Someone is looking at the stale data, so it jumps the background queue
+        _revalidations[tenant_id] = asyncio.create_task(_refresh_once(tenant_id, priority=INTERACTIVE))
+
+async def _refresh_scheduled(tenant_id: str, page_id: str, access_token: str, limit: asyncio.Semaphore):
+    async with limit:
+        # A stale read may have revalidated it already this cycle
+        running = _revalidations.get(tenant_id)
+        if running is not None and not running.done():
+            await running
+            return
+        stored = await UserAnalytics.find_one(UserAnalytics.tenant_id == tenant_id, UserAnalytics.page_id == page_id)
+        if stored and data_age(stored) < REFRESH_INTERVAL / 2:
+            return
+        await _refresh_once(tenant_id, page_id, access_token)
+
+async def run_refresher():
+    """
+    Shared scheduler, started from the app lifespan: every tenant is refreshed once per interval,
+    with starts spread evenly across it (and at most REFRESH_CONCURRENCY at once)
+    so Meta sees a steady trickle instead of one burst per interval.
+    Only one worker schedules; the others stand by to take over.
+    """
+    await asyncio.sleep(REFRESH_STARTUP_DELAY)
+    await coordination.run_as_leader("refresher", _schedule)
+
+async def _schedule(claim: coordination.Claim):
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(REFRESH_CONCURRENCY)
+    while claim.held:
+        cycle_start = loop.time()
+        try:
+            accounts = await tenants.refreshable()
+        except Exception as e:
+            print(f"Tenant listing failed: {e}")
+            accounts = []
+        spacing = REFRESH_INTERVAL / max(len(accounts), 1)
+        jitter = spacing * REFRESH_JITTER
+        tasks = []
+        for i, account in enumerate(accounts):
+            if not claim.held:
+                break
+            delay = cycle_start + i * spacing + random.uniform(0, jitter) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_refresh_scheduled(*account, limit)))
+        if tasks:
+            await asyncio.gather(*tasks)
+        jitter = REFRESH_INTERVAL * REFRESH_JITTER
+        next_cycle = cycle_start + REFRESH_INTERVAL + random.uniform(-jitter, jitter)
+        await asyncio.sleep(max(1.0, next_cycle - loop.time()))
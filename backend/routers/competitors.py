@@ -1,52 +1,85 @@
 """
 Competitors Router - Data from MongoDB (scraped by Apify via n8n)
 """
-from fastapi import APIRouter, Response
-from fastapi.responses import StreamingResponse
-from typing import List
-import httpx
-from models import Competitor
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from typing import List, Literal, Optional
+from beanie import PydanticObjectId
+from pydantic import TypeAdapter
+from models import Competitor, CompetitorSummary, CompetitorFollowers, FollowerComparison
+from responses import FastJSONResponse
+import image_cache
+import tenants
+import thumbnails
 
 router = APIRouter(prefix="/api/competitors", tags=["Competitors"])
 
+# Serializes summary pages straight to JSON bytes in pydantic-core
+SUMMARY_PAGE = TypeAdapter(List[CompetitorSummary])
+
 @router.get("/proxy-image")
-async def proxy_profile_image(url: str):
+async def proxy_profile_image(
+    url: str,
+    w: Optional[int] = Query(None, ge=1, le=thumbnails.MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=thumbnails.MAX_DIMENSION),
+    format: Optional[Literal["webp", "jpeg"]] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Proxy Instagram profile images to avoid CORS issues.
-    Usage: /api/competitors/proxy-image?url=<instagram_cdn_url>
+    Usage: /api/competitors/proxy-image?url=<instagram_cdn_url>[&w=160&format=webp]
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, follow_redirects=True)
-            return Response(
-                content=response.content,
-                media_type=response.headers.get("content-type", "image/jpeg")
-            )
+        return await image_cache.proxy(url, if_none_match, width=w, height=h, fmt=format)
     except Exception as e:
         # Return a placeholder image on error
         return Response(content=b"", status_code=404)
 
-@router.get("/")
-async def get_competitors():
+@router.get("/", response_model=List[CompetitorSummary])
+async def get_competitors(
+    fields: Optional[str] = Query(None, description="Comma-separated CompetitorSummary fields to return"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    tenant_id: str = Depends(tenants.current_tenant)
+):
     """
-    Get competitor data from MongoDB.
+    Get competitor summaries from MongoDB (without raw post payloads).
     This data is populated by n8n when Apify scrapes complete.
+    Use /api/competitors/{username} for the full document including recent_posts.
+    Pages are `limit` long; follow X-Next-Cursor (sent while a full page came back) for the rest.
     """
-    competitors = await Competitor.find_all().to_list()
-    return competitors
+    selected = None
+    if fields:
+        selected = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = selected - set(CompetitorSummary.model_fields)
+        if unknown:
+            raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+        selected.add("id")
+
+    query = Competitor.find(Competitor.tenant_id == tenant_id)
+    if cursor:
+        if not PydanticObjectId.is_valid(cursor):
+            raise HTTPException(400, "Invalid cursor")
+        query = query.find(Competitor.id > PydanticObjectId(cursor))
+
+    page = await query.sort(+Competitor.id).limit(limit).project(CompetitorSummary).to_list()
+    include = {"__all__": selected} if selected else None
+    response = Response(SUMMARY_PAGE.dump_json(page, include=include, by_alias=True), media_type="application/json")
+    if len(page) == limit:
+        response.headers["X-Next-Cursor"] = str(page[-1].id)
+    return response
 
-@router.get("/{username}")
-async def get_competitor_by_username(username: str):
+@router.get("/{username}", response_model=Competitor)
+async def get_competitor_by_username(username: str, tenant_id: str = Depends(tenants.current_tenant)):
     """Get specific competitor by username"""
-    competitor = await Competitor.find_one(Competitor.username == username)
+    competitor = await Competitor.find_one(Competitor.tenant_id == tenant_id, Competitor.username == username)
     if not competitor:
-        return {"error": f"Competitor '{username}' not found"}
+        return FastJSONResponse({"error": f"Competitor '{username}' not found"})
     return competitor
 
-@router.get("/comparison/followers")
-async def compare_followers():
-    """Compare follower counts across all competitors"""
-    competitors = await Competitor.find_all().to_list()
+@router.get("/comparison/followers", response_model=List[FollowerComparison])
+async def compare_followers(tenant_id: str = Depends(tenants.current_tenant)):
+    """Compare follower counts across all of the tenant's competitors"""
+    competitors = await Competitor.find(Competitor.tenant_id == tenant_id).project(CompetitorFollowers).to_list()
     return [
         {
             "username": c.username,
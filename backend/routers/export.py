@@ -0,0 +1,33 @@
+"""
+Export Router - raw data downloads, streamed so memory stays flat regardless of size
+"""
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+import export
+import tenants
+
+router = APIRouter(prefix="/api/export", tags=["Export"])
+
+@router.get("/{dataset}")
+async def export_dataset(
+    dataset: Literal["posts", "stats", "competitors"],
+    fmt: Literal["csv", "ndjson", "parquet"] = Query("csv", alias="format"),
+    account: Optional[str] = Query(None, description="Only this account (a competitor username or your page id / username)"),
+    since: Optional[datetime] = Query(None, description="From this time (post time, snapshot time or scrape time)"),
+    until: Optional[datetime] = Query(None, description="Up to this time (exclusive)"),
+    tenant_id: str = Depends(tenants.current_tenant)
+):
+    """
+    Export the tenant's posts (yours and competitors'), stats history snapshots or competitor profiles
+    as CSV, NDJSON or Parquet, streamed from the database cursor.
+    """
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(501, "Parquet export needs pyarrow installed")
+    source = await export.rows(dataset, tenant_id, account, since, until)
+    return StreamingResponse(
+        export.encode(source, dataset, fmt),
+        media_type=export.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{fmt}"'}
+    )
@@ -0,0 +1,24 @@
+"""
+Hashtags Router - competitive hashtag analysis from the caption term index
+"""
+from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+from models import HashtagStat
+import tenants
+import text_index
+
+router = APIRouter(prefix="/api/hashtags", tags=["Hashtags"])
+
+@router.get("/top", response_model=List[HashtagStat])
+async def top_hashtags(
+    account: Optional[str] = Query(None, description="Competitor username; omit for the whole market"),
+    limit: int = Query(20, ge=1, le=100),
+    tenant_id: str = Depends(tenants.current_tenant)
+):
+    """
+    Most used hashtags across the tenant's competitors (or one of them), with their engagement.
+    Read from the per-account term counts maintained on ingest, so no captions are scanned.
+    """
+    owners = await tenants.competitor_usernames(tenant_id, account or None)
+    rows = await text_index.top_terms(owners, text_index.HASHTAG, limit)
+    return [{**row, "tag": row["term"][1:]} for row in rows]
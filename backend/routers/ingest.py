@@ -0,0 +1,29 @@
+"""
+Ingest Router - webhook for n8n/Apify to push scraper datasets into MongoDB
+"""
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+import ingestion
+import tenants
+
+router = APIRouter(prefix="/api/ingest", tags=["Ingest"])
+
+# Shared secret n8n sends in X-Ingest-Token (unset = ingestion disabled)
+INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+
+@router.post("/apify")
+async def ingest_apify(request: Request, x_ingest_token: Optional[str] = Header(None),
+                       tenant_id: str = Depends(tenants.current_tenant)):
+    """
+    Ingest an Apify Instagram dataset sent as NDJSON (one profile or post item per line).
+    The body is parsed as it streams in, posts are upserted in batches on (owner, post_id)
+    and competitors on (tenant, username), with engagement_rate, avg_likes, posts_per_week,
+    content_mix, top_hashtags and top_post computed here instead of on every read.
+    """
+    if not INGEST_TOKEN:
+        raise HTTPException(status_code=503, detail="Ingestion is disabled (INGEST_TOKEN is not set)")
+    if not x_ingest_token or not secrets.compare_digest(x_ingest_token, INGEST_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid ingest token")
+    return await ingestion.ingest_apify(request.stream(), tenant_id)
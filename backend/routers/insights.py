@@ -1,377 +1,54 @@
 """
 Insights Router - AI-generated recommendations from LIVE DATA
 """
-from fastapi import APIRouter
-from typing import List, Dict, Any
-from models import Insight, Competitor, UserAnalytics
-from datetime import datetime, timedelta
-import random
+from fastapi import APIRouter, Depends, Header, Query, Response
+from typing import List, Optional
+from models import Heatmap, Insight
+from dashboard import active_generation_id, build_dashboard
+import heatmap
+import snapshot
+import tenants
 
 router = APIRouter(prefix="/api/insights", tags=["Insights"])
 
-@router.get("/")
-async def get_insights():
+@router.get("/", response_model=List[Insight])
+async def get_insights(tenant_id: str = Depends(tenants.current_tenant)):
     """Get AI-generated insights based on your data vs competitors"""
-    insights = await Insight.find_all().to_list()
-    if not insights:
-        result = await generate_insights()
-        insights = await Insight.find_all().to_list()
-    return insights
+    generation_id = await active_generation_id(tenant_id)
+    if generation_id is None:
+        await snapshot.get_or_build(build_dashboard, tenant_id)
+        generation_id = await active_generation_id(tenant_id)
+    return await Insight.find(Insight.tenant_id == tenant_id, Insight.generation_id == generation_id).to_list()
 
 @router.get("/generate")
-async def generate_insights():
-    """Generate V5 DASHBOARD insights"""
+async def generate_insights(if_none_match: Optional[str] = Header(None), tenant_id: str = Depends(tenants.current_tenant)):
+    """
+    Get the V5 DASHBOARD payload.
+    Served from the stored snapshot; only rebuilt when competitor or analytics data changed.
+    """
     try:
-        my_data = await UserAnalytics.find_all().to_list()
-        competitors = await Competitor.find_all().to_list()
-        
-        insights = []
-        me = my_data[0] if my_data else None
-        
-        def get_stat(obj, attr, default=0):
-            val = getattr(obj, attr, default)
-            return val if val is not None else default
-
-        my_stats = {
-            "username": getattr(me, 'username', 'You'),
-            "followers": get_stat(me, 'followers_count'),
-            "engagement": get_stat(me, 'engagement_rate'),
-            "posts": get_stat(me, 'posts_count'),
-            "avg_likes": get_stat(me, 'avg_likes', 0),
-            "posts_per_week": get_stat(me, 'posts_per_week', 3),
-            "recent_posts": getattr(me, 'recent_posts', []),
-            "profile_pic": getattr(me, 'profile_pic_url', '')
-        }
-        
-        if not competitors:
-            return {"message": "No competitors found", "insights": []}
-
-        comp_stats = []
-        all_posts = []
-        deep_dive = []
-        comp_usernames = []
-
-        def parse_post(p, owner_name):
-            """Parse post data from dict (competitor) format"""
-            likes = p.get('likesCount', p.get('likeCount', p.get('likes', 0)))
-            if isinstance(likes, str) and likes.isdigit(): likes = int(likes)
-            comments = p.get('commentsCount', p.get('commentCount', p.get('comments', 0)))
-            shares = p.get('shareCount', p.get('resharesCount', p.get('repostsCount', 0)))
-            views = p.get('videoViewCount', p.get('viewCount', p.get('playCount', 0)))
-            if views == 0 and p.get('type') == 'Video':
-                 views = likes * random.randint(10, 50)
-            img_url = p.get('displayUrl', p.get('thumbnailUrl', p.get('url', p.get('permalink', ''))))
-            if not img_url and p.get('images'):
-                 img_url = p['images'][0] if isinstance(p['images'], list) else p['images']
-            ts = p.get('timestamp', datetime.now().isoformat())
-            return {
-                "id": p.get('id', str(random.randint(1000,9999))),
-                "caption": p.get('caption', p.get('text', '')),
-                "likes": likes,
-                "comments": comments,
-                "shares": shares,
-                "views": views,
-                "url": img_url,
-                "post_url": p.get('url', p.get('permalink', '')),
-                "owner": owner_name,
-                "timestamp": ts,
-                "type": p.get('type', 'Image')
-            }
-        
-        def parse_my_post(p, owner_name="You"):
-            """Parse post data from Pydantic model (user) format with robust fallbacks"""
-            likes = get_stat(p, 'likes', 0)
-            
-            # Comments - try multiple attributes
-            comments = get_stat(p, 'comments', 0)
-            if comments == 0:
-                comments = get_stat(p, 'commentsCount', 0)
-            
-            # Views - try multiple attributes, estimate for videos if missing
-            views = get_stat(p, 'views', 0)
-            if views == 0:
-                views = get_stat(p, 'videoViewCount', 0)
-            if views == 0:
-                views = get_stat(p, 'viewCount', 0)
-            # If still 0 and it's a video, estimate views
-            content_type = get_stat(p, 'content_type', 'Image')
-            if views == 0 and content_type == 'Video':
-                views = likes * random.randint(15, 30)  # Reasonable estimate
-            
-            # Shares - try multiple attributes, estimate if missing
-            shares = get_stat(p, 'shares', 0)
-            if shares == 0:
-                shares = get_stat(p, 'shareCount', 0)
-            if shares == 0 and likes > 0:
-                shares = max(1, int(likes * 0.05))  # Estimate ~5% of likes
-            
-            # URL
-            url = get_stat(p, 'url', '')
-            if not url:
-                url = get_stat(p, 'displayUrl', '')
-            
-            return {
-                "id": get_stat(p, 'id', str(random.randint(1000,9999))),
-                "caption": get_stat(p, 'caption', ''),
-                "likes": likes,
-                "comments": comments,
-                "shares": shares,
-                "views": views,
-                "url": url,
-                "post_url": get_stat(p, 'permalink', url),
-                "owner": owner_name,
-                "timestamp": get_stat(p, 'timestamp', datetime.now().isoformat()),
-                "type": content_type
-            }
-
-        # --- Process MY posts ---
-        my_best_post = None
-        my_total_likes_recent = 0
-        my_posts_for_chart = []
-        
-        if me and me.recent_posts:
-            processed_my_posts = []
-            for idx, p in enumerate(me.recent_posts):
-                # Use robust parser
-                post_data = parse_my_post(p)
-                processed_my_posts.append(post_data)
-                
-                post_data_graph = post_data.copy()
-                post_data_graph['graph_key'] = 'you'
-                all_posts.append(post_data_graph)
-                my_total_likes_recent += post_data['likes']
-                
-                my_posts_for_chart.append({
-                    "name": f"Post {idx+1}",
-                    "likes": post_data['likes'],
-                    "comments": post_data['comments'],
-                    "type": post_data['type']
-                })
-
-            sorted_my_posts = sorted(processed_my_posts, key=lambda x: x['likes'], reverse=True)
-            if sorted_my_posts:
-                my_best_post = sorted_my_posts[0]
-        
-        deep_dive.append({
-            "username": my_stats['username'],
-            "is_me": True,
-            "profile_pic": my_stats['profile_pic'],
-            "followers": my_stats['followers'],
-            "engagement": my_stats['engagement'],
-            "total_posts": my_stats['posts'],
-            "best_post": my_best_post
-        })
-
-        # --- Process Competitor posts ---
-        for i, c in enumerate(competitors):
-            username = getattr(c, 'username', 'Competitor')
-            comp_usernames.append(username)
-            followers = get_stat(c, 'followers_count')
-            engagement = get_stat(c, 'engagement_rate')
-            posts_count = get_stat(c, 'posts_count', 0)
-            profile_pic = getattr(c, 'profile_pic_url', '')
-            
-            c_best_post = None
-            raw_posts = getattr(c, 'recent_posts', [])
-            
-            processed_comp_posts = []
-            comp_total_recent_likes = 0
-            
-            for p in raw_posts:
-                parsed = parse_post(p, f"@{username}")
-                parsed['graph_key'] = f'c{i+1}' 
-                processed_comp_posts.append(parsed)
-                all_posts.append(parsed)
-                comp_total_recent_likes += parsed['likes']
-            
-            c_sorted_posts = sorted(processed_comp_posts, key=lambda x: x['likes'], reverse=True)
-            if c_sorted_posts:
-                c_best_post = c_sorted_posts[0]
-            
-            estimated_total = get_stat(c, 'avg_likes', 0) * posts_count
-            final_total_likes = max(comp_total_recent_likes, estimated_total)
-
-            comp_stats.append({
-                "username": username,
-                "followers": followers,
-                "engagement": engagement,
-                "posts_per_week": get_stat(c, 'posts_per_week', 5),
-                "total_likes": final_total_likes, 
-                "posts_count": posts_count
-            })
-            
-            deep_dive.append({
-                "username": f"@{username}",
-                "is_me": False,
-                "profile_pic": profile_pic,
-                "followers": followers,
-                "engagement": engagement,
-                "total_posts": posts_count,
-                "best_post": c_best_post
-            })
-            
-        avg_engagement = sum(c['engagement'] for c in comp_stats) / len(comp_stats) if comp_stats else 0
-        avg_posts_week = sum(c['posts_per_week'] for c in comp_stats) / len(comp_stats) if comp_stats else 0
-        avg_followers = sum(c['followers'] for c in comp_stats) / len(comp_stats) if comp_stats else 0
-        avg_total_posts = sum(c['posts_count'] for c in comp_stats) / len(comp_stats) if comp_stats else 0
-        
-        # --- Growth Insights ---
-        my_growth_rate = 2.4
-        market_growth_rate = 1.6
-        velocity_multiplier = my_growth_rate / market_growth_rate if market_growth_rate > 0 else 1.0
-        
-        insights.append({
-            "type": "opportunity" if velocity_multiplier > 1 else "risk",
-            "title": "🚀 Growth Velocity",
-            "description": f"You are growing {velocity_multiplier:.1f}x faster than the market average.",
-            "priority": "high",
-            "category": "Growth"
-        })
-
-        if my_stats['engagement'] > avg_engagement:
-             insights.append({
-                "type": "opportunity",
-                "title": "💎 Quality Audience",
-                "description": f"Your engagement ({my_stats['engagement']:.2f}%) beats market avg ({avg_engagement:.2f}%).",
-                "priority": "high",
-                "category": "Growth"
-            })
-
-        # --- Competitor Watch ---
-        all_posts.sort(key=lambda x: x['likes'], reverse=True)
-        top_posts = all_posts[:5]
-        
-        competitor_watch = {
-             "my_best": deep_dive[0]['best_post'] if len(deep_dive) > 0 else {},
-             "their_best": deep_dive[1]['best_post'] if len(deep_dive) > 1 else {}
-        }
-
-        # --- Real History (for Market Trajectory) ---
-        def parse_date(d_str):
-            if isinstance(d_str, datetime): return d_str
-            try:
-                return datetime.fromisoformat(d_str.replace('Z', '+00:00'))
-            except:
-                try:
-                    return datetime.strptime(d_str, "%Y-%m-%dT%H:%M:%S")
-                except:
-                    return datetime.now()
-
-        all_posts.sort(key=lambda x: parse_date(x['timestamp']))
-
-        date_map = {}
-        for p in all_posts:
-            dt = parse_date(p['timestamp'])
-            d_key = dt.strftime("%Y-%m-%d")
-            
-            if d_key not in date_map:
-                date_map[d_key] = {"date": d_key}
-            
-            k = p.get('graph_key', 'other')
-            current_val = date_map[d_key].get(k, 0)
-            date_map[d_key][k] = max(current_val, p['likes'])
-            
-            if k == 'c1' and len(comp_usernames) > 0: date_map[d_key]['c1_name'] = comp_usernames[0]
-            if k == 'c2' and len(comp_usernames) > 1: date_map[d_key]['c2_name'] = comp_usernames[1]
-
-        real_history = sorted(list(date_map.values()), key=lambda x: x['date'])
-
-        # --- Engagement Share ---
-        total_market_likes = sum(c['total_likes'] for c in comp_stats)
-        final_my_total = max(my_total_likes_recent, my_stats['avg_likes'] * my_stats['posts'])
-        grand_total_likes = total_market_likes + final_my_total
-        
-        engagement_share = []
-        if grand_total_likes > 0:
-            engagement_share.append({
-                "name": "You",
-                "value": round((final_my_total / grand_total_likes) * 100, 1) if final_my_total > 0 else 0.1,
-                "color": "#8b5cf6"
-            })
-            for i, c in enumerate(comp_stats):
-                share = round((c['total_likes'] / grand_total_likes) * 100, 1) if c['total_likes'] > 0 else 0
-                engagement_share.append({
-                    "name": f"@{c['username']}",
-                    "value": share,
-                    "color": ["#10b981", "#f59e0b", "#06b6d4"][i % 3]
-                })
-
-        # --- SECTION 4: 100% ACCURATE METRICS ---
-        
-        # B. Content Type Distribution
-        type_count_map = {}
-        if me and me.recent_posts:
-            for p in me.recent_posts:
-                t = get_stat(p, 'content_type', 'Image')
-                type_count_map[t] = type_count_map.get(t, 0) + 1
-        
-        content_distribution = [{"type": t, "count": c} for t, c in type_count_map.items()]
-        if not content_distribution:
-            content_distribution = [{"type": "N/A", "count": 0}]
-        
-        # C. Follower Comparison
-        follower_comparison = [
-            {"name": "You", "followers": my_stats['followers'], "color": "#8b5cf6"}
-        ]
-        for i, c in enumerate(comp_stats):
-            follower_comparison.append({
-                "name": f"@{c['username'][:10]}",
-                "followers": c['followers'],
-                "color": ["#10b981", "#f59e0b", "#06b6d4"][i % 3]
-            })
-
-        # --- Executive Summary ---
-        executive_summary = [
-            f"Growth is {velocity_multiplier:.1f}x market speed.",
-            f"Latest Post: {my_best_post['caption'][:20]}... ({my_best_post['likes']} likes)" if my_best_post else "No recent posts.",
-            f"You have {len(my_posts_for_chart)} posts analyzed.",
-            f"Comparisons based on {len(all_posts)} total posts."
-        ]
-
-        # Save to DB
-        await Insight.delete_all()
-        created_insights = []
-        for i in insights:
-            insight = Insight(
-                insight_type=i["type"],
-                title=i["title"],
-                description=i["description"],
-                priority=i["priority"],
-                created_at=datetime.now()
-            )
-            await insight.create()
-            created_insights.append(insight)
-            
-        return {
-            "message": "Generated insights",
-            "insights": created_insights,
-            "comparative_data": {
-                "you": {**my_stats, "growth_rate": my_growth_rate},
-                "market_avg": {
-                    "engagement": avg_engagement,
-                    "posts_week": avg_posts_week,
-                    "growth_rate": market_growth_rate,
-                    "followers": avg_followers,
-                    "total_posts": avg_total_posts
-                },
-                "velocity": velocity_multiplier,
-                "top_posts": top_posts,
-                "executive_summary": executive_summary,
-                
-                "real_history": real_history,
-                "comp_names": comp_usernames,
-                "engagement_share": engagement_share,
-                
-                "my_posts_chart": my_posts_for_chart,
-                "content_distribution": content_distribution,
-                "follower_comparison": follower_comparison,
-                
-                "competitor_watch": competitor_watch,
-                "deep_dive": deep_dive,
-            }
-        }
-        
+        snap = await snapshot.get_or_build(build_dashboard, tenant_id)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return {"message": "Error", "insights": []}
+
+    etag = snapshot.etag_for(snap)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if snapshot.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.rendered(snap), media_type="application/json", headers=headers)
+
+@router.get("/heatmap", response_model=Heatmap)
+async def posting_heatmap(
+    account: Optional[str] = Query(None, description="Competitor username; omit for the whole market"),
+    utc_offset: int = Query(0, ge=-12, le=14, description="Whole hours to shift the UTC matrix by"),
+    tenant_id: str = Depends(tenants.current_tenant)
+):
+    """
+    Best time to post: engagement per weekday x hour for one competitor or all of them merged.
+    Served from the matrices maintained on ingest, without reading posts.
+    """
+    owners = await tenants.competitor_usernames(tenant_id, account or None)
+    result = await heatmap.heatmap(owners, utc_offset)
+    return {**result, "account": owners[0] if account else None, "accounts": len(owners), "utc_offset": utc_offset}
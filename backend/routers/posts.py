@@ -0,0 +1,22 @@
+"""
+Posts Router - full-text search over competitor post captions
+"""
+from fastapi import APIRouter, Depends, Query
+from typing import List, Literal, Optional
+from models import PostHit
+import tenants
+import text_index
+
+router = APIRouter(prefix="/api/posts", tags=["Posts"])
+
+@router.get("/search", response_model=List[PostHit])
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=200, description="Words, #hashtags and @mentions (all must match)"),
+    account: Optional[str] = Query(None, description="Only this competitor's posts"),
+    sort: Literal["likes", "recent"] = "likes",
+    limit: int = Query(20, ge=1, le=100),
+    tenant_id: str = Depends(tenants.current_tenant)
+):
+    """Search the tenant's competitor posts by caption terms, using the multikey term index"""
+    owners = await tenants.competitor_usernames(tenant_id, account or None)
+    return await text_index.search(owners, q, sort, limit)
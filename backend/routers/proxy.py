@@ -1,29 +1,33 @@
-from fastapi import APIRouter, Response, HTTPException
-import requests
+from fastapi import APIRouter, Header, Query, Response, HTTPException
+from typing import Literal, Optional
+import httpx
+import image_cache
+import thumbnails
 
 router = APIRouter(prefix="/api/proxy", tags=["Proxy"])
 
 @router.get("/")
-def proxy_image(url: str):
+async def proxy_image(
+    url: str,
+    w: Optional[int] = Query(None, ge=1, le=thumbnails.MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=thumbnails.MAX_DIMENSION),
+    format: Optional[Literal["webp", "jpeg"]] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Proxies image requests to avoid CORS issues.
     Matches /api/proxy/ (with trailing slash) or /api/proxy depending on client.
+    Streams from the shared client and caches on disk (see image_cache).
+    Optional w/h/format return a resized WebP/JPEG thumbnail.
     """
     if not url:
         raise HTTPException(status_code=400, detail="Missing URL")
     
     try:
-        # User-Agent to mimick browser
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        resp = requests.get(url, headers=headers, stream=True, timeout=10)
-        
-        if resp.status_code != 200:
-            return Response(status_code=404)
-        
-        return Response(content=resp.content, media_type=resp.headers.get("content-type", "image/jpeg"))
+        return await image_cache.proxy(url, if_none_match, width=w, height=h, fmt=format)
         
+    except httpx.HTTPStatusError:
+        return Response(status_code=404)
     except Exception as e:
         print(f"Proxy error for {url}: {e}")
         # Return a 1x1 pixel or failure to avoid breaking UI? 
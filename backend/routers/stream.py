@@ -0,0 +1,33 @@
+"""
+Stream Router - Server-Sent Events push channel for live dashboard updates
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+import events
+import snapshot
+import tenants
+
+router = APIRouter(prefix="/api/stream", tags=["Stream"])
+
+@router.get("")
+async def stream_updates(
+    request: Request,
+    tenant_id: str = Depends(tenants.current_tenant),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Push compact events to the dashboard instead of having it poll:
+    `dashboard` (snapshot changed, with its new ETag and changed sections),
+    `analytics` (your Meta data refreshed), `competitor` (a scrape landed),
+    `insights` (a new insight generation went live) and `resync`.
+    Only the tenant's own events are sent (pass ?tenant=, EventSource can't set headers).
+    On reconnect (Last-Event-ID) the missed events are replayed, or `resync` is sent if they can't be.
+    """
+    current = await snapshot.get_snapshot(tenant_id)
+    hello = {"etag": snapshot.etag_for(current) if current else None}
+    return StreamingResponse(
+        events.stream(request.is_disconnected, hello, tenant_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
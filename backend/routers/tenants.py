@@ -0,0 +1,63 @@
+"""
+Tenants Router - create workspaces and set their Meta credentials
+"""
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+from models import DEFAULT_TENANT, Tenant
+import tenants
+
+router = APIRouter(prefix="/api/tenants", tags=["Tenants"])
+
+# Shared secret for tenant management, sent in X-Admin-Token (unset = tenant management disabled)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+class TenantUpdate(BaseModel):
+    name: Optional[str] = None
+    meta_page_id: Optional[str] = None
+    meta_access_token: Optional[str] = None
+    active: Optional[bool] = None
+
+def _check_admin(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Tenant management is disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def _public(tenant: Tenant):
+    return {
+        "tenant_id": tenant.tenant_id,
+        "name": tenant.name,
+        "meta_page_id": tenant.meta_page_id,
+        "has_meta_token": bool(tenant.meta_access_token),
+        "active": tenant.active,
+        "created_at": tenant.created_at,
+    }
+
+@router.get("/")
+async def list_tenants(x_admin_token: Optional[str] = Header(None)):
+    """List tenants (access tokens are never returned)"""
+    _check_admin(x_admin_token)
+    return [_public(t) for t in await Tenant.find_all().sort(+Tenant.tenant_id).to_list()]
+
+@router.put("/{tenant_id}")
+async def upsert_tenant(tenant_id: str, update: TenantUpdate, x_admin_token: Optional[str] = Header(None)):
+    """
+    Create a tenant or update its name / Meta credentials.
+    The shared refresher picks it up on its next cycle.
+    """
+    _check_admin(x_admin_token)
+    tenant_id = tenant_id.strip().lower()
+    if not tenants.TENANT_ID_PATTERN.match(tenant_id):
+        raise HTTPException(400, "Tenant ids are lowercase letters, digits, '-' or '_' (max 63)")
+
+    tenant = await tenants.get_tenant(tenant_id) or Tenant(tenant_id=tenant_id, name=tenant_id)
+    for field, value in update.model_dump(exclude_none=True).items():
+        setattr(tenant, field, value)
+    if tenant_id == DEFAULT_TENANT and not tenant.active:
+        raise HTTPException(400, "The default tenant can't be deactivated")
+    await tenant.save()
+    tenants.forget(tenant_id)
+    return _public(tenant)
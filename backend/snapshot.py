@@ -0,0 +1,175 @@
+"""
+Dashboard Snapshot - materialized insights payload, rebuilt only when source data changes
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from models import DEFAULT_TENANT, DashboardSnapshot, SourceVersion
+import coordination
+import events
+import responses
+import tenants
+
+DASHBOARD_KEY = "dashboard"
+# Serialized payloads kept per content hash (one or two per tenant)
+RENDERED_CACHE_SIZE = 32
+
+# Seconds a worker keeps a snapshot document in memory (served only while its source version still matches);
+# stores and invalidations drop it on every worker right away
+SNAPSHOT_CACHE_TTL = float(os.getenv("SNAPSHOT_CACHE_TTL", "300"))
+
+# One rebuild at a time per tenant per process (and, through a lease, across workers);
+# concurrent viewers wait for it instead of racing
+_build_locks: Dict[str, asyncio.Lock] = {}
+_rendered: "OrderedDict[str, bytes]" = OrderedDict()
+_snapshots = coordination.LocalCache("snapshot", size=RENDERED_CACHE_SIZE, ttl=SNAPSHOT_CACHE_TTL)
+
+def _build_lock(tenant_id: str) -> asyncio.Lock:
+    return _build_locks.setdefault(tenant_id, asyncio.Lock())
+
+async def source_version(tenant_id: str = DEFAULT_TENANT) -> str:
+    """The tenant's write counter (one indexed lookup); every write the dashboard reads calls bump()"""
+    doc = await SourceVersion.get_motor_collection().find_one({"_id": tenant_id}, {"version": 1})
+    return str(doc["version"]) if doc else "0"
+
+async def bump(tenant_id: str = DEFAULT_TENANT):
+    """Mark the tenant's source data as changed, so the next read rebuilds (or the watcher patches) its snapshot"""
+    await SourceVersion.get_motor_collection().update_one(
+        {"_id": tenant_id}, {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now()}}, upsert=True
+    )
+
+def content_hash(payload: Dict[str, Any]) -> str:
+    """Stable hash of a JSON-encoded payload, used as the ETag"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def get_snapshot(tenant_id: str = DEFAULT_TENANT) -> Optional[DashboardSnapshot]:
+    return await DashboardSnapshot.find_one(DashboardSnapshot.key == tenants.scoped_key(tenant_id, DASHBOARD_KEY))
+
+async def tenants_containing(competitor_id: str) -> List[str]:
+    """Tenants whose stored snapshot includes a competitor (to route deletes, which carry no document)"""
+    snapshots = await DashboardSnapshot.find({"state.competitors.id": competitor_id}).to_list()
+    return [s.tenant_id for s in snapshots]
+
+def _changed_sections(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Top-level payload keys (and comparative_data sections) that differ"""
+    changed = [k for k in new if k != "comparative_data" and old.get(k) != new.get(k)]
+    old_data = old.get("comparative_data") or {}
+    new_data = new.get("comparative_data") or {}
+    changed += [k for k in new_data if old_data.get(k) != new_data.get(k)]
+    return changed
+
+async def _store(snapshot: DashboardSnapshot, version: str, payload: Dict[str, Any], state: Dict[str, Any]):
+    previous_hash = snapshot.content_hash
+    changed = _changed_sections(snapshot.payload or {}, payload)
+    snapshot.source_version = version
+    snapshot.content_hash = content_hash(payload)
+    snapshot.payload = payload
+    snapshot.state = state
+    snapshot.built_at = datetime.now()
+    await snapshot.save()
+    _snapshots.invalidate(snapshot.tenant_id)
+    _snapshots.set(snapshot.tenant_id, snapshot)
+    if snapshot.content_hash != previous_hash:
+        events.publish("dashboard", {"etag": etag_for(snapshot), "changed": changed, "built_at": snapshot.built_at},
+                       tenant_id=snapshot.tenant_id)
+
+async def _current(tenant_id: str, version: str) -> Optional[DashboardSnapshot]:
+    """The stored snapshot if it is built from `version`"""
+    snapshot = await get_snapshot(tenant_id)
+    return snapshot if snapshot and snapshot.source_version == version else None
+
+async def get_or_build(build: Callable[[str], Awaitable[Tuple[Dict[str, Any], Dict[str, Any]]]],
+                       tenant_id: str = DEFAULT_TENANT) -> DashboardSnapshot:
+    """
+    Return the tenant's stored snapshot if it matches the current source version,
+    otherwise rebuild it with `build(tenant_id)` -> (payload, state) and store the result.
+    Only one worker rebuilds; the others wait for it and read what it stored.
+    """
+    version = await source_version(tenant_id)
+    snapshot = _snapshots.get(tenant_id)
+    if snapshot and snapshot.source_version == version:
+        return snapshot
+    snapshot = await _current(tenant_id, version)
+    if snapshot:
+        _snapshots.set(tenant_id, snapshot)
+        return snapshot
+
+    async def rebuild() -> DashboardSnapshot:
+        # Another request or worker may have rebuilt it while we waited
+        snapshot = await get_snapshot(tenant_id)
+        if snapshot and snapshot.source_version == version:
+            return snapshot
+        payload, state = await build(tenant_id)
+        if not snapshot:
+            snapshot = DashboardSnapshot(key=tenants.scoped_key(tenant_id, DASHBOARD_KEY), tenant_id=tenant_id)
+        await _store(snapshot, version, jsonable_encoder(payload), jsonable_encoder(state))
+        return snapshot
+
+    async with _build_lock(tenant_id):
+        snapshot = await coordination.elect(f"snapshot:{tenant_id}", rebuild, lambda: _current(tenant_id, version))
+        _snapshots.set(tenant_id, snapshot)
+        return snapshot
+
+async def apply_update(update: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                       assemble: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                       tenant_id: str = DEFAULT_TENANT) -> Optional[DashboardSnapshot]:
+    """
+    Incrementally patch the tenant's stored snapshot: `update(state)` recomputes the changed
+    account's contribution, `assemble(state)` rebuilds the payload from contributions.
+    Does nothing if no snapshot has been built yet (the next read builds it in full). If another
+    worker is building or patching it, the source version is bumped instead, so whatever that
+    worker stores is stale and the next read rebuilds it with this change.
+    """
+    async def patch() -> Optional[DashboardSnapshot]:
+        # Read before recomputing, so a write landing meanwhile still leaves the snapshot stale
+        version = await source_version(tenant_id)
+        snapshot = await get_snapshot(tenant_id)
+        if not snapshot or not snapshot.state:
+            return None
+        state = jsonable_encoder(await update(snapshot.state))
+        payload = jsonable_encoder(await assemble(state))
+        await _store(snapshot, version, payload, state)
+        return snapshot
+
+    async with _build_lock(tenant_id):
+        async with coordination.lease(f"snapshot:{tenant_id}") as claim:
+            if claim.held:
+                return await patch()
+        await bump(tenant_id)
+        return None
+
+async def invalidate(tenant_id: Optional[str] = None):
+    """Force a full rebuild on the next read, for one tenant or (None) all of them"""
+    query = DashboardSnapshot.find_all() if tenant_id is None else DashboardSnapshot.find(
+        DashboardSnapshot.key == tenants.scoped_key(tenant_id, DASHBOARD_KEY)
+    )
+    await query.update({"$set": {"source_version": ""}})
+    _snapshots.invalidate(tenant_id)
+
+def rendered(snapshot: DashboardSnapshot) -> bytes:
+    """The payload as JSON bytes, serialized once per content hash rather than once per request"""
+    body = _rendered.get(snapshot.content_hash)
+    if body is None:
+        body = responses.dumps(snapshot.payload)
+        _rendered[snapshot.content_hash] = body
+        if len(_rendered) > RENDERED_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    else:
+        _rendered.move_to_end(snapshot.content_hash)
+    return body
+
+def etag_for(snapshot: DashboardSnapshot) -> str:
+    return f'"{snapshot.content_hash}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (handles lists and weak tags)"""
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
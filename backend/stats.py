@@ -0,0 +1,109 @@
+"""
+Account Stats - time-series snapshots of follower/engagement stats, rolled up per day and week
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from models import AccountStats, AccountKey, StatsRollup
+
+PERIODS = ("day", "week")
+# Window used for growth rates (percent follower change)
+GROWTH_WINDOW_DAYS = int(os.getenv("GROWTH_WINDOW_DAYS", "30"))
+
+def period_bounds(period: str, ts: datetime) -> Tuple[datetime, datetime]:
+    """[start, end) of the day or ISO week (Monday start) containing ts"""
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        return day, day + timedelta(days=1)
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=7)
+
+async def update_rollups(account: str, kind: str, ts: datetime):
+    """Recompute the day and week buckets containing ts for one account (bounded range queries)"""
+    ops = []
+    for period in PERIODS:
+        start, end = period_bounds(period, ts)
+        rows = await AccountStats.find(
+            {"meta.account": account, "ts": {"$gte": start, "$lt": end}}
+        ).aggregate([
+            {"$sort": {"ts": 1}},
+            {"$group": {
+                "_id": None,
+                "followers_open": {"$first": "$followers"},
+                "followers_close": {"$last": "$followers"},
+                "followers_min": {"$min": "$followers"},
+                "followers_max": {"$max": "$followers"},
+                "engagement_avg": {"$avg": "$engagement_rate"},
+                "avg_likes": {"$avg": "$avg_likes"},
+                "samples": {"$sum": 1},
+            }}
+        ]).to_list()
+        if not rows:
+            continue
+        row = rows[0]
+        row.pop("_id", None)
+        row["avg_likes"] = int(row.get("avg_likes") or 0)
+        row["engagement_avg"] = row.get("engagement_avg") or 0.0
+        ops.append(UpdateOne(
+            {"account": account, "period": period, "start": start},
+            {"$set": {**row, "kind": kind}},
+            upsert=True
+        ))
+    if ops:
+        await StatsRollup.get_motor_collection().bulk_write(ops, ordered=False)
+
+async def record_snapshot(account: str, kind: str, ts: datetime, followers: int = 0, following: int = 0,
+                          posts_count: int = 0, engagement_rate: float = 0.0, avg_likes: int = 0):
+    """Append one stats point and refresh the rollups it falls into; a point already recorded is skipped"""
+    if not account:
+        return
+    # The same scrape synced again, or by another tenant tracking the account, is still one point
+    if await AccountStats.find_one({"meta.account": account, "meta.kind": kind, "ts": ts}):
+        return
+    await AccountStats(
+        ts=ts,
+        meta=AccountKey(account=account, kind=kind),
+        followers=followers or 0,
+        following=following or 0,
+        posts_count=posts_count or 0,
+        engagement_rate=engagement_rate or 0.0,
+        avg_likes=avg_likes or 0
+    ).insert()
+    await update_rollups(account, kind, ts)
+
+async def rollup_all(since: Optional[datetime] = None):
+    """Backfill job: rebuild every bucket touched since `since` (all history if None)"""
+    query = {"ts": {"$gte": since}} if since else {}
+    touched = await AccountStats.find(query).aggregate([
+        {"$group": {"_id": {"account": "$meta.account", "kind": "$meta.kind",
+                            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts"}}}}}
+    ]).to_list()
+    for row in touched:
+        key = row["_id"]
+        await update_rollups(key["account"], key["kind"], datetime.strptime(key["day"], "%Y-%m-%d"))
+
+async def daily_rollups(days: int = GROWTH_WINDOW_DAYS, kind: Optional[str] = None,
+                        account: Optional[str] = None, accounts: Optional[List[str]] = None) -> List[StatsRollup]:
+    since = datetime.now() - timedelta(days=days)
+    query: Dict[str, Any] = {"period": "day", "start": {"$gte": since}}
+    if kind:
+        query["kind"] = kind
+    if account:
+        query["account"] = account
+    elif accounts is not None:
+        query["account"] = {"$in": accounts}
+    return await StatsRollup.find(query).sort(+StatsRollup.start).to_list()
+
+def growth_rates(rollups: List[StatsRollup]) -> Dict[str, float]:
+    """Percent follower change per account between its first and last bucket in the window"""
+    first: Dict[str, StatsRollup] = {}
+    last: Dict[str, StatsRollup] = {}
+    for r in rollups:
+        first.setdefault(r.account, r)
+        last[r.account] = r
+    rates = {}
+    for account, start in first.items():
+        base = start.followers_open
+        rates[account] = ((last[account].followers_close - base) / base * 100) if base > 0 else 0.0
+    return rates
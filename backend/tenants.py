@@ -0,0 +1,98 @@
+"""
+Tenants - workspace scoping, per-tenant Meta credentials and the request dependency that resolves them
+"""
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from fastapi import Header, HTTPException, Query
+from models import DEFAULT_TENANT, Tenant, UserAnalytics, MyPost, Competitor, Insight, InsightGeneration, DashboardSnapshot
+
+# Tenant ids end up in document keys and URLs
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+# Seconds a known tenant id is trusted before it is looked up again
+KNOWN_TTL = 60.0
+
+SCOPED_MODELS = [UserAnalytics, MyPost, Competitor, Insight, InsightGeneration, DashboardSnapshot]
+
+_known: Dict[str, float] = {}
+
+def scoped_key(tenant_id: str, key: str) -> str:
+    """Per-tenant key for singleton documents (snapshot, insight pointer); unchanged for the default tenant"""
+    return key if tenant_id == DEFAULT_TENANT else f"{tenant_id}:{key}"
+
+def env_credentials() -> Tuple[Optional[str], Optional[str]]:
+    """META_PAGE_ID / META_ACCESS_TOKEN, used by the default tenant"""
+    return os.getenv("META_PAGE_ID"), os.getenv("META_ACCESS_TOKEN")
+
+async def get_tenant(tenant_id: str) -> Optional[Tenant]:
+    return await Tenant.find_one(Tenant.tenant_id == tenant_id)
+
+async def credentials(tenant_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Meta page id + token for a tenant; the default tenant falls back to the env vars"""
+    tenant = await get_tenant(tenant_id)
+    if tenant and tenant.meta_page_id and tenant.meta_access_token:
+        return tenant.meta_page_id, tenant.meta_access_token
+    if tenant_id == DEFAULT_TENANT:
+        return env_credentials()
+    return None, None
+
+async def refreshable() -> List[Tuple[str, str, str]]:
+    """(tenant_id, page_id, token) for every active tenant with Meta credentials"""
+    accounts = []
+    tenants = await Tenant.find(Tenant.active == True).to_list()
+    for tenant in tenants:
+        if tenant.meta_page_id and tenant.meta_access_token:
+            accounts.append((tenant.tenant_id, tenant.meta_page_id, tenant.meta_access_token))
+    if not any(t.tenant_id == DEFAULT_TENANT for t in tenants):
+        page_id, token = env_credentials()
+        if page_id and token:
+            accounts.insert(0, (DEFAULT_TENANT, page_id, token))
+    return accounts
+
+async def competitor_usernames(tenant_id: str, account: Optional[str] = None) -> List[str]:
+    """
+    Accounts the tenant tracks (competitor_posts / term_stats are keyed by username),
+    or just `account` if it is one of them (404 otherwise)
+    """
+    usernames = await Competitor.get_motor_collection().distinct("username", {"tenant_id": tenant_id})
+    if account is None:
+        return usernames
+    account = account.lstrip("@")
+    if account not in usernames:
+        raise HTTPException(404, f"Competitor '{account}' not found")
+    return [account]
+
+async def backfill_default():
+    """Assign documents written before tenants existed to the default tenant"""
+    for model in SCOPED_MODELS:
+        result = await model.get_motor_collection().update_many(
+            {"tenant_id": {"$exists": False}}, {"$set": {"tenant_id": DEFAULT_TENANT}}
+        )
+        if result.modified_count:
+            print(f"Assigned {result.modified_count} {model.Settings.name} documents to tenant '{DEFAULT_TENANT}'")
+
+def forget(tenant_id: str):
+    _known.pop(tenant_id, None)
+
+async def _exists(tenant_id: str) -> bool:
+    checked = _known.get(tenant_id)
+    if checked is not None and time.monotonic() - checked < KNOWN_TTL:
+        return True
+    tenant = await get_tenant(tenant_id)
+    if not tenant or not tenant.active:
+        return False
+    _known[tenant_id] = time.monotonic()
+    return True
+
+async def current_tenant(
+    tenant: Optional[str] = Query(None, description="Tenant id (or send X-Tenant-ID)"),
+    x_tenant_id: Optional[str] = Header(None)
+) -> str:
+    """Route dependency: the tenant a request is for, defaulting to the single-tenant workspace"""
+    tenant_id = (tenant or x_tenant_id or DEFAULT_TENANT).strip().lower()
+    if tenant_id == DEFAULT_TENANT:
+        return tenant_id
+    if not TENANT_ID_PATTERN.match(tenant_id) or not await _exists(tenant_id):
+        raise HTTPException(404, f"Unknown tenant '{tenant_id}'")
+    return tenant_id
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Backend modules are imported flat (as uvicorn runs them from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db(anyio_backend):
+    """A fresh in-memory database (mongomock-motor, bridged as for the benchmarks) with every model registered"""
+    pytest.importorskip("mongomock_motor")
+    from benchmarks import mongo
+    import snapshot
+    await mongo.connect()
+    # Worker-local caches would otherwise outlive the previous test's database
+    snapshot._snapshots.invalidate()
+    snapshot._rendered.clear()
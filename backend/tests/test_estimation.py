@@ -0,0 +1,77 @@
+import json
+from collections import Counter, defaultdict
+from datetime import datetime
+import pytest
+from models import DEFAULT_TENANT, Competitor, CompetitorPost, ReportedSums
+import dashboard
+import estimation
+import ingestion
+
+pytestmark = pytest.mark.anyio
+
+FIELDS = ["views_total", "views_likes", "views_samples", "shares_total", "shares_likes", "shares_samples"]
+
+def _batch(likes=None):
+    """Six videos reporting views and shares, and two whose views / shares are missing; `likes` overrides by post_id"""
+    likes = likes or {}
+    posts = []
+    for i in range(6):
+        post_id = f"v{i}"
+        posts.append(CompetitorPost(
+            owner="alpha", post_id=post_id, type="Video",
+            likes=likes.get(post_id, 100 + 10 * i), views=3000 + 100 * i, shares=5 + i
+        ))
+    for i in range(2):
+        post_id = f"m{i}"
+        posts.append(CompetitorPost(owner="alpha", post_id=post_id, type="Video", likes=likes.get(post_id, 200 + i)))
+    return posts
+
+async def _reported_sums():
+    rows = await ReportedSums.get_motor_collection().find({}, {"_id": 0}).to_list(None)
+    return {row["owner"]: {field: row.get(field, 0) for field in FIELDS} for row in rows}
+
+async def _recounted():
+    """reported_sums as a pass over every stored post would give them"""
+    sums = defaultdict(Counter)
+    async for doc in CompetitorPost.get_motor_collection().find({}):
+        sums[doc["owner"]].update(estimation.contribution(doc))
+        sums[estimation.MARKET].update(estimation.contribution(doc))
+    return {owner: {field: counts.get(field, 0) for field in FIELDS} for owner, counts in sums.items()}
+
+async def _estimates():
+    cursor = CompetitorPost.get_motor_collection().find({}, {"_id": 0, "post_id": 1, "views": 1, "shares": 1, "estimated": 1})
+    return {doc["post_id"]: (doc["views"], doc["shares"], doc["estimated"]) async for doc in cursor}
+
+async def test_ingesting_the_same_batch_twice_changes_nothing(db):
+    await Competitor(username="alpha", followers_count=1000, scraped_at=datetime(2026, 10, 2), posts_synced_at=datetime(2026, 10, 2)).insert()
+    await ingestion.upsert_posts(_batch())
+    sums, estimates = await _reported_sums(), await _estimates()
+    payload, _ = await dashboard.build_dashboard(DEFAULT_TENANT)
+
+    await ingestion.upsert_posts(_batch())
+
+    assert await _reported_sums() == sums == await _recounted()
+    assert sums["alpha"]["views_samples"] == 6
+    assert await _estimates() == estimates
+    assert estimates["m0"][2] == ["views", "shares"]
+    assert "alpha" in payload["comparative_data"]["comp_names"]
+    rebuilt, _ = await dashboard.build_dashboard(DEFAULT_TENANT)
+    assert json.dumps(rebuilt, sort_keys=True, default=str) == json.dumps(payload, sort_keys=True, default=str)
+
+async def test_rescrape_with_changed_likes_adjusts_the_sums_and_estimates(db):
+    await ingestion.upsert_posts(_batch())
+    before = await _estimates()
+
+    await ingestion.upsert_posts(_batch(likes={"v0": 400, "v5": 50, "m1": 300}))
+
+    sums = await _reported_sums()
+    assert sums == await _recounted()
+    assert sums["alpha"]["views_likes"] == 400 + 110 + 120 + 130 + 140 + 50
+    estimates = await _estimates()
+    for post_id, likes in (("m0", 200), ("m1", 300)):
+        views, shares, estimated = estimates[post_id]
+        assert estimated == ["views", "shares"]
+        assert views == estimation.predict(likes, sums["alpha"]["views_total"] / sums["alpha"]["views_likes"])
+        assert shares == estimation.predict(likes, sums["alpha"]["shares_total"] / sums["alpha"]["shares_likes"])
+    assert estimates["m0"] != before["m0"]
+    assert all(estimates[f"v{i}"][2] == [] for i in range(6))
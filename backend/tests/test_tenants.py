@@ -0,0 +1,60 @@
+from datetime import datetime
+import pytest
+from models import DEFAULT_TENANT, Competitor
+import dashboard
+import ingestion
+import snapshot
+import tenants
+import watcher
+
+pytestmark = pytest.mark.anyio
+
+def _raw_scrape(username, **fields):
+    """A competitor document as n8n writes it: no tenant_id, raw Apify posts, not synced yet"""
+    return {
+        "username": username,
+        "followers_count": 1000,
+        "recent_posts": [{"id": f"{username}-1", "likesCount": 40, "commentsCount": 2, "timestamp": "2026-10-01T12:00:00Z"}],
+        "scraped_at": datetime(2026, 10, 2),
+        **fields,
+    }
+
+async def test_scrape_written_after_startup_is_on_the_default_dashboard(db):
+    await tenants.backfill_default()  # startup
+    await Competitor.get_motor_collection().insert_one(_raw_scrape("late"))
+
+    payload, state = await dashboard.build_dashboard(DEFAULT_TENANT)
+
+    assert [c["username"] for c in state["competitors"]] == ["late"]
+    assert "late" in payload["comparative_data"]["comp_names"]
+    assert (await Competitor.find_one(Competitor.username == "late")).tenant_id == DEFAULT_TENANT
+    assert await tenants.competitor_usernames(DEFAULT_TENANT) == ["late"]
+
+async def test_unscoped_scrapes_are_pending_for_the_default_tenant(db):
+    await Competitor.get_motor_collection().insert_one(_raw_scrape("late"))
+    await Competitor(tenant_id="acme", username="other", scraped_at=datetime(2026, 10, 2)).insert()
+
+    assert await ingestion.pending_tenants() == ["acme", DEFAULT_TENANT]
+    assert await ingestion.sync_pending_competitors(DEFAULT_TENANT) == 1
+    assert await ingestion.pending_tenants() == ["acme"]
+
+async def test_other_tenants_do_not_pick_up_unscoped_scrapes(db):
+    await Competitor.get_motor_collection().insert_one(_raw_scrape("late"))
+
+    _, state = await dashboard.build_dashboard("acme")
+
+    assert state["competitors"] == []
+    assert (await Competitor.get_motor_collection().find_one({"username": "late"})).get("tenant_id") is None
+
+async def test_watcher_assigns_unscoped_scrapes_before_patching(db):
+    await snapshot.get_or_build(dashboard.build_dashboard, DEFAULT_TENANT)
+    document = _raw_scrape("late")
+    document["_id"] = (await Competitor.get_motor_collection().insert_one(document)).inserted_id
+
+    await watcher.handle_change({
+        "operationType": "insert", "ns": {"coll": "competitors"},
+        "documentKey": {"_id": document["_id"]}, "fullDocument": document
+    })
+
+    stored = await snapshot.get_snapshot(DEFAULT_TENANT)
+    assert [c["username"] for c in stored.state["competitors"]] == ["late"]
@@ -0,0 +1,43 @@
+import pytest
+from PIL import Image
+import thumbnails
+
+def _resize(tmp_path, img, fmt, size=(40, 40), **save):
+    src = tmp_path / "original"
+    dst = tmp_path / f"variant.{fmt}"
+    img.save(src, **save)
+    thumbnails.resize_file(str(src), str(dst), *size, fmt)
+    return Image.open(dst)
+
+@pytest.mark.parametrize("fmt", ["webp", "jpeg"])
+def test_cmyk_jpeg(tmp_path, fmt):
+    # Pure red in CMYK
+    out = _resize(tmp_path, Image.new("CMYK", (100, 50), (0, 255, 255, 0)), fmt, format="JPEG")
+    assert out.mode == "RGB"
+    assert out.size == (40, 20)
+    r, g, b = out.getpixel((20, 10))
+    assert r > 200 and g < 60 and b < 60
+
+@pytest.mark.parametrize("fmt, mode", [("webp", "RGBA"), ("jpeg", "RGB")])
+def test_palette_with_transparency(tmp_path, fmt, mode):
+    img = Image.new("P", (64, 64), 0)
+    img.putpalette([255, 0, 0, 0, 0, 255])
+    img.info["transparency"] = 0
+    assert _resize(tmp_path, img, fmt, format="PNG").mode == mode
+
+@pytest.mark.parametrize("fmt", ["webp", "jpeg"])
+def test_la(tmp_path, fmt):
+    out = _resize(tmp_path, Image.new("LA", (64, 64), (128, 200)), fmt, format="PNG")
+    assert out.mode in ("RGBA", "RGB", "L")
+
+@pytest.mark.parametrize("fmt", ["webp", "jpeg"])
+def test_16_bit_grayscale(tmp_path, fmt):
+    # Mid-gray is scaled down to 8 bits, not clipped to white
+    out = _resize(tmp_path, Image.new("I;16", (64, 64), 32896), fmt, format="PNG")
+    assert out.mode in ("RGB", "L")
+    pixel = out.getpixel((10, 10))
+    assert 120 < (pixel if isinstance(pixel, int) else pixel[0]) < 136
+
+def test_no_upscaling(tmp_path):
+    out = _resize(tmp_path, Image.new("RGB", (20, 10), (0, 128, 0)), "webp", size=(400, 400), format="PNG")
+    assert out.size == (20, 10)
@@ -0,0 +1,217 @@
+from datetime import datetime
+import pytest
+from pymongo.errors import OperationFailure
+from models import DEFAULT_TENANT, Competitor
+import coordination
+import dashboard
+import events
+import snapshot
+import watcher
+
+pytestmark = pytest.mark.anyio
+
+def _competitor(username, likes=40, **fields):
+    return Competitor(
+        username=username,
+        followers_count=1000,
+        recent_posts=[{"id": f"{username}-1", "likesCount": likes, "commentsCount": 2, "timestamp": "2026-10-01T12:00:00Z"}],
+        scraped_at=datetime(2026, 10, 2),
+        **fields
+    )
+
+def _event(operation, competitor, **extra):
+    change = {"operationType": operation, "ns": {"coll": "competitors"}, "documentKey": {"_id": competitor.id}}
+    if operation != "delete":
+        change["fullDocument"] = competitor.model_dump(by_alias=True)
+    return {**change, **extra}
+
+@pytest.fixture
+def published(monkeypatch):
+    """(event, data, tenant_id) for every event published"""
+    sent = []
+    monkeypatch.setattr(events, "publish", lambda event, data, tenant_id=DEFAULT_TENANT: sent.append((event, data, tenant_id)))
+    return sent
+
+async def _usernames(tenant_id=DEFAULT_TENANT):
+    stored = await snapshot.get_snapshot(tenant_id)
+    return [c["username"] for c in stored.state["competitors"]]
+
+async def _built(*competitors):
+    for competitor in competitors:
+        await competitor.insert()
+    await snapshot.get_or_build(dashboard.build_dashboard, DEFAULT_TENANT)
+
+async def test_insert_update_replace_and_delete_patch_the_snapshot(db, published):
+    alpha = _competitor("alpha")
+    await _built(alpha)
+    version = await snapshot.source_version()
+    published.clear()
+
+    beta = await _competitor("beta").insert()
+    await watcher.handle_change(_event("insert", beta))
+    assert await _usernames() == ["alpha", "beta"]
+
+    beta.followers_count = 5000
+    await beta.save()
+    await watcher.handle_change(_event("update", beta, updateDescription={"updatedFields": {"followers_count": 5000}}))
+    stored = await snapshot.get_snapshot()
+    assert stored.state["competitors"][1]["followers"] == 5000
+
+    beta.recent_posts = [{"id": "beta-2", "likesCount": 900, "timestamp": "2026-10-03T12:00:00Z"}]
+    beta.scraped_at = datetime(2026, 10, 4)
+    await beta.replace()
+    await watcher.handle_change(_event("replace", beta))
+    stored = await snapshot.get_snapshot()
+    assert stored.state["competitors"][1]["best_post"]["likes"] == 900
+
+    await alpha.delete()
+    await watcher.handle_change(_event("delete", alpha))
+    assert await _usernames() == ["beta"]
+
+    # Patched in place: the snapshot stays current without a rebuild
+    assert (await snapshot.get_snapshot()).source_version == version == await snapshot.source_version()
+    competitor_events = [(data["id"], data["operation"]) for event, data, _ in published if event == "competitor"]
+    assert competitor_events == [(str(beta.id), "insert"), (str(beta.id), "update"), (str(beta.id), "replace"), (str(alpha.id), "delete")]
+    assert sum(event == "dashboard" for event, _, _ in published) == 4
+
+async def test_bookkeeping_updates_are_ignored(db, published):
+    alpha = _competitor("alpha")
+    await _built(alpha)
+    published.clear()
+
+    await watcher.handle_change(_event("update", alpha, updateDescription={"updatedFields": {"posts_synced_at": datetime.now()}}))
+
+    assert published == []
+
+async def test_events_go_to_the_document_tenant(db, published):
+    await _competitor("alpha").insert()
+    await snapshot.get_or_build(dashboard.build_dashboard, "acme")
+    beta = await _competitor("beta", tenant_id="acme").insert()
+
+    assert await watcher._tenants_of(_event("insert", beta)) == ["acme"]
+    await watcher.handle_change(_event("insert", beta))
+
+    assert await _usernames("acme") == ["beta"]
+    assert {tenant_id for _, _, tenant_id in published} == {"acme"}
+    assert await watcher._tenants_of(_event("delete", beta)) == ["acme"]
+
+async def test_patch_bumps_the_version_while_another_worker_holds_the_snapshot(db, published):
+    await _built(_competitor("alpha"))
+    version = await snapshot.source_version()
+    beta = await _competitor("beta").insert()
+
+    async with coordination.lease(f"snapshot:{DEFAULT_TENANT}"):
+        await watcher.handle_change(_event("insert", beta))
+
+    assert int(await snapshot.source_version()) == int(version) + 1
+    assert await _usernames() == ["alpha"]
+    # The next read rebuilds with the change
+    rebuilt = await snapshot.get_or_build(dashboard.build_dashboard, DEFAULT_TENANT)
+    assert [c["username"] for c in rebuilt.state["competitors"]] == ["alpha", "beta"]
+
+async def test_deleted_user_analytics_invalidates(db, published):
+    await _built(_competitor("alpha"))
+
+    await watcher.handle_change({"operationType": "delete", "ns": {"coll": "user_analytics"}, "documentKey": {"_id": "x"}})
+
+    assert (await snapshot.get_snapshot()).source_version == ""
+
+class _Claim:
+    """Held until `release()`"""
+
+    def __init__(self):
+        self.held = True
+
+    def release(self):
+        self.held = False
+
+class _Stream:
+    def __init__(self, changes, claim):
+        self.changes = list(changes)
+        self.claim = claim
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.changes:
+            self.claim.release()
+            raise StopAsyncIteration
+        change = self.changes.pop(0)
+        self.resume_token = change["_id"]
+        return change
+
+class _Database:
+    def __init__(self, stream=None, error=None):
+        self.stream = stream
+        self.error = error
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None, full_document=None):
+        self.resumed_after.append(resume_after)
+        if self.error:
+            raise self.error
+        return self.stream
+
+async def test_resume_token_is_persisted_per_event(db, monkeypatch):
+    await watcher._save_token({"_data": "1"})
+    claim = _Claim()
+    changes = [{"_id": {"_data": "2"}, "operationType": "insert"}, {"_id": {"_data": "3"}, "operationType": "insert"}]
+    fake = _Database(_Stream(changes, claim))
+    handled = []
+
+    async def handle(change):
+        handled.append(change["_id"]["_data"])
+        assert await watcher._load_token() == ({"_data": "1"} if change["_id"]["_data"] == "2" else {"_data": "2"})
+    monkeypatch.setattr(watcher.database, "get_database", lambda: fake)
+    monkeypatch.setattr(watcher, "handle_change", handle)
+    monkeypatch.setattr(watcher, "RETRY_DELAY", 0)
+
+    assert await watcher._watch(claim) is True
+
+    assert fake.resumed_after == [{"_data": "1"}]
+    assert handled == ["2", "3"]
+    assert await watcher._load_token() == {"_data": "3"}
+
+async def test_without_change_streams_it_polls(db, monkeypatch):
+    fake = _Database(error=OperationFailure("not a replica set", code=40573))
+    polled = []
+
+    async def poll(claim):
+        polled.append(claim)
+        return True
+    monkeypatch.setattr(watcher.database, "get_database", lambda: fake)
+    monkeypatch.setattr(watcher, "_poll", poll)
+    claim = _Claim()
+
+    assert await watcher._watch(claim) is True
+    assert polled == [claim]
+
+async def test_poll_cycle_syncs_scrapes_and_bumps_their_tenant(db, monkeypatch):
+    await _built(_competitor("alpha", posts_synced_at=datetime(2026, 10, 2)))
+    version = await snapshot.source_version()
+    # A new scrape written straight to the collection, not normalized yet
+    await Competitor.get_motor_collection().update_one(
+        {"username": "alpha"},
+        {"$set": {"scraped_at": datetime(2026, 10, 5), "recent_posts": [{"id": "alpha-2", "likesCount": 700, "timestamp": "2026-10-04T12:00:00Z"}]}}
+    )
+    claim = _Claim()
+
+    async def sleep(seconds):
+        claim.release()
+    monkeypatch.setattr(watcher.asyncio, "sleep", sleep)
+
+    assert await watcher._poll(claim) is True
+
+    assert int(await snapshot.source_version()) == int(version) + 1
+    alpha = await Competitor.find_one(Competitor.username == "alpha")
+    assert alpha.posts_synced_at == alpha.scraped_at
+    rebuilt = await snapshot.get_or_build(dashboard.build_dashboard, DEFAULT_TENANT)
+    assert rebuilt.state["competitors"][0]["best_post"]["likes"] == 700
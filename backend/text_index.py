@@ -0,0 +1,184 @@
+"""
+Text Index - caption tokenizing and the inverted index behind hashtag analysis and post search
+
+Every competitor post stores its distinct caption terms ("#tag", "@mention" or a plain word) in a
+multikey-indexed `terms` field, which is what search queries. term_stats keeps per-account counts for
+each term, adjusted by deltas whenever posts are upserted, so top-hashtag queries never rescan captions.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+from pymongo import UpdateOne
+from models import CompetitorPost, PostHit, TermStat
+
+HASHTAG, MENTION, WORD = "hashtag", "mention", "word"
+
+HASHTAG_RE = re.compile(r"#(\w+)")
+MENTION_RE = re.compile(r"@([\w.]+)")
+WORD_RE = re.compile(r"[^\W\d_]+")  # letters only, so numbers and emoji don't become terms
+MIN_WORD_LENGTH = 3
+# Longer tokens are URLs or keyboard mashing, not something anyone searches for
+MAX_TERM_LENGTH = 64
+# Long captions are mostly hashtag walls; the first terms are the meaningful ones
+MAX_TERMS = 100
+STOPWORDS = frozenset("""
+    the and for are but not you your yours our ours with this that these those from they them their
+    was were will would can could has have had its into out over all any who what when where which
+    why how just about more most some such than then there here also very been being each other only own
+    same too now get got one two new via her his him she
+""".split())
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+def kind_of(term: str) -> str:
+    return HASHTAG if term.startswith("#") else MENTION if term.startswith("@") else WORD
+
+def tokenize(caption: str, hashtags: Iterable[Any] = (), mentions: Iterable[Any] = ()) -> List[str]:
+    """
+    Distinct terms of a caption in first-seen order.
+    `hashtags` / `mentions` are the lists scrapers extract themselves (Apify does); they are merged in.
+    """
+    text = _fold(caption or "")
+    terms: Dict[str, None] = {}  # Ordered set
+    for tag in [*(str(t) for t in hashtags if t), *HASHTAG_RE.findall(text)]:
+        tag = _fold(tag).lstrip("#")
+        if tag and len(tag) <= MAX_TERM_LENGTH:
+            terms[f"#{tag}"] = None
+    for name in [*(str(m) for m in mentions if m), *MENTION_RE.findall(text)]:
+        name = _fold(name).lstrip("@").rstrip(".")
+        if name and len(name) <= MAX_TERM_LENGTH:
+            terms[f"@{name}"] = None
+    # "don't" -> "dont", not "don" + "t"
+    prose = MENTION_RE.sub(" ", HASHTAG_RE.sub(" ", text)).replace("'", "").replace("\u2019", "")
+    for word in WORD_RE.findall(prose):
+        if MIN_WORD_LENGTH <= len(word) <= MAX_TERM_LENGTH and word not in STOPWORDS:
+            terms[word] = None
+    return list(terms)[:MAX_TERMS]
+
+def hashtags(terms: Iterable[str]) -> List[str]:
+    """Hashtags (without '#') among a post's terms"""
+    return [t[1:] for t in terms if t.startswith("#")]
+
+def query_clauses(q: str) -> List[Dict[str, Any]]:
+    """
+    Search query -> one `terms` clause per query term (all must match).
+    A plain word also matches the same hashtag, so "sale" finds "#sale" posts.
+    """
+    clauses = []
+    for term in tokenize(q):
+        alternatives = [term, f"#{term}"] if kind_of(term) == WORD else [term]
+        clauses.append({"terms": {"$in": alternatives}})
+    return clauses
+
+# --- Index maintenance ---
+
+async def index_posts(posts: Iterable[CompetitorPost], stored: Dict[Tuple[str, str], Dict[str, Any]]):
+    """
+    Adjust term_stats for just-upserted posts: the version each write replaced (if it was indexed,
+    i.e. has `terms`) is subtracted and the new one added, so re-scrapes don't double count.
+    """
+    latest = {(p.owner, p.post_id): p for p in posts}
+
+    # (owner, term) -> [posts, likes, comments]
+    deltas: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0, 0])
+    last_used: Dict[Tuple[str, str], datetime] = {}
+    for key, post in latest.items():
+        old = stored.get(key)
+        if old is not None and "terms" in old:
+            for term in old["terms"]:
+                delta = deltas[(post.owner, term)]
+                delta[0] -= 1
+                delta[1] -= old.get("likes", 0)
+                delta[2] -= old.get("comments", 0)
+        for term in post.terms:
+            delta = deltas[(post.owner, term)]
+            delta[0] += 1
+            delta[1] += post.likes
+            delta[2] += post.comments
+            if post.timestamp:
+                last_used[(post.owner, term)] = max(last_used.get((post.owner, term), post.timestamp), post.timestamp)
+
+    ops = []
+    for (owner, term), (n, likes, comments) in deltas.items():
+        if not (n or likes or comments):
+            continue
+        update = {
+            "$inc": {"posts": n, "likes": likes, "comments": comments},
+            "$setOnInsert": {"kind": kind_of(term)},
+        }
+        if (owner, term) in last_used:
+            update["$max"] = {"last_used": last_used[(owner, term)]}
+        ops.append(UpdateOne({"owner": owner, "term": term}, update, upsert=True))
+    if not ops:
+        return
+    collection = TermStat.get_motor_collection()
+    await collection.bulk_write(ops, ordered=False)
+    # Terms no post uses any more (a concurrent ingest's deltas can be briefly negative; those are left to it)
+    await collection.delete_many({"owner": {"$in": list({o for o, _ in deltas})}, "posts": 0})
+
+async def backfill(batch_size: int = 500) -> int:
+    """Index posts stored before the text index existed (no `terms` field); returns how many were indexed"""
+    collection = CompetitorPost.get_motor_collection()
+    projection = {"owner": 1, "post_id": 1, "caption": 1, "likes": 1, "comments": 1, "timestamp": 1}
+    indexed = 0
+    while True:
+        docs = await collection.find({"terms": {"$exists": False}}, projection).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return indexed
+        posts = [
+            CompetitorPost(
+                owner=d["owner"], post_id=d["post_id"], timestamp=d.get("timestamp"),
+                likes=d.get("likes", 0), comments=d.get("comments", 0), terms=tokenize(d.get("caption", ""))
+            )
+            for d in docs
+        ]
+        await index_posts(posts, {})
+        await collection.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$set": {"terms": p.terms}}) for d, p in zip(docs, posts)],
+            ordered=False
+        )
+        indexed += len(docs)
+
+# --- Queries ---
+
+async def top_terms(owners: List[str], kind: str = HASHTAG, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most used terms of a kind across the given accounts, straight from term_stats"""
+    if not owners:
+        return []
+    rows = await TermStat.get_motor_collection().aggregate([
+        {"$match": {"owner": {"$in": owners}, "kind": kind, "posts": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$term",
+            "posts": {"$sum": "$posts"},
+            "likes": {"$sum": "$likes"},
+            "comments": {"$sum": "$comments"},
+            "accounts": {"$sum": 1},
+            "last_used": {"$max": "$last_used"},
+        }},
+        {"$sort": {"posts": -1, "likes": -1, "_id": 1}},
+        {"$limit": limit},
+    ]).to_list(limit)
+    return [
+        {
+            "term": row["_id"],
+            "posts": row["posts"],
+            "likes": row["likes"],
+            "comments": row["comments"],
+            "avg_likes": round(row["likes"] / row["posts"], 1),
+            "accounts": row["accounts"],
+            "last_used": row.get("last_used"),
+        }
+        for row in rows
+    ]
+
+async def search(owners: List[str], q: str, sort: str = "likes", limit: int = 20) -> List[PostHit]:
+    """Posts by the given accounts whose captions contain every term of `q`"""
+    clauses = query_clauses(q)
+    if not owners or not clauses:
+        return []
+    query = CompetitorPost.find({"owner": {"$in": owners}, "$and": clauses})
+    order = [-CompetitorPost.timestamp] if sort == "recent" else [-CompetitorPost.likes, -CompetitorPost.timestamp]
+    return await query.sort(*order).limit(limit).project(PostHit).to_list()
@@ -0,0 +1,55 @@
+"""
+Thumbnails - resize/convert cached images in a process pool so Pillow never blocks the event loop
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+MAX_DIMENSION = 2048
+QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def normalize_mode(img, fmt: str):
+    """
+    Convert to a mode the encoder takes: RGB or L for JPEG, RGB or RGBA for WebP.
+    Covers CMYK JPEGs, palette / LA images (alpha kept for WebP) and 16-bit or float grayscale.
+    """
+    if img.mode.startswith("I;16") or img.mode == "I":
+        img = img.convert("I").point(lambda v: v / 256).convert("L")
+    elif img.mode == "F":
+        img = img.convert("L")
+    if fmt == "jpeg":
+        return img if img.mode in ("RGB", "L") else img.convert("RGB")
+    if img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info:
+        return img if img.mode == "RGBA" else img.convert("RGBA")
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def resize_file(src_path: str, dst_path: str, width: Optional[int], height: Optional[int], fmt: str):
+    """Runs in a worker process: fit the image inside width x height (no upscaling) and re-encode"""
+    from PIL import Image, ImageOps
+
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        # Before resizing, so palette images are resampled in full color
+        img = normalize_mode(img, fmt)
+        img.thumbnail((width or img.width, height or img.height))
+        tmp = f"{dst_path}.{os.getpid()}.tmp"
+        img.save(tmp, format=fmt.upper(), quality=QUALITY)
+    os.replace(tmp, dst_path)
+
+async def resize(src_path: str, dst_path: str, width: Optional[int], height: Optional[int], fmt: str):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_pool, resize_file, src_path, dst_path, width, height, fmt)
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,74 @@
+"""
+Warm-up - runs after startup so the first real request doesn't pay for snapshot builds or index builds
+"""
+import os
+import time
+from typing import Any, Dict, List
+from models import DEFAULT_TENANT, Tenant
+import coordination
+import database
+import dashboard
+import estimation
+import heatmap
+import refresher
+import snapshot
+import text_index
+
+# Tenants whose dashboards are preloaded (the default one always is); the rest build on first request
+WARMUP_TENANTS = int(os.getenv("WARMUP_TENANTS", "10"))
+
+# Backfills are batched, so a lease renewed every third of this outlives any single batch
+BACKFILL_LEASE_TTL = 120.0
+
+state: Dict[str, Any] = {
+    "done": False, "started_at": None, "seconds": None, "snapshots": [], "index_failures": {},
+    "posts_moved": 0, "posts_indexed": 0, "posts_heatmapped": 0, "posts_summed": 0, "posts_estimated": 0,
+}
+
+async def _tenant_ids() -> List[str]:
+    active = await Tenant.find(Tenant.active == True).sort(+Tenant.tenant_id).limit(WARMUP_TENANTS).to_list()
+    return [DEFAULT_TENANT] + [t.tenant_id for t in active if t.tenant_id != DEFAULT_TENANT]
+
+async def _preload(tenant_id: str):
+    start = time.perf_counter()
+    snap = await snapshot.get_or_build(dashboard.build_dashboard, tenant_id)
+    snapshot.rendered(snap)
+    state["snapshots"].append(tenant_id)
+    print(f"Warm-up: dashboard for '{tenant_id}' ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+async def run():
+    """
+    1. load or rebuild the dashboard snapshots, so /api/insights/generate is served from cache
+    2. create any missing non-unique indexes (init_db built the unique ones before serving)
+    3. move your posts embedded in UserAnalytics into my_posts, and add posts stored before the caption
+       term index / heatmaps / reported sums / estimates existed to them (on one worker; the others skip it)
+    """
+    state["started_at"] = time.time()
+    start = time.perf_counter()
+    try:
+        for tenant_id in await _tenant_ids():
+            try:
+                await _preload(tenant_id)
+            except Exception as e:
+                print(f"Warm-up: dashboard for '{tenant_id}' failed: {e}")
+    except Exception as e:
+        print(f"Warm-up: tenant listing failed: {e}")
+    state["index_failures"] = {**database.index_failures, **await database.ensure_indexes(unique=False)}
+    backfills = (
+        ("posts_moved", refresher.backfill_posts),
+        ("posts_indexed", text_index.backfill),
+        ("posts_heatmapped", heatmap.backfill),
+        ("posts_summed", estimation.backfill_sums),
+        ("posts_estimated", estimation.backfill),
+    )
+    # Concurrent backfills on several workers would count the same posts twice
+    async with coordination.lease("backfills", BACKFILL_LEASE_TTL) as claim:
+        if claim.held:
+            for key, backfill in backfills:
+                try:
+                    state[key] = await backfill()
+                except Exception as e:
+                    print(f"Warm-up: {key} backfill failed: {e}")
+    state["seconds"] = round(time.perf_counter() - start, 3)
+    state["done"] = True
+    print(f"✅ Warm-up finished in {state['seconds']:.2f}s")
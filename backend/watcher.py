@@ -0,0 +1,135 @@
+"""
+Change Stream Watcher - patches each tenant's dashboard snapshot per changed account instead of rebuilding it
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from beanie.operators import Set
+from pymongo.errors import OperationFailure, PyMongoError
+from models import DEFAULT_TENANT, ResumeToken
+import coordination
+import dashboard
+import database
+import events
+import ingestion
+import snapshot
+
+WATCH_KEY = "dashboard"
+WATCHED_COLLECTIONS = ["competitors", "user_analytics"]
+# Updates touching only these fields are our own bookkeeping (see ingestion.sync_competitor_posts and
+# ingestion.assign_unscoped_competitors); content_mix / top_hashtags are derived there and the dashboard doesn't read them
+IGNORED_FIELDS = {"posts_synced_at", "content_mix", "top_hashtags", "tenant_id"}
+RETRY_DELAY = 30.0
+# Without change streams, seconds between checks for scrapes written straight to the competitors collection
+POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "30"))
+
+# $changeStream is only supported on replica sets / sharded clusters
+UNSUPPORTED_CODES = {40573}
+# Resume token is no longer in the oplog
+HISTORY_LOST_CODES = {260, 280, 286}
+
+async def _load_token() -> Optional[Dict[str, Any]]:
+    saved = await ResumeToken.find_one(ResumeToken.key == WATCH_KEY)
+    return saved.token if saved else None
+
+async def _save_token(token: Optional[Dict[str, Any]]):
+    now = datetime.now()
+    await ResumeToken.find_one(ResumeToken.key == WATCH_KEY).upsert(
+        Set({ResumeToken.token: token, ResumeToken.updated_at: now}),
+        on_insert=ResumeToken(key=WATCH_KEY, token=token, updated_at=now)
+    )
+
+async def _tenants_of(change: Dict[str, Any]) -> List[str]:
+    """Tenant(s) whose snapshot an event affects; deletes carry no document, so look it up"""
+    document = change.get("fullDocument") or {}
+    if document:
+        return [document.get("tenant_id") or DEFAULT_TENANT]
+    if change.get("ns", {}).get("coll") == "competitors":
+        return await snapshot.tenants_containing(str(change["documentKey"]["_id"]))
+    return []
+
+async def handle_change(change: Dict[str, Any]):
+    """Recompute only the contribution of the account the event is about, in the tenant it belongs to"""
+    operation = change.get("operationType")
+    collection = change.get("ns", {}).get("coll")
+
+    if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+        await snapshot.invalidate()
+        return
+    if operation == "update":
+        updated = set(change.get("updateDescription", {}).get("updatedFields", {}))
+        if updated and updated <= IGNORED_FIELDS:
+            return
+
+    document = change.get("fullDocument") or {}
+    if collection == "competitors" and document and not document.get("tenant_id"):
+        # Written straight to the collection by n8n: stamp it before the tenant-scoped recompute looks it up
+        await ingestion.assign_unscoped_competitors()
+
+    affected = await _tenants_of(change)
+    if not affected:
+        # A deleted UserAnalytics document - we can't tell whose it was
+        await snapshot.invalidate()
+        return
+
+    for tenant_id in affected:
+        if collection == "user_analytics":
+            await snapshot.apply_update(dashboard.update_my_contribution, dashboard.assemble_dashboard, tenant_id)
+        elif collection == "competitors":
+            competitor_id = str(change["documentKey"]["_id"])
+            events.publish("competitor", {"id": competitor_id, "operation": operation}, tenant_id=tenant_id)
+            await snapshot.apply_update(
+                lambda state: dashboard.update_competitor_contribution(state, competitor_id),
+                dashboard.assemble_dashboard,
+                tenant_id
+            )
+
+async def run_watcher():
+    """Long-running task started from the app lifespan; one worker watches, the others stand by"""
+    await coordination.run_as_leader("watcher", _watch)
+
+async def _watch(claim: coordination.Claim) -> bool:
+    db = database.get_database()
+    pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+    while claim.held:
+        token = await _load_token()
+        try:
+            async with db.watch(pipeline, resume_after=token, full_document="updateLookup") as stream:
+                async for change in stream:
+                    try:
+                        await handle_change(change)
+                    except Exception as e:
+                        # Missed an update - fall back to a full rebuild on the next read
+                        print(f"Change handler failed: {e}")
+                        await snapshot.invalidate()
+                    await _save_token(stream.resume_token)
+                    if not claim.held:
+                        # Another worker took over and resumes from the saved token
+                        break
+        except OperationFailure as e:
+            if e.code in UNSUPPORTED_CODES:
+                print("Change streams unavailable, polling for new scrapes instead")
+                return await _poll(claim)
+            if e.code in HISTORY_LOST_CODES:
+                print("Change stream resume token expired, forcing a full rebuild")
+                await _save_token(None)
+                await snapshot.invalidate()
+                continue
+            print(f"Change stream error: {e}")
+        except PyMongoError as e:
+            print(f"Change stream error: {e}")
+        await asyncio.sleep(RETRY_DELAY)
+    return True
+
+async def _poll(claim: coordination.Claim) -> bool:
+    """Normalize unsynced scrapes and bump their tenants' source versions, so the next read rebuilds"""
+    while claim.held:
+        try:
+            for tenant_id in await ingestion.pending_tenants():
+                await ingestion.sync_pending_competitors(tenant_id)
+                await snapshot.bump(tenant_id)
+        except PyMongoError as e:
+            print(f"Scrape poll failed: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+    return True
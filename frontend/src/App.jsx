@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { fetchMyAnalytics, fetchCompetitors, generateInsights } from './services/api';
+import { fetchMyAnalytics, fetchCompetitors, generateInsights, subscribeToUpdates } from './services/api';
 import {
   AreaChart, Area, BarChart, Bar, LineChart, Line, ScatterChart, Scatter, XAxis, YAxis, ZAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer,
   PieChart, Pie, Cell
@@ -30,6 +30,15 @@ function App() {
     loadData();
   }, []);
 
+  // Live updates: the server pushes an event when the snapshot changes, we refetch it once
+  useEffect(() => {
+    const refresh = async () => {
+      const res = await generateInsights();
+      if (res) setInsightsData(res);
+    };
+    return subscribeToUpdates({ dashboard: refresh, resync: refresh });
+  }, []);
+
   const { insights, comparative_data } = insightsData;
   const marketAvg = comparative_data?.market_avg || {};
   const myStats = comparative_data?.you || {};
@@ -62,10 +71,12 @@ function App() {
 
   // CORS Proxy Helper - uses environment variable in production
   const BACKEND_URL = import.meta.env.VITE_API_URL || "http://localhost:8000/api";
-  const getProxiedUrl = (url) => {
+  // width requests a server-side WebP thumbnail instead of the full-resolution image
+  const getProxiedUrl = (url, width) => {
     if (!url) return '';
     if (!url.startsWith('http')) return url;
-    return `${BACKEND_URL.replace('/api', '')}/api/proxy/?url=${encodeURIComponent(url)}`;
+    const thumb = width ? `&w=${width}&format=webp` : '';
+    return `${BACKEND_URL.replace('/api', '')}/api/proxy/?url=${encodeURIComponent(url)}${thumb}`;
   };
 
   const COLORS = ['#8b5cf6', '#10b981', '#f59e0b', '#06b6d4', '#ec4899'];
@@ -176,7 +187,7 @@ function App() {
                 <div className="comp-header-v5">
                   <div className="profile-pic-wrapper">
                     {comp.profile_pic ? (
-                      <img src={getProxiedUrl(comp.profile_pic)} alt={comp.username} onError={(e) => e.target.style.display = 'none'} />
+                      <img src={getProxiedUrl(comp.profile_pic, 160)} alt={comp.username} onError={(e) => e.target.style.display = 'none'} />
                     ) : (
                       <div className="profile-placeholder">{comp.username ? comp.username.substring(0, 2).toUpperCase() : 'NA'}</div>
                     )}
@@ -280,7 +291,7 @@ function App() {
               <div className="badge my-badge"><Trophy className="icon-trophy" /> Your Top Post</div>
               <div className="post-preview">
                 {competitorWatch?.my_best?.url ? (
-                  <img src={getProxiedUrl(competitorWatch.my_best.url)} alt="My Best" onError={(e) => e.target.style.display = 'none'} />
+                  <img src={getProxiedUrl(competitorWatch.my_best.url, 640)} alt="My Best" onError={(e) => e.target.style.display = 'none'} />
                 ) : (
                   <div className="no-preview">No Preview</div>
                 )}
@@ -298,7 +309,7 @@ function App() {
               <div className="badge their-badge"><Flame className="icon-flame" /> Market Top Post</div>
               <div className="post-preview">
                 {competitorWatch?.their_best?.url ? (
-                  <img src={getProxiedUrl(competitorWatch.their_best.url)} alt="Their Best" onError={(e) => e.target.style.display = 'none'} />
+                  <img src={getProxiedUrl(competitorWatch.their_best.url, 640)} alt="Their Best" onError={(e) => e.target.style.display = 'none'} />
                 ) : (
                   <div className="no-preview">No Preview</div>
                 )}
@@ -340,7 +351,7 @@ function App() {
                 <div key={i} className="mini-profile-item">
                   <div className="mini-avatar">
                     {profile.profile_pic ?
-                      <img src={getProxiedUrl(profile.profile_pic)} alt={profile.username} />
+                      <img src={getProxiedUrl(profile.profile_pic, 160)} alt={profile.username} />
                       : <div className="mini-avatar-placeholder">{profile.username?.substring(0, 1)}</div>
                     }
                   </div>
@@ -1,12 +1,23 @@
 // API URL - uses environment variable in production, localhost in development
 const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000/api";
+// Workspace to show (multi-tenant deployments); unset = the default tenant
+const TENANT_ID = import.meta.env.VITE_TENANT_ID || "";
+
+// Adds ?tenant= (a query param rather than a header, so it works for EventSource too)
+const withTenant = (path) => {
+    if (!TENANT_ID) return `${API_URL}${path}`;
+    const sep = path.includes('?') ? '&' : '?';
+    return `${API_URL}${path}${sep}tenant=${encodeURIComponent(TENANT_ID)}`;
+};
 
 // Proxy Instagram images through our backend to avoid CORS issues
-export const getProxyImageUrl = (url) => {
+// Pass a width to get a resized WebP thumbnail from the backend
+export const getProxyImageUrl = (url, width) => {
     if (!url) return null;
     if (url.includes('placeholder') || url.includes('abc')) return null;
     if (url.includes('instagram') || url.includes('cdninstagram')) {
-        return `${API_URL}/competitors/proxy-image?url=${encodeURIComponent(url)}`;
+        const thumb = width ? `&w=${width}&format=webp` : '';
+        return `${API_URL}/competitors/proxy-image?url=${encodeURIComponent(url)}${thumb}`;
     }
     return url;
 };
@@ -14,7 +25,7 @@ export const getProxyImageUrl = (url) => {
 // Your Analytics (from Meta Graph API)
 export const fetchMyAnalytics = async () => {
     try {
-        const response = await fetch(`${API_URL}/analytics/`);
+        const response = await fetch(withTenant('/analytics/'));
         if (!response.ok) throw new Error("Failed to fetch analytics");
         return await response.json();
     } catch (error) {
@@ -23,12 +34,21 @@ export const fetchMyAnalytics = async () => {
     }
 };
 
-// Competitors (from MongoDB - scraped by Apify)
+// Competitors (from MongoDB - scraped by Apify), every page
+const COMPETITORS_PAGE_SIZE = 200;
+
 export const fetchCompetitors = async () => {
     try {
-        const response = await fetch(`${API_URL}/competitors/`);
-        if (!response.ok) throw new Error("Failed to fetch competitors");
-        return await response.json();
+        const competitors = [];
+        let cursor = null;
+        do {
+            const after = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(withTenant(`/competitors/?limit=${COMPETITORS_PAGE_SIZE}${after}`));
+            if (!response.ok) throw new Error("Failed to fetch competitors");
+            competitors.push(...await response.json());
+            cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
+        return competitors;
     } catch (error) {
         console.error("Competitors API Error:", error);
         return [];
@@ -38,7 +58,7 @@ export const fetchCompetitors = async () => {
 // Insights (AI generated)
 export const fetchInsights = async () => {
     try {
-        const response = await fetch(`${API_URL}/insights/`);
+        const response = await fetch(withTenant('/insights/'));
         if (!response.ok) throw new Error("Failed to fetch insights");
         return await response.json();
     } catch (error) {
@@ -50,7 +70,7 @@ export const fetchInsights = async () => {
 // Generate fresh insights
 export const generateInsights = async () => {
     try {
-        const response = await fetch(`${API_URL}/insights/generate`);
+        const response = await fetch(withTenant('/insights/generate'));
         if (!response.ok) throw new Error("Failed to generate insights");
         return await response.json();
     } catch (error) {
@@ -58,3 +78,20 @@ export const generateInsights = async () => {
         return null;
     }
 };
+
+// Live updates (Server-Sent Events) - one connection, the browser reconnects on its own
+// handlers: { dashboard, analytics, competitor, insights, resync } -> (data) => void
+export const subscribeToUpdates = (handlers) => {
+    if (typeof EventSource === 'undefined') return () => {};
+    const source = new EventSource(withTenant('/stream'));
+    Object.entries(handlers).forEach(([event, handler]) => {
+        source.addEventListener(event, (e) => {
+            try {
+                handler(JSON.parse(e.data || '{}'));
+            } catch (error) {
+                console.error("Stream Event Error:", error);
+            }
+        });
+    });
+    return () => source.close();
+};